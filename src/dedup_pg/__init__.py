@@ -1,3 +1,4 @@
 from .index import DedupIndex
+from .instrumentation import Instrumentation
 
-__all__ = ["DedupIndex"]
+__all__ = ["DedupIndex", "Instrumentation"]
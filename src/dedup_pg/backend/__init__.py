@@ -1,3 +1,8 @@
-from .backend import Backend, LocalBackend
+from .backend import AsyncBackend, Backend, LocalBackend
+from .cached import CacheStats, CachedBackend, LRUCache
+from .compact import CompactBackend
+from .sharded import ShardedBackend
+from .shared import SharedMemoryBackend
+from .sqlite import SQLiteBackend
 
-__all__ = ["Backend", "LocalBackend"]
+__all__ = ["AsyncBackend", "Backend", "CacheStats", "CachedBackend", "CompactBackend", "LRUCache", "LocalBackend", "SQLiteBackend", "ShardedBackend", "SharedMemoryBackend"]
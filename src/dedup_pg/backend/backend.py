@@ -1,9 +1,123 @@
 from abc import ABC, abstractmethod
+from collections import Counter
 from collections.abc import Iterable
+from typing import TYPE_CHECKING
 from uuid import UUID, uuid4
 
+import numpy as np
+
+if TYPE_CHECKING:
+    from dedup_pg.instrumentation import Instrumentation
+
+
+def _group_batch(band_matrix: Iterable[Iterable[int]]) -> tuple[list[int], list[list[tuple[int, int]]]]:
+    """
+    Groups the items of a batch which share any band, transitively, so that near-duplicates within one batch land in
+    the same cluster.
+
+    Args:
+        band_matrix (Iterable[Iterable[int]]): One row of bands per item.
+
+    Returns:
+        tuple[list[int], list[list[tuple[int, int]]]]: The group of each item, and the unique `(band_idx, band_hash)`
+            pairs of each group ordered by item, then band index.
+    """
+    rows = np.asarray(band_matrix, dtype=np.int64).tolist()
+    parent = list(range(len(rows)))
+    owner: dict[tuple[int, int], int] = {}
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for doc, bands in enumerate(rows):
+        for pair in enumerate(bands):
+            if (other := owner.setdefault(pair, doc)) != doc:
+                a, b = find(other), find(doc)
+                parent[max(a, b)] = min(a, b)
+
+    root_groups: dict[int, int] = {}
+    doc_groups = [root_groups.setdefault(find(doc), len(root_groups)) for doc in range(len(rows))]
+    group_pairs: list[list[tuple[int, int]]] = [[] for _ in root_groups]
+
+    for pair, doc in owner.items():
+        group_pairs[doc_groups[doc]].append(pair)
+
+    return doc_groups, group_pairs
+
+
+def _rank_candidates(candidates: Iterable[UUID | None]) -> dict[UUID, int]:
+    """
+    Counts the matching bands of each candidate cluster, most matching bands first.
+    """
+    return dict(Counter(uuid for uuid in candidates if uuid is not None).most_common())
+
+
+class _UnionFind:
+    def __init__(self) -> None:
+        """
+        Disjoint sets of cluster UUIDs with union by size and path compression, so that merges and lookups cost
+        O(α(n)) amortized. Each set is labelled with its smallest UUID, so that every writer merging the same clusters
+        agrees on the canonical one regardless of the order it saw them in.
+        """
+        self._parent: dict[UUID, UUID] = {}
+        self._size: dict[UUID, int] = {}
+        self._label: dict[UUID, UUID] = {}
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def _root(self, x: UUID) -> UUID:
+        root = x
+        while (parent := self._parent.get(root, root)) != root:
+            root = parent
+
+        while x != root:
+            self._parent[x], x = root, self._parent[x]
+
+        return root
+
+    def find(self, x: UUID) -> UUID:
+        """
+        Returns the canonical UUID of the set of `x`.
+        """
+        root = self._root(x)
+        return self._label.get(root, root)
+
+    def union(self, a: UUID, b: UUID) -> UUID:
+        """
+        Merges the sets of `a` and `b`, returning the canonical UUID of the merged set.
+        """
+        root_a, root_b = self._root(a), self._root(b)
+
+        if root_a == root_b:
+            return self._label.get(root_a, root_a)
+
+        if self._size.get(root_a, 1) < self._size.get(root_b, 1):
+            root_a, root_b = root_b, root_a
+
+        label = min(self._label.pop(root_a, root_a), self._label.pop(root_b, root_b))
+        self._parent[root_b] = root_a
+        self._parent.setdefault(root_a, root_a)
+        self._size[root_a] = self._size.get(root_a, 1) + self._size.pop(root_b, 1)
+        self._label[root_a] = label
+
+        return label
+
+
+def _check_params(recorded: dict[str, int | str], params: dict[str, int | str]) -> None:
+    """
+    Refuses index parameters which differ from the ones recorded by a backend, as their bands would never match.
+    """
+    if recorded != params:
+        raise ValueError(f"Backend was built with {recorded}, which does not match the index parameters {params}")
+
 
 class Backend(ABC):
+    _instrumentation: "Instrumentation | None" = None
+
     @abstractmethod
     def insert(self, bands: Iterable[int]) -> UUID:
         ...
@@ -12,36 +126,356 @@ class Backend(ABC):
     def query(self, index: int, band: int) -> UUID | None:
         ...
 
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        """
+        Inserts a batch of items, returning the cluster UUID of each one.
+
+        Items of the batch which share any band are grouped together. Each group takes the cluster of the first
+        already-indexed band found in order of item, then band index, or a new cluster otherwise. This default falls
+        back to sequential inserts, so backends should override it to resolve the whole batch at once.
+
+        Args:
+            band_matrix (Iterable[Iterable[int]]): One row of bands per item, such as the output of
+                `DedupIndex.bands_many`.
+
+        Returns:
+            list[UUID]: The cluster ID of each item, in batch order.
+        """
+        return [self.insert(bands) for bands in np.asarray(band_matrix, dtype=np.int64).tolist()]
+
+    def _insert_many_created(self, band_matrix: Iterable[Iterable[int]]) -> tuple[list[UUID], list[bool] | None]:
+        """
+        Inserts a batch of items like `insert_many`, also returning whether the write created the cluster of each
+        item, in which case every band of the item was indexed by this write. Backends which cannot tell return None.
+        """
+        return self.insert_many(band_matrix), None
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        """
+        Finds the clusters sharing any band with an item without modifying the index.
+
+        This default falls back to one `query` per band, so backends should override it to resolve every band at
+        once.
+
+        Args:
+            bands (Iterable[int]): The bands of the item, such as the output of `DedupIndex.bands`.
+
+        Returns:
+            dict[UUID, int]: The number of matching bands of each candidate cluster, most matching bands first.
+        """
+        return _rank_candidates(self.query(index, band) for index, band in enumerate(bands))
+
+    def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        """
+        Finds the candidate clusters of a batch of items without modifying the index. This default falls back to one
+        `lookup` per item, so backends should override it to resolve the whole batch at once.
+
+        Args:
+            band_matrix (Iterable[Iterable[int]]): One row of bands per item.
+
+        Returns:
+            list[dict[UUID, int]]: The candidates of each item, as returned by `lookup`, in batch order.
+        """
+        return [self.lookup(bands) for bands in np.asarray(band_matrix, dtype=np.int64).tolist()]
+
+    def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        """
+        Returns the cluster recorded for an exact content fingerprint. Backends which do not persist fingerprints
+        always return None.
+        """
+        return None
+
+    def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        """
+        Records the cluster of an exact content fingerprint. Backends which do not persist fingerprints ignore it.
+        """
+        pass
+
+    def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        """
+        Returns the compact signatures recorded for the representatives of clusters, for the clusters which have
+        one. Backends which do not store signatures always return an empty dict.
+        """
+        return {}
+
+    def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        """
+        Records the compact signature of a representative of each cluster, keeping the first one recorded for a
+        cluster. Backends which do not store signatures ignore it.
+        """
+        pass
+
+    def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        """
+        Indexes the bands of an item which are not indexed yet under a given cluster, whatever the clusters of its
+        other bands. `DedupIndex.query` uses it to place items once signature verification rejected a candidate, so
+        backends which store signatures must implement it.
+        """
+        raise TypeError(f"{type(self).__name__} does not support signature verification")
+
+    def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        """
+        Indexes the new bands of a batch of items, each under its own given cluster. This default falls back to one
+        `insert_into` per item, so backends should override it to write the whole batch at once.
+        """
+        for bands, cluster_uuid in zip(np.asarray(band_matrix, dtype=np.int64).tolist(), cluster_uuids):
+            self.insert_into(bands, cluster_uuid)
+
+    def resolve(self, cluster_uuid: UUID) -> UUID:
+        """
+        Returns the canonical cluster a cluster was merged into, for callers holding cluster UUIDs from before a
+        merge. Backends which never merge clusters return it unchanged.
+        """
+        return cluster_uuid
+
+    def tenant(self, tenant: str) -> "Backend":
+        """
+        Returns a view of the backend scoped to one tenant, whose bands never match other tenants' bands. Backends
+        without tenant support raise a TypeError.
+        """
+        raise TypeError(f"{type(self).__name__} does not support tenants")
+
+    def _init_internal(self, num_bands: int) -> None:
+        pass
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        """
+        Records the parameters of the index using this backend, refusing an index built with different ones.
+        """
+        if (recorded := getattr(self, "_params", None)) is not None:
+            _check_params(recorded, params)
+
+        self._params = params
+
+    def _bind_instrumentation(self, instrumentation: "Instrumentation | None") -> None:
+        """
+        Sets the instrumentation the backend reports cluster assignments and, where applicable, pool waits and cache
+        lookups to.
+        """
+        self._instrumentation = instrumentation
+
+
+class AsyncBackend(ABC):
+    _instrumentation: "Instrumentation | None" = None
+
+    @abstractmethod
+    async def insert(self, bands: Iterable[int]) -> UUID:
+        ...
+
+    @abstractmethod
+    async def query(self, index: int, band: int) -> UUID | None:
+        ...
+
+    async def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        """
+        Inserts a batch of items, returning the cluster UUID of each one. See `Backend.insert_many` for details.
+        """
+        return [await self.insert(bands) for bands in np.asarray(band_matrix, dtype=np.int64).tolist()]
+
+    async def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        """
+        Finds the clusters sharing any band with an item without modifying the index. See `Backend.lookup` for
+        details.
+        """
+        return _rank_candidates([await self.query(index, band) for index, band in enumerate(bands)])
+
+    async def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        """
+        Finds the candidate clusters of a batch of items. See `Backend.lookup_many` for details.
+        """
+        return [await self.lookup(bands) for bands in np.asarray(band_matrix, dtype=np.int64).tolist()]
+
+    async def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        """
+        Returns the cluster recorded for an exact content fingerprint. See `Backend.query_fingerprint` for details.
+        """
+        return None
+
+    async def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        """
+        Records the cluster of an exact content fingerprint. See `Backend.insert_fingerprint` for details.
+        """
+        pass
+
+    async def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        """
+        Returns the compact signatures recorded for clusters. See `Backend.query_signatures` for details.
+        """
+        return {}
+
+    async def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        """
+        Records the compact signatures of clusters. See `Backend.insert_signatures` for details.
+        """
+        pass
+
+    async def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        """
+        Indexes the new bands of an item under a given cluster. See `Backend.insert_into` for details.
+        """
+        raise TypeError(f"{type(self).__name__} does not support signature verification")
+
+    async def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        """
+        Indexes the new bands of a batch of items under given clusters. See `Backend.insert_into_many` for details.
+        """
+        for bands, cluster_uuid in zip(np.asarray(band_matrix, dtype=np.int64).tolist(), cluster_uuids):
+            await self.insert_into(bands, cluster_uuid)
+
+    async def resolve(self, cluster_uuid: UUID) -> UUID:
+        """
+        Returns the canonical cluster a cluster was merged into. See `Backend.resolve` for details.
+        """
+        return cluster_uuid
+
+    def tenant(self, tenant: str) -> "AsyncBackend":
+        """
+        Returns a view of the backend scoped to one tenant. See `Backend.tenant` for details.
+        """
+        raise TypeError(f"{type(self).__name__} does not support tenants")
+
     def _init_internal(self, num_bands: int) -> None:
         pass
 
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        """
+        Records the parameters of the index using this backend, refusing an index built with different ones.
+        """
+        if (recorded := getattr(self, "_params", None)) is not None:
+            _check_params(recorded, params)
+
+        self._params = params
+
+    def _bind_instrumentation(self, instrumentation: "Instrumentation | None") -> None:
+        """
+        Sets the instrumentation the backend reports cluster assignments and, where applicable, pool waits and cache
+        lookups to.
+        """
+        self._instrumentation = instrumentation
+
 
 class LocalBackend(Backend):
-    def __init__(self) -> None:
+    def __init__(self, merge: bool = False) -> None:
         """
         A local backend as an example of how to implement the Backend class.
+
+        Args:
+            merge (bool): Whether to merge the clusters an item's bands bridge, instead of keeping the first one found.
+                Merged clusters are tracked with a union-find structure and resolved to their canonical cluster,
+                the smallest UUID, whenever they are read. `compact` rewrites stored clusters to canonical ones.
         """
         self._index: dict[tuple[int, int], UUID] = {}
+        self._signatures: dict[UUID, bytes] = {}
+        self._merge = merge
+        self._clusters = _UnionFind()
+        self._tenants: dict[str, LocalBackend] = {}
 
     def insert(self, bands: Iterable[int]) -> UUID:
-        found_uuid = None
+        # A batch of one item, so that its new bands are indexed whether or not it joins an existing cluster.
+        return self.insert_many([list(bands)])[0]
+
+    def _merge_pairs(self, pairs: list[tuple[int, int]]) -> UUID:
+        """
+        Merges every cluster the pairs are indexed under, and registers the pairs under the merged cluster.
+        """
+        found = {self._clusters.find(self._index[pair]) for pair in pairs if pair in self._index}
+        cluster_uuid = uuid4() if not found else min(found)
+
+        for other in found:
+            cluster_uuid = self._clusters.union(cluster_uuid, other)
+
+        for pair in pairs:
+            _ = self._index.setdefault(pair, cluster_uuid)
+
+        return cluster_uuid
 
-        for index, band in enumerate(bands):
-            if (query := self.query(index, band)) is not None:
-                found_uuid = query
-                break
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        return self._insert_many_created(band_matrix)[0]
 
-        if found_uuid is None:
-            found_uuid = uuid4()
-            for item in enumerate(bands):
-                self._index[item] = found_uuid
+    def _insert_many_created(self, band_matrix: Iterable[Iterable[int]]) -> tuple[list[UUID], list[bool] | None]:
+        doc_groups, group_pairs = _group_batch(band_matrix)
+        group_uuids: list[UUID] = []
+        created: list[bool] = []
+        new = 0
 
-        return found_uuid
+        for pairs in group_pairs:
+            if self._merge:
+                new += not any(pair in self._index for pair in pairs)
+                group_uuids.append(self._merge_pairs(pairs))
+                continue
+
+            found_uuid = next((self._index[pair] for pair in pairs if pair in self._index), None)
+            cluster_uuid = uuid4() if found_uuid is None else found_uuid
+            new += found_uuid is None
+            created.append(found_uuid is None)
+
+            for pair in pairs:
+                _ = self._index.setdefault(pair, cluster_uuid)
+
+            group_uuids.append(cluster_uuid)
+
+        if self._merge:
+            # Later groups may have merged the clusters of earlier ones.
+            group_uuids = [self._clusters.find(cluster_uuid) for cluster_uuid in group_uuids]
+
+        if self._instrumentation is not None:
+            self._instrumentation.on_clusters(new, len(doc_groups) - new)
+
+        doc_uuids = [group_uuids[group] for group in doc_groups]
+
+        # Merged clusters are not reported as created, as later merges may move their bands to another cluster.
+        if self._merge:
+            return doc_uuids, None
+
+        return doc_uuids, [created[group] for group in doc_groups]
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        return _rank_candidates(self.query(*item) for item in enumerate(bands))
 
     def query(self, index: int, band: int) -> UUID | None:
         item = (index, band)
 
         if item in self._index:
-            return self._index[item]
+            return self._clusters.find(self._index[item]) if self._merge else self._index[item]
 
         return None
+
+    def resolve(self, cluster_uuid: UUID) -> UUID:
+        return self._clusters.find(cluster_uuid)
+
+    def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        return {uuid: self._signatures[uuid] for uuid in cluster_uuids if uuid in self._signatures}
+
+    def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        for cluster_uuid, signature in signatures:
+            _ = self._signatures.setdefault(cluster_uuid, signature)
+
+    def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        for pair in enumerate(bands):
+            _ = self._index.setdefault(pair, cluster_uuid)
+
+    def tenant(self, tenant: str) -> "LocalBackend":
+        # Every tenant gets its own index, like a partition of a table.
+        if (view := self._tenants.get(tenant)) is None:
+            view = LocalBackend(merge=self._merge)
+            view._instrumentation = self._instrumentation
+            view = self._tenants.setdefault(tenant, view)
+
+        return view
+
+    def compact(self) -> int:
+        """
+        Rewrites the cluster of every band to its canonical cluster, so that reads no longer walk merged clusters.
+        Merges stay recorded, so `resolve` keeps mapping merged clusters to canonical ones.
+
+        Returns:
+            int: The number of bands rewritten.
+        """
+        rewritten = 0
+
+        for pair, cluster_uuid in self._index.items():
+            if (canonical := self._clusters.find(cluster_uuid)) != cluster_uuid:
+                self._index[pair] = canonical
+                rewritten += 1
+
+        return rewritten
@@ -0,0 +1,320 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from dataclasses import dataclass, replace
+from typing import Generic, TypeVar
+from uuid import UUID
+
+import numpy as np
+
+from dedup_pg.backend.backend import Backend, _group_batch
+from dedup_pg.instrumentation import Instrumentation
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters of an `LRUCache`.
+
+    Attributes:
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups which found nothing, including expired entries.
+        evictions (int): The number of entries dropped to stay within `max_entries`.
+        expirations (int): The number of entries dropped because they outlived the TTL.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, max_entries: int, ttl: float | None = None) -> None:
+        """
+        A thread-safe, bounded least-recently-used mapping with an optional time to live.
+
+        Args:
+            max_entries (int): The maximum number of entries kept before the least recently used ones are evicted.
+            ttl (float | None): The number of seconds an entry stays valid after it was stored, or None to keep
+                entries until they are evicted.
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be a positive integer")
+
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be a positive number of seconds")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> CacheStats:
+        """
+        A snapshot of the cache counters.
+        """
+        with self._lock:
+            return replace(self._stats)
+
+    def _get(self, key: K, now: float) -> V | None:
+        # Must be called with the lock held. Does not count hits or misses.
+        if (entry := self._entries.get(key)) is None:
+            return None
+
+        value, expires_at = entry
+
+        if expires_at < now:
+            del self._entries[key]
+            self._stats.expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: K) -> V | None:
+        """
+        Returns the value cached for a key, or None if there is none.
+        """
+        with self._lock:
+            value = self._get(key, time.monotonic())
+
+            if value is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+
+            return value
+
+    def find(self, keys: Iterable[K]) -> V | None:
+        """
+        Returns the value of the first cached key, counting a single hit or miss for the whole lookup.
+        """
+        with self._lock:
+            now = time.monotonic()
+            value = next((value for key in keys if (value := self._get(key, now)) is not None), None)
+
+            if value is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+
+            return value
+
+    def get_many(self, keys: Iterable[K]) -> list[V | None]:
+        """
+        Returns the value cached for every key, or None for keys which are not cached. Hits and misses are left to
+        the caller to count with `LRUCache.count`, as only it knows which lookups it served.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [self._get(key, now) for key in keys]
+
+    def count(self, hits: int, misses: int) -> None:
+        """
+        Counts lookups made with `LRUCache.get_many`.
+        """
+        with self._lock:
+            self._stats.hits += hits
+            self._stats.misses += misses
+
+    def _put_many(self, items: Iterable[tuple[K, V]], now: float) -> None:
+        # Must be called with the lock held.
+        expires_at = float("inf") if self.ttl is None else now + self.ttl
+
+        for key, value in items:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            _ = self._entries.popitem(last=False)
+            self._stats.evictions += 1
+
+    def put_many(self, items: Iterable[tuple[K, V]]) -> None:
+        """
+        Stores many entries at once, evicting the least recently used ones beyond `max_entries`.
+        """
+        with self._lock:
+            self._put_many(items, time.monotonic())
+
+    def add_many(self, items: Iterable[tuple[K, V]]) -> None:
+        """
+        Stores many entries at once like `LRUCache.put_many`, but keeps the value of keys which are already cached.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._put_many([(key, value) for key, value in items if self._get(key, now) is None], now)
+
+    def put(self, key: K, value: V) -> None:
+        """
+        Stores one entry. See `LRUCache.put_many` for details.
+        """
+        self.put_many([(key, value)])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedBackend(Backend):
+    def __init__(self, inner: Backend, max_entries: int = 1_000_000, ttl: float | None = None) -> None:
+        """
+        Wraps any backend with a bounded in-process cache of band to cluster mappings, so that hot bands such as
+        boilerplate do not hit the inner backend over and over. It is safe to share between threads.
+
+        Items with any cached band take the cluster of their first cached band. Items whose bands are all cached are
+        not written at all, and the other bands of partly cached items are written through with `insert_into`, where
+        the inner backend supports it. Other items are inserted into the inner backend, and the cache is filled from
+        what the write returns, without probing the inner backend again: every band of an item the write created a
+        cluster for, and only the first band of other items, which the inner backend either indexed under the
+        item's cluster or took the cluster from. As other processes may write to a shared inner backend, a `ttl`
+        bounds how long a cached mapping is trusted. Read-only `lookup` calls always go to the inner backend.
+
+        Args:
+            inner (Backend): The backend to cache.
+            max_entries (int): The maximum number of cached `(band_idx, band_hash)` pairs.
+            ttl (float | None): The number of seconds a cached pair stays valid, or None to keep it until evicted.
+        """
+        self.inner = inner
+        self.cache: LRUCache[tuple[int, int], UUID] = LRUCache(max_entries, ttl)
+        self._tenants: dict[str, CachedBackend] = {}
+
+    @property
+    def stats(self) -> CacheStats:
+        """
+        A snapshot of the hit, miss and eviction counters of the cache.
+        """
+        return self.cache.stats
+
+    @property
+    def _writes_into(self) -> bool:
+        return type(self.inner).insert_into is not Backend.insert_into
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        return self.insert_many([list(bands)])[0]
+
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        rows = np.asarray(band_matrix, dtype=np.int64)
+        doc_groups, group_pairs = _group_batch(rows)
+        group_uuids: dict[int, UUID] = {}
+        cached: set[int] = set()
+
+        writes_into = self._writes_into
+
+        for group, pairs in enumerate(group_pairs):
+            values = self.cache.get_many(pairs)
+
+            if (cluster_uuid := next((value for value in values if value is not None), None)) is None:
+                continue
+
+            if all(value is not None for value in values):
+                cached.add(group)
+
+            # Partly cached groups are inserted as misses when the inner backend cannot write them through.
+            if writes_into or group in cached:
+                group_uuids[group] = cluster_uuid
+
+        written = [doc for doc, group in enumerate(doc_groups) if group in group_uuids and group not in cached]
+        missed = [doc for doc, group in enumerate(doc_groups) if group not in group_uuids]
+        self.cache.count(len(group_uuids), len(group_pairs) - len(group_uuids))
+
+        if self._instrumentation is not None:
+            # The inner backend reports the clusters of the missed items itself.
+            self._instrumentation.on_cache("bands", len(group_uuids), len(group_pairs) - len(group_uuids))
+            self._instrumentation.on_clusters(0, len(doc_groups) - len(missed))
+
+        if written:
+            self.inner.insert_into_many(rows[written], [group_uuids[doc_groups[doc]] for doc in written])
+
+        if missed:
+            cluster_uuids, created = self.inner._insert_many_created(rows[missed])
+            missed_groups: dict[int, bool] = {}
+
+            for i, (doc, cluster_uuid) in enumerate(zip(missed, cluster_uuids)):
+                group_uuids[doc_groups[doc]] = cluster_uuid
+                missed_groups[doc_groups[doc]] = created is not None and created[i]
+
+            # Pairs of a group are in order of item then band index, so the first one is the first band of its first
+            # item, which the inner backend holds under the group's cluster whether or not it created the cluster.
+            self.cache.add_many(
+                (pair, group_uuids[group])
+                for group, is_created in missed_groups.items()
+                for pair in (group_pairs[group] if is_created else group_pairs[group][:1])
+            )
+
+        return [group_uuids[group] for group in doc_groups]
+
+    def query(self, index: int, band: int) -> UUID | None:
+        pair = (index, int(band))
+        cluster_uuid = self.cache.get(pair)
+
+        if self._instrumentation is not None:
+            self._instrumentation.on_cache("bands", int(cluster_uuid is not None), int(cluster_uuid is None))
+
+        if cluster_uuid is not None:
+            return cluster_uuid
+
+        if (cluster_uuid := self.inner.query(index, band)) is not None:
+            self.cache.put(pair, cluster_uuid)
+
+        return cluster_uuid
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        return self.inner.lookup(bands)
+
+    def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        return self.inner.lookup_many(band_matrix)
+
+    def resolve(self, cluster_uuid: UUID) -> UUID:
+        return self.inner.resolve(cluster_uuid)
+
+    def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        return self.inner.query_fingerprint(fingerprint)
+
+    def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        self.inner.insert_fingerprint(fingerprint, cluster_uuid)
+
+    def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        return self.inner.query_signatures(cluster_uuids)
+
+    def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        self.inner.insert_signatures(signatures)
+
+    def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        # Bands which were already indexed keep their cluster, so cached mappings stay valid.
+        self.inner.insert_into(bands, cluster_uuid)
+
+    def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        self.inner.insert_into_many(band_matrix, cluster_uuids)
+
+    def tenant(self, tenant: str) -> "CachedBackend":
+        # Tenants get their own cache of the same size, as the same band maps to different clusters per tenant.
+        if (view := self._tenants.get(tenant)) is None:
+            view = CachedBackend(self.inner.tenant(tenant), self.cache.max_entries, self.cache.ttl)
+            view._instrumentation = self._instrumentation
+            view = self._tenants.setdefault(tenant, view)
+
+        return view
+
+    def _init_internal(self, num_bands: int) -> None:
+        self.inner._init_internal(num_bands)
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        self.inner._bind_params(params)
+
+    def _bind_instrumentation(self, instrumentation: Instrumentation | None) -> None:
+        self._instrumentation = instrumentation
+        self.inner._bind_instrumentation(instrumentation)
@@ -0,0 +1,453 @@
+import os
+import struct
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from uuid import UUID
+
+import numpy as np
+
+from dedup_pg.backend.backend import Backend, _rank_candidates
+from dedup_pg.helpers import _mix64
+
+EMPTY = -1 # value of an empty slot
+MAX_LOAD = 0.75 # fraction of occupied slots which triggers growth
+MAX_KEY = (1 << 64) - 1 # band hashes are stored as their uint64 two's complement
+SCALAR_TAIL = 64 # keys still probing once vectorized rounds stop paying for their overhead
+
+# Snapshot header: magic, format version, num_perms, rows, num_bands, capacity, clusters, items, seed, signature.
+SNAPSHOT_MAGIC = b"DEDUPPG\0"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIIIQQQQ16s")
+SNAPSHOT_ALIGN = 64 # byte alignment of every array in a snapshot
+
+
+class _BandTables:
+    def __init__(self, num_bands: int, capacity: int) -> None:
+        """
+        One open-addressing hash table with linear probing per band, from uint64 band hashes to int32 cluster ids.
+        The tables share a capacity and are stored as the rows of two `(num_bands, capacity)` NumPy arrays, so that
+        every operation probes all bands of a batch at once.
+        """
+        capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.keys = np.zeros((num_bands, capacity), dtype=np.uint64)
+        self.values = np.full((num_bands, capacity), EMPTY, dtype=np.int32)
+        self.sizes = np.zeros(num_bands, dtype=np.uint64)
+
+    @property
+    def num_bands(self) -> int:
+        return self.keys.shape[0]
+
+    @property
+    def capacity(self) -> int:
+        return self.keys.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.values.nbytes
+
+    def _slots(self, bands: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        # Flat slot of each key in the table of its band
+        local = (_mix64(keys) & np.uint64(self.capacity - 1)).astype(np.intp)
+        return bands * self.capacity + local
+
+    def _next(self, slots: np.ndarray) -> np.ndarray:
+        # Linear probing wraps around within the table of the band
+        return (slots & ~(self.capacity - 1)) | ((slots + 1) & (self.capacity - 1))
+
+    def get(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Returns the value of every key of a `(n, num_bands)` matrix of keys, or `EMPTY` for keys which are not in the
+        table of their band.
+        """
+        flat = keys.reshape(-1)
+        table_keys, table_values = self.keys.reshape(-1), self.values.reshape(-1)
+        result = np.full(len(flat), EMPTY, dtype=np.int32)
+        pending = np.arange(len(flat))
+        slots = self._slots(pending % self.num_bands, flat)
+
+        while len(pending) > SCALAR_TAIL:
+            values = table_values[slots]
+            found = (values != EMPTY) & (table_keys[slots] == flat[pending])
+            result[pending[found]] = values[found]
+
+            probing = (values != EMPTY) & ~found
+            pending, slots = pending[probing], self._next(slots[probing])
+
+        # The few keys in long probe sequences are finished one by one.
+        mask = self.capacity - 1
+
+        for i, slot in zip(pending.tolist(), slots.tolist()):
+            key, base = flat[i], slot & ~mask
+
+            while (value := table_values[slot]) != EMPTY:
+                if table_keys[slot] == key:
+                    result[i] = value
+                    break
+
+                slot = base | ((slot + 1) & mask)
+
+        return result.reshape(keys.shape)
+
+    def get_band(self, band: int, key: int) -> int:
+        """
+        Returns the value of a single key in the table of a band, or `EMPTY` if it is not there.
+        """
+        mask = self.capacity - 1
+        slot = int(_mix64(np.array([key], dtype=np.uint64))[0]) & mask
+
+        while (value := int(self.values[band, slot])) != EMPTY:
+            if self.keys[band, slot] == key:
+                return value
+
+            slot = (slot + 1) & mask
+
+        return EMPTY
+
+    def setdefault(self, keys: np.ndarray, values: np.ndarray) -> None:
+        """
+        Inserts every key of a `(n, num_bands)` matrix which is not in the table of its band yet, with the value of
+        its row. The first row wins for keys repeated within a band.
+        """
+        first = np.ones(keys.shape, dtype=bool)
+
+        if len(keys) > 1:
+            order = np.argsort(keys, axis=0, kind="stable")
+            ordered = np.take_along_axis(keys, order, axis=0)
+            ordered_first = np.ones(keys.shape, dtype=bool)
+            ordered_first[1:] = ordered[1:] != ordered[:-1]
+            np.put_along_axis(first, order, ordered_first, axis=0)
+
+        docs, bands = np.nonzero(first & (self.get(keys) == EMPTY))
+        added = np.bincount(bands, minlength=self.num_bands)
+
+        if (size := int((self.sizes + added).max(initial=0))) > MAX_LOAD * self.capacity:
+            self._grow(size)
+
+        self._place(bands, keys[docs, bands], values[docs])
+        self.sizes = self.sizes + added.astype(np.uint64)
+
+    def _place(self, bands: np.ndarray, keys: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes keys which are known to be absent and unique within their band.
+        """
+        table_keys, table_values = self.keys.reshape(-1), self.values.reshape(-1)
+        slots = self._slots(bands, keys)
+        pending = np.arange(len(keys))
+
+        # Absent keys probe past occupied slots. When several keys reach the same empty slot, one takes it and the
+        # others probe on from there in the next round.
+        while len(pending) > SCALAR_TAIL:
+            empty = table_values[slots] == EMPTY
+            _, winners = np.unique(slots[empty], return_index=True)
+            placed = np.flatnonzero(empty)[winners]
+
+            table_keys[slots[placed]] = keys[pending[placed]]
+            table_values[slots[placed]] = values[pending[placed]]
+
+            waiting = np.ones(len(pending), dtype=bool)
+            waiting[placed] = False
+            probing = ~empty[waiting]
+            pending, slots = pending[waiting], slots[waiting]
+            slots[probing] = self._next(slots[probing])
+
+        mask = self.capacity - 1
+
+        for i, slot in zip(pending.tolist(), slots.tolist()):
+            while table_values[slot] != EMPTY:
+                slot = (slot & ~mask) | ((slot + 1) & mask)
+
+            table_keys[slot] = keys[i]
+            table_values[slot] = values[i]
+
+    @classmethod
+    def from_arrays(cls, keys: np.ndarray, values: np.ndarray, sizes: np.ndarray) -> "_BandTables":
+        tables = cls.__new__(cls)
+        tables.keys, tables.values, tables.sizes = keys, values, sizes
+        return tables
+
+    def _grow(self, size: int) -> None:
+        bands, local = np.nonzero(self.values != EMPTY)
+        keys, values = self.keys[bands, local], self.values[bands, local]
+        capacity = self.capacity
+
+        while size > MAX_LOAD * capacity:
+            capacity *= 2
+
+        self.keys = np.zeros((self.num_bands, capacity), dtype=np.uint64)
+        self.values = np.full((self.num_bands, capacity), EMPTY, dtype=np.int32)
+        self._place(bands, keys, values)
+
+
+def _label_components(rows: np.ndarray) -> np.ndarray:
+    """
+    Labels every item of a batch with the lowest item sharing any band with it, transitively, by propagating minimum
+    labels through shared bands until they settle.
+    """
+    n_docs = len(rows)
+    labels = np.arange(n_docs)
+
+    if n_docs <= 1:
+        return labels
+
+    inverses = [np.unique(column, return_inverse=True)[1] for column in rows.T]
+
+    while True:
+        previous = labels
+
+        for inverse in inverses:
+            minimums = np.full(inverse.max() + 1, n_docs)
+            np.minimum.at(minimums, inverse, labels)
+            labels = minimums[inverse]
+            labels = labels[labels] # labels always point at an item of the same component
+
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def _assign_clusters(
+    rows: np.ndarray, found: np.ndarray, new_clusters: Callable[[int], np.ndarray]
+) -> tuple[np.ndarray, int]:
+    """
+    Assigns a cluster id to every item of a batch, given the cluster ids `found` for its bands. Items sharing any
+    band are grouped, and each group takes the cluster of its first already-indexed band, in order of item then band
+    index, or a new cluster allocated by `new_clusters`.
+
+    Returns:
+        tuple[np.ndarray, int]: The cluster id of every item, and the number of new clusters.
+    """
+    n_docs = len(rows)
+    labels = _label_components(rows)
+
+    has_found = (found != EMPTY).any(axis=1)
+    first_band = np.argmax(found != EMPTY, axis=1)
+    doc_clusters = found[np.arange(n_docs), first_band]
+
+    clusters = np.full(n_docs, EMPTY, dtype=np.int32)
+    docs = np.flatnonzero(has_found)
+    groups, first = np.unique(labels[docs], return_index=True)
+    clusters[groups] = doc_clusters[docs[first]]
+
+    roots = np.flatnonzero(labels == np.arange(n_docs))
+    new_roots = roots[clusters[roots] == EMPTY]
+    clusters[new_roots] = new_clusters(len(new_roots))
+
+    return clusters[labels], len(new_roots)
+
+
+def _random_uuids(count: int) -> np.ndarray:
+    """
+    Generates `count` random version 4 UUIDs as rows of 16 bytes.
+    """
+    uuids = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    uuids[:, 6] = (uuids[:, 6] & 0x0F) | 0x40
+    uuids[:, 8] = (uuids[:, 8] & 0x3F) | 0x80
+    return uuids
+
+
+class CompactBackend(Backend):
+    def __init__(self, capacity: int = 1024) -> None:
+        """
+        A memory-efficient in-memory backend for large local deduplication jobs.
+
+        Each band has its own open-addressing hash table from the uint64 band hash to an int32 cluster id, stored in
+        flat NumPy arrays which grow by doubling. Cluster UUIDs live once in a side array indexed by cluster id. This
+        uses a few dozen bytes per band instead of the hundreds a `LocalBackend` dict entry costs. See `nbytes` and
+        `bytes_per_item`.
+
+        Args:
+            capacity (int): The initial number of slots per band table.
+        """
+        self._capacity = capacity
+        self._params: dict[str, int | str] | None = None
+        self._tables: _BandTables | None = None
+        self._uuids = np.empty((0, 16), dtype=np.uint8)
+        self._num_clusters = 0
+        self._num_items = 0
+
+    def _init_internal(self, num_bands: int) -> None:
+        if self._tables is None:
+            self._tables = _BandTables(num_bands, self._capacity)
+        elif self._tables.num_bands != num_bands:
+            raise ValueError(f"CompactBackend holds {self._tables.num_bands} bands, but the index uses {num_bands}")
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The number of bytes held by the band tables and the cluster UUIDs.
+        """
+        return (0 if self._tables is None else self._tables.nbytes) + self._num_clusters * 16
+
+    @property
+    def bytes_per_item(self) -> float:
+        """
+        The number of bytes held per indexed item.
+        """
+        return self.nbytes / self._num_items if self._num_items else 0.0
+
+    def __len__(self) -> int:
+        return self._num_items
+
+    def _uuid(self, cluster_id: int) -> UUID:
+        return UUID(bytes=self._uuids[cluster_id].tobytes())
+
+    def _new_clusters(self, count: int) -> np.ndarray:
+        """
+        Allocates `count` new cluster ids with random UUIDs, growing the UUID side array by doubling.
+        """
+        start = self._num_clusters
+        end = start + count
+
+        if end >= 2 ** 31:
+            raise OverflowError("CompactBackend supports at most 2**31 - 1 clusters")
+
+        if end > len(self._uuids):
+            uuids = np.empty((max(end, 2 * len(self._uuids), 1024), 16), dtype=np.uint8)
+            uuids[:start] = self._uuids[:start]
+            self._uuids = uuids
+
+        self._uuids[start:end] = _random_uuids(count)
+        self._num_clusters = end
+
+        return np.arange(start, end, dtype=np.int32)
+
+    @property
+    def _band_tables(self) -> _BandTables:
+        if self._tables is None:
+            raise RuntimeError("CompactBackend must be used through an DedupIndex.")
+
+        return self._tables
+
+    def _rows(self, band_matrix: Iterable[Iterable[int]]) -> np.ndarray:
+        rows = np.asarray(band_matrix, dtype=np.int64).reshape(-1, self._band_tables.num_bands)
+        return rows.view(np.uint64)
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        return self.insert_many([list(bands)])[0]
+
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        rows = self._rows(band_matrix)
+        n_docs = len(rows)
+
+        if n_docs == 0:
+            return []
+
+        clusters, new = _assign_clusters(rows, self._band_tables.get(rows), self._new_clusters)
+
+        if self._instrumentation is not None:
+            self._instrumentation.on_clusters(new, n_docs - new)
+
+        self._band_tables.setdefault(rows, clusters)
+        self._num_items += n_docs
+        uuids = self._uuids[clusters]
+
+        return [UUID(bytes=uuid.tobytes()) for uuid in uuids]
+
+    def query(self, index: int, band: int) -> UUID | None:
+        cluster_id = self._band_tables.get_band(index, int(band) & MAX_KEY)
+        return None if cluster_id == EMPTY else self._uuid(cluster_id)
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        found = self._band_tables.get(self._rows([list(bands)]))[0]
+        return _rank_candidates(self._uuid(cluster_id) for cluster_id in found if cluster_id != EMPTY)
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """
+        Writes a snapshot of the backend, which `CompactBackend.load` maps back into memory without parsing it.
+
+        The snapshot starts with a versioned header holding the parameters of the index the backend is attached to,
+        followed by the band tables and the cluster UUIDs as contiguous, aligned arrays.
+
+        Args:
+            path (str | os.PathLike[str]): The file to write, which is replaced if it exists.
+        """
+        if self._params is None:
+            raise ValueError("CompactBackend has no index parameters to save, attach it to a DedupIndex first")
+
+        tables = self._band_tables
+        signature = str(self._params["signature"]).encode("ascii")
+
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            int(self._params["num_perms"]),
+            int(self._params["rows"]),
+            tables.num_bands,
+            tables.capacity,
+            self._num_clusters,
+            self._num_items,
+            int(self._params["seed"]),
+            signature,
+        )
+        arrays = (tables.keys, tables.values, tables.sizes, self._uuids[:self._num_clusters])
+        tmp_path = Path(f"{os.fspath(path)}.tmp")
+
+        with tmp_path.open("wb") as file:
+            _ = file.write(header)
+
+            for array in arrays:
+                _ = file.write(bytes(-file.tell() % SNAPSHOT_ALIGN))
+                _ = file.write(np.ascontiguousarray(array).data)
+
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str], mmap: bool = True) -> "CompactBackend":
+        """
+        Loads a snapshot written by `CompactBackend.save`. The backend refuses to be attached to a `DedupIndex` whose
+        parameters differ from the ones recorded in the snapshot.
+
+        Args:
+            path (str | os.PathLike[str]): The snapshot file.
+            mmap (bool): Whether to map the snapshot into memory instead of reading it, which makes loading
+                instant and lets processes loading the same snapshot share the page cache. Mapped arrays are
+                copy-on-write, so new items are only ever written to process memory, never to the file.
+
+        Returns:
+            CompactBackend: The loaded backend.
+        """
+        with open(path, "rb") as file:
+            header = file.read(SNAPSHOT_HEADER.size)
+
+        if len(header) < SNAPSHOT_HEADER.size or header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a CompactBackend snapshot")
+
+        (
+            _, version, num_perms, rows, num_bands, capacity, num_clusters, num_items, seed, signature,
+        ) = SNAPSHOT_HEADER.unpack(header)
+
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}, expected {SNAPSHOT_VERSION}")
+
+        layout = (
+            (np.uint64, (num_bands, capacity)),
+            (np.int32, (num_bands, capacity)),
+            (np.uint64, (num_bands,)),
+            (np.uint8, (num_clusters, 16)),
+        )
+        arrays: list[np.ndarray] = []
+        offset = SNAPSHOT_HEADER.size
+
+        for dtype, shape in layout:
+            offset += -offset % SNAPSHOT_ALIGN
+
+            if mmap and np.prod(shape) > 0:
+                array = np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape)
+            else:
+                array = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+            arrays.append(array)
+            offset += array.nbytes
+
+        backend = cls()
+        backend._tables = _BandTables.from_arrays(*arrays[:3])
+        backend._uuids = arrays[3]
+        backend._num_clusters = num_clusters
+        backend._num_items = num_items
+        backend._params = {
+            "num_perms": num_perms,
+            "rows": rows,
+            "signature": signature.rstrip(b"\0").decode("ascii"),
+            "seed": seed,
+        }
+
+        return backend
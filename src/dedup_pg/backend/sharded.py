@@ -0,0 +1,196 @@
+from collections import Counter
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from dedup_pg.backend.backend import Backend, _group_batch
+from dedup_pg.instrumentation import Instrumentation
+
+A = TypeVar("A")
+T = TypeVar("T")
+
+
+class ShardedBackend(Backend):
+    def __init__(
+        self, shards: Sequence[Backend], max_workers: int | None = None, executor: ThreadPoolExecutor | None = None
+    ) -> None:
+        """
+        Spreads the index over several backends, such as `SQLAlchemyBackend`s on different Postgres primaries, so
+        that write throughput scales with the number of nodes.
+
+        Every `(band_idx, band_hash)` pair is owned by one shard, chosen by its band index: shard `s` of `n` owns
+        bands `s, s + n, s + 2n, ...`, which it indexes as a shorter band vector of its own. Shards are probed and
+        written in parallel from a thread pool, with one `lookup_many` and one `insert_into_many` per shard and
+        batch, so that an insert costs the round trips of the slowest shard rather than of all of them.
+
+        As the bands of an item span shards, clusters are assigned in two steps. The shards first look up the bands
+        they own, and the item takes the cluster sharing the most bands with it across all shards, the smallest UUID
+        on ties, or a new cluster. Every shard then indexes its new bands under that cluster, so that no shard picks
+        a cluster on its own. As with the default write mode of the SQLAlchemy backends, two similar items inserted
+        concurrently may get different clusters. Shards must support `insert_into`.
+
+        Args:
+            shards (Sequence[Backend]): The backends holding the bands. The order of shards is part of the layout of
+                the index, and each shard refuses to be used at another position.
+            max_workers (int | None): The number of threads probing shards. Defaults to one per shard.
+            executor (ThreadPoolExecutor | None): A pool to probe shards in, such as one shared by several backends,
+                which `close` leaves running. Defaults to a pool of `max_workers` threads owned by the backend.
+        """
+        if not shards:
+            raise ValueError("ShardedBackend needs at least one shard")
+
+        self.shards = list(shards)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers or len(self.shards), thread_name_prefix="dedup_pg_shard"
+        )
+        self._columns: list[np.ndarray] = []
+        self._tenants: dict[str, ShardedBackend] = {}
+
+    def close(self) -> None:
+        """
+        Stops the threads probing shards, unless the pool was given to the backend. Shards are left open.
+        """
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    def _each(self, func: Callable[[Backend, A], T], args: Sequence[A]) -> list[T]:
+        """
+        Calls `func` with every shard and its argument, in parallel, returning the results in shard order.
+        """
+        if len(self.shards) == 1:
+            return [func(self.shards[0], args[0])]
+
+        return list(self._executor.map(func, self.shards, args))
+
+    def _rows(self, band_matrix: Iterable[Iterable[int]]) -> np.ndarray:
+        if not self._columns:
+            raise RuntimeError("ShardedBackend must be used through an DedupIndex.")
+
+        return np.asarray(band_matrix, dtype=np.int64).reshape(-1, sum(len(columns) for columns in self._columns))
+
+    def _candidates(self, rows: np.ndarray) -> list[Counter[UUID]]:
+        """
+        Counts the bands each item shares with every cluster, over all shards.
+        """
+        found = self._each(lambda shard, columns: shard.lookup_many(rows[:, columns]), self._columns)
+        totals: list[Counter[UUID]] = [Counter() for _ in range(len(rows))]
+
+        for shard_found in found:
+            for total, candidates in zip(totals, shard_found):
+                total.update(candidates)
+
+        return totals
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        return self.insert_many([list(bands)])[0]
+
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        rows = self._rows(band_matrix)
+
+        if len(rows) == 0:
+            return []
+
+        # Items sharing any band are grouped, and a group takes its cluster from the bands of all of its items.
+        doc_groups, group_pairs = _group_batch(rows)
+        group_totals: list[Counter[UUID]] = [Counter() for _ in group_pairs]
+
+        for group, total in zip(doc_groups, self._candidates(rows)):
+            group_totals[group].update(total)
+
+        group_uuids = [
+            min(total, key=lambda uuid: (-total[uuid], uuid)) if total else uuid4() for total in group_totals
+        ]
+        doc_uuids = [group_uuids[group] for group in doc_groups]
+
+        _ = self._each(lambda shard, columns: shard.insert_into_many(rows[:, columns], doc_uuids), self._columns)
+
+        if self._instrumentation is not None:
+            new = sum(not total for total in group_totals)
+            self._instrumentation.on_clusters(new, len(doc_groups) - new)
+
+        return doc_uuids
+
+    def query(self, index: int, band: int) -> UUID | None:
+        # Band `index` is the band `index // n` of shard `index % n`.
+        return self.shards[index % len(self.shards)].query(index // len(self.shards), band)
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        return self.lookup_many([list(bands)])[0]
+
+    def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        return [dict(total.most_common()) for total in self._candidates(self._rows(band_matrix))]
+
+    def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        self.insert_into_many([list(bands)], [cluster_uuid])
+
+    def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        rows, cluster_uuids = self._rows(band_matrix), list(cluster_uuids)
+        _ = self._each(lambda shard, columns: shard.insert_into_many(rows[:, columns], cluster_uuids), self._columns)
+
+    def _position(self, key: bytes) -> int:
+        # Clusters and fingerprints are spread over shards by their leading bytes, which are random.
+        return int.from_bytes(key[:8], "little") % len(self.shards)
+
+    def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        return self.shards[self._position(fingerprint)].query_fingerprint(fingerprint)
+
+    def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        self.shards[self._position(fingerprint)].insert_fingerprint(fingerprint, cluster_uuid)
+
+    def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        owned: list[list[UUID]] = [[] for _ in self.shards]
+
+        for cluster_uuid in cluster_uuids:
+            owned[self._position(cluster_uuid.bytes)].append(cluster_uuid)
+
+        signatures: dict[UUID, bytes] = {}
+
+        for found in self._each(lambda shard, uuids: shard.query_signatures(uuids) if uuids else {}, owned):
+            signatures.update(found)
+
+        return signatures
+
+    def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        owned: list[list[tuple[UUID, bytes]]] = [[] for _ in self.shards]
+
+        for cluster_uuid, signature in signatures:
+            owned[self._position(cluster_uuid.bytes)].append((cluster_uuid, signature))
+
+        _ = self._each(lambda shard, records: shard.insert_signatures(records) if records else None, owned)
+
+    def tenant(self, tenant: str) -> "ShardedBackend":
+        # Every shard holds its own part of the tenant's bands. Views share the pool, which `close` stops for all.
+        if (view := self._tenants.get(tenant)) is None:
+            view = ShardedBackend([shard.tenant(tenant) for shard in self.shards], executor=self._executor)
+            view._columns = self._columns
+            view._instrumentation = self._instrumentation
+            view = self._tenants.setdefault(tenant, view)
+
+        return view
+
+    def _init_internal(self, num_bands: int) -> None:
+        if num_bands < len(self.shards):
+            raise ValueError(f"ShardedBackend needs at least as many bands as its {len(self.shards)} shards")
+
+        self._columns = [np.arange(shard, num_bands, len(self.shards)) for shard in range(len(self.shards))]
+
+        for shard, columns in zip(self.shards, self._columns):
+            shard._init_internal(len(columns))
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        # Shards record their position, so that a shard is never used for another shard's bands.
+        for position, shard in enumerate(self.shards):
+            shard._bind_params({**params, "shard": f"{position}/{len(self.shards)}"})
+
+        self._params = params
+
+    def _bind_instrumentation(self, instrumentation: Instrumentation | None) -> None:
+        # Shards report pool waits, while cluster assignments are reported once for the whole index.
+        self._instrumentation = instrumentation
+
+        for shard in self.shards:
+            shard._bind_instrumentation(instrumentation)
@@ -0,0 +1,361 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from dedup_pg.backend.backend import Backend, _check_params, _rank_candidates
+from dedup_pg.backend.compact import EMPTY, MAX_KEY, _assign_clusters, _BandTables, _random_uuids
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    fcntl = None
+
+# Segment header: magic, format version, num_bands, stripes, capacity. Followed by the counters, the parameters of the
+# index as JSON, then the band table sizes, keys and values, and the cluster UUIDs.
+SEGMENT_MAGIC = b"DEDUPSHM"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<8sIIIxxxxQ")
+SEGMENT_PARAMS = 256 # bytes reserved for the index parameters
+SEGMENT_ALIGN = 64 # byte alignment of every array in a segment
+
+META_LOCK = 0 # lock file byte guarding the header, the counters and the cluster UUIDs, followed by one per stripe
+
+
+class _LockFile:
+    def __init__(self, name: str) -> None:
+        """
+        The lock file of a segment, shared by every backend of this process attached to it. POSIX locks are held by
+        the process rather than by the file descriptor, so backends of one process would not exclude each other, and
+        closing any descriptor of the file would release the locks of all of them. Backends of one process therefore
+        take turns on `lock` before taking the file locks, and the file is closed with the last of them.
+        """
+        self.fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT)
+        self.lock = threading.Lock()
+        self.refs = 0
+
+
+_lock_files: dict[str, _LockFile] = {}
+_lock_files_lock = threading.Lock()
+
+
+def _open_lock_file(name: str) -> _LockFile:
+    with _lock_files_lock:
+        if (lock_file := _lock_files.get(name)) is None:
+            lock_file = _lock_files[name] = _LockFile(name)
+
+        lock_file.refs += 1
+        return lock_file
+
+
+def _close_lock_file(name: str) -> None:
+    with _lock_files_lock:
+        lock_file = _lock_files[name]
+        lock_file.refs -= 1
+
+        if lock_file.refs == 0:
+            os.close(lock_file.fd)
+            del _lock_files[name]
+
+
+class _FixedBandTables(_BandTables):
+    """
+    Band tables over memory which cannot be reallocated, which refuse to grow past their capacity.
+    """
+    def _grow(self, size: int) -> None:
+        raise RuntimeError(
+            f"SharedMemoryBackend is full, a band would hold {size} of {self.capacity} slots. Create the segment "
+            "with a larger capacity."
+        )
+
+
+def _layout(num_bands: int, capacity: int) -> tuple[list[tuple[int, type, tuple[int, ...]]], int]:
+    """
+    The offset, dtype and shape of the counters, parameters, sizes, keys, values and cluster UUIDs of a segment, and
+    the size of the segment.
+    """
+    shapes = (
+        (np.uint64, (2,)),
+        (np.uint8, (SEGMENT_PARAMS,)),
+        (np.uint64, (num_bands,)),
+        (np.uint64, (num_bands, capacity)),
+        (np.int32, (num_bands, capacity)),
+        (np.uint8, (capacity, 16)),
+    )
+    layout = []
+    offset = SEGMENT_HEADER.size
+
+    for dtype, shape in shapes:
+        offset += -offset % SEGMENT_ALIGN
+        layout.append((offset, dtype, shape))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    return layout, offset
+
+
+class SharedMemoryBackend(Backend):
+    def __init__(self, name: str | None = None, capacity: int = 1 << 16, stripes: int = 4) -> None:
+        """
+        An in-memory backend shared by every process of a host, such as the workers of a `gunicorn` or
+        `multiprocessing` pool, so that they see each other's clusters at memory speed without a database.
+
+        The band tables are open-addressing hash tables from uint64 band hashes to int32 cluster ids, as in
+        `CompactBackend`, stored in a named `multiprocessing.shared_memory` segment which any process attaches to by
+        creating a backend with the same name. The segment is created by the first backend attached to a
+        `DedupIndex`, and lives until `unlink` is called, even once every process has exited.
+
+        Bands are split into `stripes` contiguous ranges, each guarded by a byte-range lock of a lock file next to
+        the segment. Lookups share the locks, and inserts take each stripe exclusively in turn, so that writers only
+        wait for each other band range by band range. Backends of one process attached to the same segment share its
+        lock file, and take turns on a lock of their own. As with the default write mode of the SQLAlchemy backends, two
+        similar items inserted concurrently by different processes may get different clusters.
+
+        The segment has a fixed capacity, which is the number of slots of every band table. Inserts raise a
+        `RuntimeError` once a band would hold more than 75% of its slots.
+
+        Args:
+            name (str | None): The name of the segment. Backends of any process created with the same name share it.
+                Defaults to a random name, see `name`.
+            capacity (int): The number of slots per band table of a new segment, rounded up to a power of two.
+                Ignored when attaching to an existing segment.
+            stripes (int): The number of lock stripes of a new segment. Ignored when attaching to an existing segment.
+        """
+        if fcntl is None:
+            raise ImportError("SharedMemoryBackend requires POSIX file locks, which are not available on this platform")
+
+        if capacity <= 0 or stripes <= 0:
+            raise ValueError("capacity and stripes must be positive integers")
+
+        self.name = name or f"dedup_pg_{uuid4().hex[:16]}"
+        self._capacity = 1 << max(capacity - 1, 1).bit_length()
+        self._stripes = stripes
+        self._lock_file: _LockFile | None = _open_lock_file(self.name)
+        self._lock = self._lock_file.lock
+        self._shm: SharedMemory | None = None
+        self._tables: _FixedBandTables | None = None
+        self._params: dict[str, int | str] | None = None
+
+    @contextmanager
+    def _locked(self, start: int, length: int, exclusive: bool) -> Iterator[None]:
+        """
+        Holds the byte-range lock of `length` lock bytes from `start`. Locks are held by the process, so threads and
+        the other backends of the process attached to the segment take turns on the lock file's own lock first.
+        """
+        assert fcntl is not None and self._lock_file is not None
+        fcntl.lockf(self._lock_file.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, length, start)
+
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_file.fd, fcntl.LOCK_UN, length, start)
+
+    def _init_internal(self, num_bands: int) -> None:
+        if self._tables is not None:
+            if self._tables.num_bands != num_bands:
+                raise ValueError(
+                    f"SharedMemoryBackend holds {self._tables.num_bands} bands, but the index uses {num_bands}"
+                )
+
+            return
+
+        with self._lock, self._locked(META_LOCK, 1, exclusive=True):
+            try:
+                shm = SharedMemory(self.name)
+            except FileNotFoundError:
+                shm = SharedMemory(self.name, create=True, size=_layout(num_bands, self._capacity)[1])
+                SEGMENT_HEADER.pack_into(
+                    shm.buf, 0, SEGMENT_MAGIC, SEGMENT_VERSION, num_bands, self._stripes, self._capacity
+                )
+                np.frombuffer(shm.buf, dtype=np.uint8)[SEGMENT_HEADER.size:] = 0
+                self._map(shm, num_bands, self._capacity)
+                self._band_tables.values[:] = EMPTY
+            else:
+                magic, version, segment_bands, stripes, capacity = SEGMENT_HEADER.unpack_from(shm.buf)
+
+                if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+                    shm.close()
+                    raise ValueError(f"Shared memory segment {self.name} is not a SharedMemoryBackend segment")
+
+                if segment_bands != num_bands:
+                    shm.close()
+                    raise ValueError(
+                        f"SharedMemoryBackend {self.name} holds {segment_bands} bands, but the index uses {num_bands}"
+                    )
+
+                self._stripes = stripes
+                self._capacity = capacity
+                self._map(shm, num_bands, capacity)
+
+            # The segment outlives this process, and is only removed by `unlink`.
+            resource_tracker.unregister(shm._name, "shared_memory") # pyright: ignore[reportAttributeAccessIssue]
+
+    def _map(self, shm: SharedMemory, num_bands: int, capacity: int) -> None:
+        counters, params, sizes, keys, values, uuids = (
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for offset, dtype, shape in _layout(num_bands, capacity)[0]
+        )
+        self._shm = shm
+        self._counters, self._params_buf, self._uuids = counters, params, uuids
+        self._tables = _FixedBandTables.from_arrays(keys, values, sizes)
+
+    @property
+    def _band_tables(self) -> _FixedBandTables:
+        if self._tables is None:
+            raise RuntimeError("SharedMemoryBackend must be used through an DedupIndex.")
+
+        return self._tables
+
+    @property
+    def capacity(self) -> int:
+        """
+        The number of slots of every band table.
+        """
+        return self._capacity
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The size of the shared memory segment.
+        """
+        return 0 if self._shm is None else self._shm.size
+
+    def __len__(self) -> int:
+        return 0 if self._tables is None else int(self._counters[1])
+
+    def close(self) -> None:
+        """
+        Detaches this process from the segment, which stays available to other processes.
+        """
+        with self._lock:
+            if self._shm is not None:
+                self._tables = None
+                self._counters = self._params_buf = self._uuids = None # pyright: ignore[reportAttributeAccessIssue]
+                self._shm.close()
+                self._shm = None
+
+            if self._lock_file is not None:
+                _close_lock_file(self.name)
+                self._lock_file = None
+
+    def unlink(self) -> None:
+        """
+        Removes the segment and its lock file, once every process is done with them. Processes still attached keep
+        their mapping until they close it.
+        """
+        shm = self._shm if self._shm is not None else SharedMemory(self.name)
+        # Registering again balances the unregistration done by `SharedMemory.unlink`.
+        resource_tracker.register(shm._name, "shared_memory") # pyright: ignore[reportAttributeAccessIssue]
+        shm.unlink()
+
+        if shm is not self._shm:
+            shm.close()
+
+        self.close()
+        os.unlink(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+
+    def _stripe_bands(self, stripe: int) -> slice:
+        num_bands = self._band_tables.num_bands
+        return slice(stripe * num_bands // self._stripes, (stripe + 1) * num_bands // self._stripes)
+
+    def _rows(self, band_matrix: Iterable[Iterable[int]]) -> np.ndarray:
+        rows = np.asarray(band_matrix, dtype=np.int64).reshape(-1, self._band_tables.num_bands)
+        return rows.view(np.uint64)
+
+    def _uuid(self, cluster_id: int) -> UUID:
+        return UUID(bytes=self._uuids[cluster_id].tobytes())
+
+    def _new_clusters(self, count: int, items: int) -> np.ndarray:
+        """
+        Allocates `count` new cluster ids with random UUIDs from the shared counters, and counts `items` new items.
+        """
+        with self._locked(META_LOCK, 1, exclusive=True):
+            start = int(self._counters[0])
+            end = start + count
+
+            if end > self._capacity:
+                raise RuntimeError(f"SharedMemoryBackend is full, it holds {self._capacity} clusters at most")
+
+            self._uuids[start:end] = _random_uuids(count)
+            self._counters[0] = end
+            self._counters[1] += items
+
+        return np.arange(start, end, dtype=np.int32)
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        return self.insert_many([list(bands)])[0]
+
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        rows = self._rows(band_matrix)
+        n_docs = len(rows)
+
+        if n_docs == 0:
+            return []
+
+        with self._lock:
+            tables = self._band_tables
+
+            with self._locked(META_LOCK + 1, self._stripes, exclusive=False):
+                found = tables.get(rows)
+
+            clusters, new = _assign_clusters(rows, found, lambda count: self._new_clusters(count, n_docs))
+
+            # Bands indexed by another process since the lookup keep their cluster.
+            for stripe in range(self._stripes):
+                bands = self._stripe_bands(stripe)
+
+                with self._locked(META_LOCK + 1 + stripe, 1, exclusive=True):
+                    stripe_tables = _FixedBandTables.from_arrays(
+                        tables.keys[bands], tables.values[bands], tables.sizes[bands]
+                    )
+                    stripe_tables.setdefault(rows[:, bands], clusters)
+                    tables.sizes[bands] = stripe_tables.sizes
+
+            uuids = self._uuids[clusters]
+
+        if self._instrumentation is not None:
+            self._instrumentation.on_clusters(new, n_docs - new)
+
+        return [UUID(bytes=uuid.tobytes()) for uuid in uuids]
+
+    def query(self, index: int, band: int) -> UUID | None:
+        with self._lock:
+            stripe = next(s for s in range(self._stripes) if index < self._stripe_bands(s).stop)
+
+            with self._locked(META_LOCK + 1 + stripe, 1, exclusive=False):
+                cluster_id = self._band_tables.get_band(index, int(band) & MAX_KEY)
+
+            return None if cluster_id == EMPTY else self._uuid(cluster_id)
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        rows = self._rows([list(bands)])
+
+        with self._lock, self._locked(META_LOCK + 1, self._stripes, exclusive=False):
+            found = self._band_tables.get(rows)[0]
+            return _rank_candidates(self._uuid(cluster_id) for cluster_id in found if cluster_id != EMPTY)
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        """
+        Records the index parameters in the segment on first use, or checks them against the recorded ones.
+        """
+        encoded = json.dumps(params, sort_keys=True).encode()
+
+        if len(encoded) > SEGMENT_PARAMS:
+            raise ValueError(f"Index parameters take more than {SEGMENT_PARAMS} bytes")
+
+        _ = self._band_tables
+
+        with self._lock, self._locked(META_LOCK, 1, exclusive=True):
+            if not (recorded := self._params_buf.tobytes().rstrip(b"\0")):
+                self._params_buf[:len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            else:
+                _check_params(json.loads(recorded), params)
+
+        self._params = params
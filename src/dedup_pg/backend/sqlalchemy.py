@@ -1,45 +1,189 @@
+import copy
+import io
 import textwrap
-from collections.abc import Iterable
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from contextlib import AbstractAsyncContextManager, AbstractContextManager, asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Literal, Self
 from uuid import UUID, uuid4
 
+import numpy as np
+import xxhash
 from sqlalchemy import (
     BIGINT,
+    DDL,
     Column,
+    ColumnElement,
+    Connection,
     Engine,
+    Executable,
+    Index,
+    Insert,
+    Integer,
+    LargeBinary,
     MetaData,
+    Select,
     SmallInteger,
+    String,
     Table,
+    TextClause,
     UniqueConstraint,
     Uuid,
     bindparam,
+    event,
+    func,
     select,
     text,
 )
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase
 
-from dedup_pg.backend.backend import Backend
+from dedup_pg.backend.backend import AsyncBackend, Backend, _UnionFind, _check_params, _group_batch
+from dedup_pg.instrumentation import Instrumentation
 
 
-class SQLAlchemyBackend(Backend):
+def _pg_array(values: Iterable[object]) -> str:
+    """
+    Renders values as a PostgreSQL array literal. Drivers such as psycopg2 otherwise expand lists into an
+    `ARRAY[...]` constructor with one expression per element, which dominates planning time for large batches.
+    """
+    return "{" + ",".join(map(str, values)) + "}"
+
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + bytes(8) # signature, flags and header extension length
+PGCOPY_TRAILER = b"\xff\xff"
+PGCOPY_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("doc_len", ">i4"),
+    ("doc", ">i8"),
+    ("idx_len", ">i4"),
+    ("idx", ">i2"),
+    ("hash_len", ">i4"),
+    ("hash", ">i8"),
+])
+
+
+def _copy_payload(batch_no: int, band_matrix: np.ndarray) -> bytes:
+    """
+    Encodes a band matrix as a binary `COPY` stream of `(doc, band_idx, band_hash)` rows, where `doc` packs the batch
+    number and the row of the item within the batch.
+    """
+    n_docs, num_bands = band_matrix.shape
+    rows = np.empty(n_docs * num_bands, dtype=PGCOPY_ROW)
+
+    rows["fields"] = 3
+    rows["doc_len"] = 8
+    rows["doc"] = np.repeat((batch_no << 32) + np.arange(n_docs, dtype=np.int64), num_bands)
+    rows["idx_len"] = 2
+    rows["idx"] = np.tile(np.arange(num_bands, dtype=np.int16), n_docs)
+    rows["hash_len"] = 8
+    rows["hash"] = band_matrix.reshape(-1)
+
+    return PGCOPY_HEADER + rows.tobytes() + PGCOPY_TRAILER
+
+
+def _copy_from(conn: Connection, sql: str, payload: bytes) -> None:
+    """
+    Streams a `COPY ... FROM STDIN` payload through the DBAPI cursor, supporting both psycopg2 and psycopg3.
+    """
+    cursor = conn.connection.cursor()
+
+    try:
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(sql, io.BytesIO(payload))
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(payload)
+    finally:
+        cursor.close()
+
+
+@dataclass
+class BulkLoadStats:
+    """
+    Progress of a `SQLAlchemyBackend.bulk_load` run.
+
+    Attributes:
+        batches (int): The number of batches staged by this run.
+        skipped_batches (int): The number of batches skipped because an interrupted run already staged them.
+        rows (int): The number of `(band_idx, band_hash)` rows staged by this run.
+        seconds (float): The wall time spent so far.
+    """
+    batches: int = 0
+    skipped_batches: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+SYNCHRONOUS_COMMIT_OFF = "SET LOCAL synchronous_commit = OFF;\n\n"
+# Prepared sessions commit asynchronously, and plan every call. A generic plan cached while the table is small
+# would keep scanning it sequentially as it grows, until the next analyze of the table.
+PREPARED_SESSION_SETTINGS = (
+    "SET SESSION synchronous_commit = OFF",
+    "SET SESSION plan_cache_mode = force_custom_plan",
+)
+
+# The item layout folds the band index into the top byte of each band hash.
+ITEM_BAND_SHIFT = 56
+ITEM_MAX_BANDS = 1 << (64 - ITEM_BAND_SHIFT)
+
+
+def _item_bands(hashes: Iterable[int] | np.ndarray, idxs: Iterable[int] | np.ndarray | None = None) -> np.ndarray:
+    """
+    Encodes band hashes for the item layout, which keeps every band of an item in one `bigint[]`. The band index
+    replaces the top byte of its hash, so equal hashes of different bands never match.
+    """
+    hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+    idxs = np.arange(len(hashes)) if idxs is None else idxs
+    idxs = np.asarray(idxs, dtype=np.uint64)
+    mask = np.uint64((1 << ITEM_BAND_SHIFT) - 1)
+
+    return ((hashes & mask) | (idxs << np.uint64(ITEM_BAND_SHIFT))).view(np.int64)
+
+
+class _SQLAlchemyIndex:
+    _instrumentation: Instrumentation | None = None
+
     def __init__(
         self,
         *,
-        engine: Engine,
         base_or_metadata: type[DeclarativeBase] | MetaData,
         table_name: str,
+        fingerprints: bool = False,
+        signatures: bool = False,
+        merge: bool = False,
+        partition_by: Literal["tenant", "band_idx"] | None = None,
+        band_partitions: int = 8,
+        layout: Literal["band", "item"] = "band",
+        prepared: bool = False,
+        consistent: bool = False,
     ) -> None:
         """
-        The SQLAlchemy backend for the deduplication indexing layer.
+        The table and precompiled statements shared by the synchronous and asynchronous SQLAlchemy backends, so both
+        hit identical SQL.
+        """
+        if partition_by not in (None, "tenant", "band_idx"):
+            raise ValueError('partition_by must be None, "tenant" or "band_idx"')
 
-        Note that this expects a PostgreSQL engine to be provided. You should put this where you
-        define your schemas in order to register the table backing this index into your Alembic
-        migrations.
+        if layout not in ("band", "item"):
+            raise ValueError('layout must be "band" or "item"')
+
+        if layout == "item" and (merge or partition_by is not None):
+            raise ValueError('layout="item" does not support merge or partition_by')
+
+        if prepared and (merge or layout == "item"):
+            raise ValueError('prepared does not support merge or layout="item"')
+
+        if consistent and (merge or prepared or layout == "item"):
+            raise ValueError('consistent does not support merge, prepared or layout="item"')
 
-        Args:
-            base (type[DeclarativeBase] | MetaData): Any SQLAlchemy base, registry, or MetaData
-                object. Must expose a `.metadata` attribute or be a MetaData instance.
-            table_name (str): Name of the deduplication index table.
-        """
         if isinstance(base_or_metadata, MetaData):
             metadata = base_or_metadata
         elif hasattr(base_or_metadata, "metadata"):
@@ -47,86 +191,1110 @@ class SQLAlchemyBackend(Backend):
         else:
             raise TypeError("Expected SQLAlchemy DeclarativeBase, registry, or MetaData object")
 
-        self._engine = engine
         self._metadata = metadata
-        self._table = Table(
-            table_name,
+        self._layout = layout
+        self._prepared = prepared
+        self._consistent = consistent
+        self._partition_by = partition_by
+        self._tenant: str | None = None
+        self._tenants: dict[str, Self] = {}
+        tenant_columns = [Column("tenant", String, nullable=False)] if partition_by == "tenant" else []
+
+        self._unique_name = f"{table_name}_band_idx_band_hash_key"
+
+        if layout == "item":
+            # One row per cluster member, holding every band of the member. See `_item_bands` for the encoding.
+            self._table = Table(
+                table_name,
+                self._metadata,
+                Column("cluster_uuid", Uuid, nullable=False),
+                Column("bands", postgresql.ARRAY(BIGINT), nullable=False),
+                # Without the pending list of fast updates, which every probe would scan until the next vacuum.
+                Index(
+                    f"{table_name}_bands_idx",
+                    "bands",
+                    postgresql_using="gin",
+                    postgresql_with={"fastupdate": "off"},
+                ),
+            )
+        else:
+            self._table = Table(
+                table_name,
+                self._metadata,
+                *tenant_columns,
+                Column("band_idx", SmallInteger, nullable=False),
+                Column("band_hash", BIGINT, nullable=False),
+                Column("cluster_uuid", Uuid, nullable=False),
+                UniqueConstraint(
+                    *(column.name for column in tenant_columns),
+                    "band_idx",
+                    "band_hash",
+                    name=self._unique_name,
+                ),
+                postgresql_partition_by={
+                    None: None,
+                    "tenant": "LIST (tenant)",
+                    "band_idx": "HASH (band_idx)",
+                }[partition_by],
+            )
+
+        if partition_by == "band_idx":
+            # Every band lands in a fixed partition, created along with the table.
+            _ = event.listen(self._table, "after_create", DDL("\n".join(
+                f"CREATE TABLE {table_name}_band_{i} PARTITION OF {table_name} "
+                f"FOR VALUES WITH (MODULUS {band_partitions}, REMAINDER {i});"
+                for i in range(band_partitions)
+            )))
+
+        # Statements of a tenant-partitioned table carry the tenant, which prunes them to the tenant's partition.
+        tenant_where, tenant_insert, tenant_value, conflict = "", "", "", "(band_idx, band_hash)"
+
+        if partition_by == "tenant":
+            tenant_where = " AND t.tenant = CAST(:tenant AS text)"
+            tenant_insert, tenant_value = "tenant, ", "CAST(:tenant AS text), "
+            conflict = "(tenant, band_idx, band_hash)"
+
+        self._tenant_sql = (tenant_where, tenant_insert, tenant_value, conflict)
+
+        # Records the parameters the bands were built with, so that a mismatched index is refused.
+        self._meta_table = Table(
+            f"{table_name}_meta",
             self._metadata,
-            Column("band_idx", SmallInteger, nullable=False),
-            Column("band_hash", BIGINT, nullable=False),
-            Column("cluster_uuid", Uuid, nullable=False),
+            Column("key", String, primary_key=True),
+            Column("value", String, nullable=False),
         )
+        self._params: dict[str, int | str] | None = None
+        self._params_checked = False
 
-        self._table.append_constraint(
-            UniqueConstraint(
-                "band_idx",
-                "band_hash",
-                name=f"{table_name}_band_idx_band_hash_key"
+        # Side tables of a tenant-partitioned index are partitioned alike, so that dropping a tenant drops its rows
+        # with its partitions rather than deleting them.
+        side_partition_by = "LIST (tenant)" if partition_by == "tenant" else None
+
+        # Maps exact content fingerprints to their cluster, so that exact duplicates skip band work.
+        self._fingerprint_table = None
+
+        if fingerprints:
+            self._fingerprint_table = Table(
+                f"{table_name}_fingerprint",
+                self._metadata,
+                *(Column("tenant", String, primary_key=True) for _ in tenant_columns),
+                Column("fingerprint", LargeBinary(16), primary_key=True),
+                Column("cluster_uuid", Uuid, nullable=False),
+                postgresql_partition_by=side_partition_by,
             )
-        )
+
+        # Keeps the compact signature of one representative per cluster, for `DedupIndex.query` to verify candidates.
+        self._signature_table = None
+
+        if signatures:
+            self._signature_table = Table(
+                f"{table_name}_signature",
+                self._metadata,
+                *(Column("tenant", String, primary_key=True) for _ in tenant_columns),
+                Column("cluster_uuid", Uuid, primary_key=True),
+                Column("signature", LargeBinary, nullable=False),
+                postgresql_partition_by=side_partition_by,
+            )
+
+        # Records which clusters were merged into which canonical cluster. Merges are serialized, so every alias
+        # points straight at its canonical cluster, and reads resolve a cluster with a single index probe.
+        self._merge_table = None
+        probe_from, probe_uuid = f"{table_name} t", "t.cluster_uuid"
+
+        if merge:
+            self._merge_table = Table(
+                f"{table_name}_merge",
+                self._metadata,
+                Column("cluster_uuid", Uuid, primary_key=True),
+                Column("canonical_uuid", Uuid, nullable=False, index=True),
+            )
+            # Lets compaction find the bands of merged clusters without scanning the whole index.
+            self._table.append_constraint(Index(f"{table_name}_cluster_uuid_idx", "cluster_uuid"))
+
+            probe_from = f"{table_name} t LEFT JOIN {table_name}_merge m ON m.cluster_uuid = t.cluster_uuid"
+            probe_uuid = "COALESCE(m.canonical_uuid, t.cluster_uuid)"
 
         # This needs to know the num_bands before usage, so we set it to None and throw fatal exceptions if
         # the backend is used standalone.
+        self._insert_cte = None
         self._insert_stmt = None
+        self._insert_many_cte = None
+        self._insert_many_stmt = None
+        self._repoint_stmt = None
+
+        # Prepared writes run as single autocommit statements, on sessions set up once by `_session_stmts`. Drivers
+        # which interpolate parameters client-side, such as psycopg2, cannot prepare statements by themselves, so
+        # the backend issues an explicit PREPARE and runs `_prepared_insert_stmt` as an EXECUTE.
+        self._explicit_prepare = False
+        self._prepared_insert_stmt = None
+        self._session_key = ""
+        self._session_stmts: list[TextClause] = []
+
+        # Resolves every band of an item at once. Correlated lookups keep this an index probe per band.
+        self._lookup_stmt = text(textwrap.dedent(f"""
+            SELECT p.cluster_uuid, count(*) AS bands
+            FROM (
+                SELECT (
+                    SELECT {probe_uuid}
+                    FROM {probe_from}
+                    WHERE t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                ) AS cluster_uuid
+                FROM unnest(
+                    CAST(CAST(:idxs AS text) AS smallint[]),
+                    CAST(CAST(:hashes AS text) AS bigint[])
+                ) AS v(idx, hash)
+            ) p
+            WHERE p.cluster_uuid IS NOT NULL
+            GROUP BY p.cluster_uuid
+            ORDER BY bands DESC, p.cluster_uuid;
+        """)).columns(cluster_uuid=Uuid, bands=Integer)
+
+        if layout == "item":
+            # One probe of the GIN index per band, counting the matching bands of each cluster.
+            self._lookup_stmt = text(textwrap.dedent(f"""
+                SELECT c.cluster_uuid, count(*) AS bands
+                FROM unnest(CAST(CAST(:hashes AS text) AS bigint[])) AS v(hash)
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT t.cluster_uuid FROM {table_name} t WHERE t.bands && ARRAY[v.hash]
+                ) c
+                GROUP BY c.cluster_uuid
+                ORDER BY bands DESC, c.cluster_uuid;
+            """)).columns(cluster_uuid=Uuid, bands=Integer)
+
+        # Indexes the bands of an item which are not indexed yet under a cluster chosen by the caller.
+        insert_into_sql = textwrap.dedent(f"""
+            INSERT INTO {table_name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+            SELECT {tenant_value}v.idx, v.hash, CAST(:cluster_uuid AS uuid)
+            FROM unnest(
+                CAST(CAST(:idxs AS text) AS smallint[]),
+                CAST(CAST(:hashes AS text) AS bigint[])
+            ) AS v(idx, hash)
+            ON CONFLICT {conflict} DO NOTHING;
+        """)
+
+        if layout == "item":
+            insert_into_sql = textwrap.dedent(f"""
+                INSERT INTO {table_name} (cluster_uuid, bands)
+                SELECT CAST(:cluster_uuid AS uuid), CAST(CAST(:hashes AS text) AS bigint[])
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table_name} t WHERE t.bands @> CAST(CAST(:hashes AS text) AS bigint[])
+                );
+            """)
+
+        self._insert_into_cte = text(insert_into_sql)
+        self._insert_into_stmt = text(SYNCHRONOUS_COMMIT_OFF + insert_into_sql)
+
+        # Batched variants of the lookup and insert into statements, for callers such as `ShardedBackend` which
+        # choose clusters themselves. The item layout falls back to one statement per item.
+        self._lookup_many_stmt = text(textwrap.dedent(f"""
+            SELECT p.doc, p.cluster_uuid, count(*) AS bands
+            FROM (
+                SELECT v.doc, (
+                    SELECT {probe_uuid}
+                    FROM {probe_from}
+                    WHERE t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                ) AS cluster_uuid
+                FROM unnest(
+                    CAST(CAST(:docs AS text) AS integer[]),
+                    CAST(CAST(:idxs AS text) AS smallint[]),
+                    CAST(CAST(:hashes AS text) AS bigint[])
+                ) AS v(doc, idx, hash)
+            ) p
+            WHERE p.cluster_uuid IS NOT NULL
+            GROUP BY p.doc, p.cluster_uuid
+            ORDER BY p.doc, bands DESC, p.cluster_uuid;
+        """)).columns(doc=Integer, cluster_uuid=Uuid, bands=Integer)
+
+        insert_into_many_sql = textwrap.dedent(f"""
+            INSERT INTO {table_name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+            SELECT {tenant_value}v.idx, v.hash, v.cluster_uuid
+            FROM unnest(
+                CAST(CAST(:idxs AS text) AS smallint[]),
+                CAST(CAST(:hashes AS text) AS bigint[]),
+                CAST(CAST(:uuids AS text) AS uuid[])
+            ) AS v(idx, hash, cluster_uuid)
+            ON CONFLICT {conflict} DO NOTHING;
+        """)
+        self._insert_into_many_cte = text(insert_into_many_sql)
+        self._insert_into_many_stmt = text(SYNCHRONOUS_COMMIT_OFF + insert_into_many_sql)
+
+        if merge:
+            # In merge mode, inserts first probe the resolved clusters of every band, merge them client-side, then
+            # repoint and record the merged clusters and insert the bands.
+            merge_probe_sql = textwrap.dedent(f"""
+                SELECT DISTINCT p.grp, p.cluster_uuid AS uuid
+                FROM (
+                    SELECT v.grp, (
+                        SELECT {probe_uuid}
+                        FROM {probe_from}
+                        WHERE t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                    ) AS cluster_uuid
+                    FROM unnest(
+                        CAST(CAST(:grps AS text) AS integer[]),
+                        CAST(CAST(:idxs AS text) AS smallint[]),
+                        CAST(CAST(:hashes AS text) AS bigint[])
+                    ) AS v(grp, idx, hash)
+                ) p
+                WHERE p.cluster_uuid IS NOT NULL;
+            """)
+            self._merge_probe_cte = text(merge_probe_sql).columns(grp=Integer, uuid=Uuid)
+            self._merge_probe_stmt = text(SYNCHRONOUS_COMMIT_OFF + merge_probe_sql).columns(grp=Integer, uuid=Uuid)
+
+            # Writers which merge clusters take turns, and probe again once they hold the lock, so that no writer
+            # repoints aliases at a cluster another one is merging away. Writers which merge nothing never wait.
+            self._merge_lock_stmt = text("SELECT pg_advisory_xact_lock(hashtext(:merge_table));").bindparams(
+                merge_table=f"{table_name}_merge"
+            )
+
+            self._merge_repoint_stmt = text(textwrap.dedent(f"""
+                UPDATE {table_name}_merge m
+                SET canonical_uuid = x.canonical_uuid
+                FROM unnest(
+                    CAST(CAST(:aliases AS text) AS uuid[]),
+                    CAST(CAST(:canonicals AS text) AS uuid[])
+                ) AS x(cluster_uuid, canonical_uuid)
+                WHERE m.canonical_uuid = x.cluster_uuid;
+            """))
+
+            self._merge_insert_stmt = text(textwrap.dedent(f"""
+                WITH merged AS (
+                    INSERT INTO {table_name}_merge (cluster_uuid, canonical_uuid)
+                    SELECT *
+                    FROM unnest(
+                        CAST(CAST(:aliases AS text) AS uuid[]),
+                        CAST(CAST(:canonicals AS text) AS uuid[])
+                    )
+                    ON CONFLICT (cluster_uuid) DO UPDATE SET canonical_uuid = EXCLUDED.canonical_uuid
+                )
+                INSERT INTO {table_name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+                SELECT {tenant_value}u.*
+                FROM unnest(
+                    CAST(CAST(:idxs AS text) AS smallint[]),
+                    CAST(CAST(:hashes AS text) AS bigint[]),
+                    CAST(CAST(:uuids AS text) AS uuid[])
+                ) AS u
+                ON CONFLICT {conflict} DO NOTHING;
+            """))
 
     def _init_internal(self, num_bands: int) -> None:
         """
         Initializes backend to be ready for use by an Index. For the SQLAlchemy backend, we use _insert_stmt.
         """
+        if self._layout == "item":
+            self._init_item_layout(num_bands)
+            return
+
+        tenant_where, tenant_insert, tenant_value, conflict = self._tenant_sql
         values_clause = ",\n        ".join(
-            f"(:i{i}, :h{i})" for i in range(num_bands)
+            f"(CAST(:i{i} AS smallint), CAST(:h{i} AS bigint))" for i in range(num_bands)
         )
 
         # Precompile PostgreSQL insert stmt
+        insert_sql = textwrap.dedent(f"""
+            WITH vals(idx, hash) AS (
+                VALUES
+                    {values_clause}
+            ),
+            existing AS (
+                SELECT cluster_uuid
+                FROM {self._table.name} t
+                JOIN vals v ON t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                LIMIT 1
+            ),
+            chosen AS (
+                SELECT COALESCE((SELECT cluster_uuid FROM existing), CAST(:new_uuid AS uuid)) AS uuid
+            ),
+            ins AS (
+                INSERT INTO {self._table.name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+                SELECT {tenant_value}v.idx, v.hash, chosen.uuid
+                FROM vals v CROSS JOIN chosen
+                ON CONFLICT {conflict} DO NOTHING
+            )
+            SELECT uuid FROM chosen;
+        """)
+        insert_params = (
+            *(bindparam(f"i{k}") for k in range(num_bands)),
+            *(bindparam(f"h{k}") for k in range(num_bands)),
+            bindparam("new_uuid"),
+            *((bindparam("tenant"),) if tenant_where else ()),
+        )
+
+        self._insert_cte = text(insert_sql).bindparams(*insert_params).columns(uuid=Uuid)
         self._insert_stmt = (
-            text(textwrap.dedent(f"""
-                SET LOCAL synchronous_commit = OFF;
+            text(SYNCHRONOUS_COMMIT_OFF + insert_sql)
+            .bindparams(*insert_params)
+            .columns(uuid=Uuid)
+        )
 
-                WITH vals(idx, hash) AS (
-                    VALUES
-                        {values_clause}
-                ),
-                existing AS (
-                    SELECT cluster_uuid
+        # Precompile PostgreSQL batch insert stmt. Band pairs arrive deduplicated and tagged with the intra-batch
+        # group of their item, ordered by item then band index, so the earliest matching band of a group wins.
+        # Arrays are bound as text literals, which every driver can send and Postgres parses cheaply.
+        insert_many_sql = textwrap.dedent(f"""
+            WITH vals AS (
+                SELECT *
+                FROM unnest(
+                    CAST(CAST(:grps AS text) AS integer[]),
+                    CAST(CAST(:idxs AS text) AS smallint[]),
+                    CAST(CAST(:hashes AS text) AS bigint[])
+                ) WITH ORDINALITY AS v(grp, idx, hash, ord)
+            ),
+            groups AS (
+                SELECT g.ord - 1 AS grp, g.new_uuid
+                FROM unnest(CAST(CAST(:new_uuids AS text) AS uuid[])) WITH ORDINALITY AS g(new_uuid, ord)
+            ),
+            probes AS (
+                -- Correlated lookups keep this an index probe per band rather than a join against the whole table.
+                SELECT v.grp, v.ord, (
+                    SELECT t.cluster_uuid
                     FROM {self._table.name} t
-                    JOIN vals v ON t.band_idx = v.idx AND t.band_hash = v.hash
-                    LIMIT 1
-                ),
-                chosen AS (
-                    SELECT COALESCE((SELECT cluster_uuid FROM existing), :new_uuid) AS uuid
-                ),
+                    WHERE t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                ) AS cluster_uuid
+                FROM vals v
+            ),
+            existing AS (
+                SELECT DISTINCT ON (p.grp) p.grp, p.cluster_uuid
+                FROM probes p
+                WHERE p.cluster_uuid IS NOT NULL
+                ORDER BY p.grp, p.ord
+            ),
+            chosen AS (
+                SELECT g.grp, g.new_uuid, COALESCE(e.cluster_uuid, g.new_uuid) AS uuid
+                FROM groups g
+                LEFT JOIN existing e ON e.grp = g.grp
+            ),
+        """)
+
+        if self._consistent:
+            # Concurrent writers which both missed may propose different clusters for the same bands. Conflicting
+            # inserts wait for the writer holding a band and return its cluster once committed. Bands are taken in
+            # one global order, so writers never deadlock. A group which proposed a new cluster but lost a band
+            # reports the winning cluster, and `_repoint_stmt` moves its own bands there. Bands already in the chosen
+            # cluster are only locked, not rewritten.
+            insert_many_sql += textwrap.dedent(f"""\
                 ins AS (
-                    INSERT INTO {self._table.name} (band_idx, band_hash, cluster_uuid)
-                    SELECT v.idx, v.hash, chosen.uuid
-                    FROM vals v CROSS JOIN chosen
-                    ON CONFLICT (band_idx, band_hash) DO NOTHING
+                    INSERT INTO {self._table.name} AS t ({tenant_insert}band_idx, band_hash, cluster_uuid)
+                    SELECT {tenant_value}v.idx, v.hash, c.uuid
+                    FROM vals v
+                    JOIN chosen c ON c.grp = v.grp
+                    ORDER BY v.idx, v.hash
+                    ON CONFLICT {conflict} DO UPDATE SET cluster_uuid = t.cluster_uuid
+                        WHERE t.cluster_uuid <> EXCLUDED.cluster_uuid
+                    RETURNING t.band_idx, t.band_hash, t.cluster_uuid
+                ),
+                raced AS (
+                    SELECT DISTINCT ON (v.grp) v.grp, i.cluster_uuid
+                    FROM ins i
+                    JOIN vals v ON v.idx = i.band_idx AND v.hash = i.band_hash
+                    JOIN chosen c ON c.grp = v.grp
+                    WHERE c.uuid = c.new_uuid AND i.cluster_uuid <> c.uuid
+                    ORDER BY v.grp, v.ord
                 )
-                SELECT uuid FROM chosen;
+                SELECT c.grp, c.uuid, r.cluster_uuid AS raced
+                FROM chosen c
+                LEFT JOIN raced r ON r.grp = c.grp;
+            """)
+            columns = {"grp": Integer, "uuid": Uuid, "raced": Uuid}
+
+            self._repoint_stmt = text(textwrap.dedent(f"""
+                UPDATE {self._table.name} t
+                SET cluster_uuid = r.to_uuid
+                FROM unnest(
+                    CAST(CAST(:grps AS text) AS integer[]),
+                    CAST(CAST(:idxs AS text) AS smallint[]),
+                    CAST(CAST(:hashes AS text) AS bigint[])
+                ) AS v(grp, idx, hash)
+                JOIN unnest(
+                    CAST(CAST(:raced_grps AS text) AS integer[]),
+                    CAST(CAST(:raced_from AS text) AS uuid[]),
+                    CAST(CAST(:raced_to AS text) AS uuid[])
+                ) AS r(grp, from_uuid, to_uuid) ON r.grp = v.grp
+                WHERE t.band_idx = v.idx AND t.band_hash = v.hash AND t.cluster_uuid = r.from_uuid{tenant_where};
             """))
-            .bindparams(
-                *(bindparam(f"i{k}") for k in range(num_bands)),
-                *(bindparam(f"h{k}") for k in range(num_bands)),
-                bindparam("new_uuid"),
+        else:
+            insert_many_sql += textwrap.dedent(f"""\
+                ins AS (
+                    INSERT INTO {self._table.name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+                    SELECT {tenant_value}v.idx, v.hash, c.uuid
+                    FROM vals v
+                    JOIN chosen c ON c.grp = v.grp
+                    ON CONFLICT {conflict} DO NOTHING
+                )
+                SELECT grp, uuid FROM chosen;
+            """)
+            columns = {"grp": Integer, "uuid": Uuid}
+
+        self._insert_many_cte = text(insert_many_sql).columns(**columns)
+        self._insert_many_stmt = text(SYNCHRONOUS_COMMIT_OFF + insert_many_sql).columns(**columns)
+
+        if self._prepared:
+            self._init_prepared()
+
+    def _prepared_insert_sql(self, hashes: str, new_uuid: str, tenant: str) -> str:
+        """
+        The single-item insert with a fixed number of parameters whatever the number of bands, so that it can be
+        prepared once. Band indexes follow the order of the bound hashes.
+        """
+        name = self._table.name
+        tenant_where, tenant_insert, tenant_value, conflict = "", "", "", "(band_idx, band_hash)"
+
+        if self._partition_by == "tenant":
+            tenant_where, tenant_insert, tenant_value = f" AND t.tenant = {tenant}", "tenant, ", f"{tenant}, "
+            conflict = "(tenant, band_idx, band_hash)"
+
+        return textwrap.dedent(f"""
+            WITH vals AS (
+                SELECT CAST(v.ord - 1 AS smallint) AS idx, v.hash
+                FROM unnest({hashes}) WITH ORDINALITY AS v(hash, ord)
+            ),
+            existing AS (
+                SELECT cluster_uuid
+                FROM {name} t
+                JOIN vals v ON t.band_idx = v.idx AND t.band_hash = v.hash{tenant_where}
+                LIMIT 1
+            ),
+            chosen AS (
+                SELECT COALESCE((SELECT cluster_uuid FROM existing), {new_uuid}) AS uuid
+            ),
+            ins AS (
+                INSERT INTO {name} ({tenant_insert}band_idx, band_hash, cluster_uuid)
+                SELECT {tenant_value}v.idx, v.hash, chosen.uuid
+                FROM vals v CROSS JOIN chosen
+                ON CONFLICT {conflict} DO NOTHING
             )
+            SELECT uuid FROM chosen;
+        """)
+
+    def _init_prepared(self) -> None:
+        tenant = self._partition_by == "tenant"
+        insert_sql = self._prepared_insert_sql(
+            "CAST(CAST(:hashes AS text) AS bigint[])", "CAST(:new_uuid AS uuid)", "CAST(:tenant AS text)"
         )
 
-    def insert(self, bands: Iterable[int]) -> UUID:
-        if self._insert_stmt is None:
-            raise RuntimeError("SQLAlchemyBackend must be used through an DedupIndex.")
+        # Named after the statement, so that indexes sharing a connection never run each other's statements.
+        self._session_key = f"dedup_pg_insert_{xxhash.xxh3_64_hexdigest(insert_sql)}"
+        self._session_stmts = [text(setting) for setting in PREPARED_SESSION_SETTINGS]
+        self._prepared_insert_stmt = text(insert_sql).columns(uuid=Uuid)
+
+        if self._explicit_prepare:
+            arg_types = "bigint[], uuid, text" if tenant else "bigint[], uuid"
+            args = ":hashes, :new_uuid, :tenant" if tenant else ":hashes, :new_uuid"
+            prepare_sql = self._prepared_insert_sql("$1", "$2", "$3")
+
+            self._session_stmts.append(text(f"PREPARE {self._session_key}({arg_types}) AS {prepare_sql}"))
+            self._prepared_insert_stmt = text(f"EXECUTE {self._session_key}({args})").columns(uuid=Uuid)
+
+    def _init_item_layout(self, num_bands: int) -> None:
+        if num_bands > ITEM_MAX_BANDS:
+            raise ValueError(f'layout="item" supports at most {ITEM_MAX_BANDS} bands per item')
+
+        name = self._table.name
+
+        # An item joins the cluster of the member holding its earliest band found. It is only stored as a new member
+        # if no member holds all of its bands already, so exact duplicates do not grow the table. Bands are probed
+        # one by one without a LIMIT, as a LIMIT tempts the planner into a sequential scan in hope of an early match.
+        insert_sql = textwrap.dedent(f"""
+            WITH vals AS (
+                SELECT *
+                FROM unnest(CAST(CAST(:bands AS text) AS bigint[])) WITH ORDINALITY AS v(hash, ord)
+            ),
+            existing AS (
+                SELECT c.cluster_uuid
+                FROM vals v
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT t.cluster_uuid FROM {name} t WHERE t.bands && ARRAY[v.hash]
+                ) c
+                ORDER BY v.ord
+                LIMIT 1
+            ),
+            chosen AS (
+                SELECT COALESCE((SELECT cluster_uuid FROM existing), CAST(:new_uuid AS uuid)) AS uuid
+            ),
+            ins AS (
+                INSERT INTO {name} (cluster_uuid, bands)
+                SELECT chosen.uuid, CAST(CAST(:bands AS text) AS bigint[])
+                FROM chosen
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {name} t WHERE t.bands @> CAST(CAST(:bands AS text) AS bigint[])
+                )
+            )
+            SELECT uuid FROM chosen;
+        """)
+
+        self._insert_cte = text(insert_sql).columns(uuid=Uuid)
+        self._insert_stmt = text(SYNCHRONOUS_COMMIT_OFF + insert_sql).columns(uuid=Uuid)
+
+        # Items of a batch which share a band are grouped client-side, and each group is stored as one member.
+        insert_many_sql = textwrap.dedent(f"""
+            WITH vals AS (
+                SELECT *
+                FROM unnest(
+                    CAST(CAST(:grps AS text) AS integer[]),
+                    CAST(CAST(:hashes AS text) AS bigint[])
+                ) WITH ORDINALITY AS v(grp, hash, ord)
+            ),
+            groups AS (
+                SELECT g.ord - 1 AS grp, g.new_uuid
+                FROM unnest(CAST(CAST(:new_uuids AS text) AS uuid[])) WITH ORDINALITY AS g(new_uuid, ord)
+            ),
+            members AS (
+                SELECT v.grp, array_agg(v.hash ORDER BY v.ord) AS bands
+                FROM vals v
+                GROUP BY v.grp
+            ),
+            existing AS (
+                SELECT DISTINCT ON (v.grp) v.grp, c.cluster_uuid
+                FROM vals v
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT t.cluster_uuid FROM {name} t WHERE t.bands && ARRAY[v.hash]
+                ) c
+                ORDER BY v.grp, v.ord
+            ),
+            chosen AS (
+                SELECT g.grp, COALESCE(e.cluster_uuid, g.new_uuid) AS uuid
+                FROM groups g
+                LEFT JOIN existing e ON e.grp = g.grp
+            ),
+            ins AS (
+                INSERT INTO {name} (cluster_uuid, bands)
+                SELECT c.uuid, m.bands
+                FROM chosen c
+                JOIN members m ON m.grp = c.grp
+                WHERE NOT EXISTS (SELECT 1 FROM {name} t WHERE t.bands @> m.bands)
+            )
+            SELECT grp, uuid FROM chosen;
+        """)
+
+        self._insert_many_cte = text(insert_many_sql).columns(grp=Integer, uuid=Uuid)
+        self._insert_many_stmt = text(SYNCHRONOUS_COMMIT_OFF + insert_many_sql).columns(grp=Integer, uuid=Uuid)
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        # Checked lazily on first use, as the table may not have been created yet.
+        self._params = params
+        self._params_checked = False
+
+    def _params_stmts(self) -> tuple[TextClause, Insert, Select[tuple[str, str]]]:
+        assert self._params is not None
+        exists_stmt = text("SELECT to_regclass(:name)").bindparams(name=self._meta_table.fullname)
+        insert_stmt = (
+            pg_insert(self._meta_table)
+            .values([{"key": key, "value": str(value)} for key, value in self._params.items()])
+            .on_conflict_do_nothing()
+        )
+        select_stmt = select(self._meta_table.c.key, self._meta_table.c.value)
 
+        return exists_stmt, insert_stmt, select_stmt
+
+    def _check_recorded_params(self, recorded: dict[str, str]) -> bool:
+        """
+        Checks the parameters recorded so far, returning whether every parameter of the index was recorded.
+        """
+        assert self._params is not None
+        expected = {key: str(value) for key, value in self._params.items()}
+        present = [key for key in expected if key in recorded]
+        _check_params({key: recorded[key] for key in present}, {key: expected[key] for key in present})
+
+        return len(present) == len(expected)
+
+    def _ensure_params(self, conn: Connection, *, record: bool = True) -> None:
+        """
+        Records the index parameters on first use, or checks them against the recorded ones. Tables created before
+        parameters were recorded are left unchecked. Read-only callers pass `record=False`, and keep checking on
+        later calls until a writer has recorded the parameters.
+        """
+        if self._params_checked or self._params is None:
+            return
+
+        exists_stmt, insert_stmt, select_stmt = self._params_stmts()
+
+        if conn.execute(exists_stmt).scalar() is None:
+            self._params_checked = True
+            return
+
+        if record:
+            _ = conn.execute(insert_stmt)
+
+        self._params_checked = self._check_recorded_params(dict(conn.execute(select_stmt).tuples().all()))
+
+    async def _aensure_params(self, conn: AsyncConnection, *, record: bool = True) -> None:
+        """
+        Asynchronous version of `_ensure_params`.
+        """
+        if self._params_checked or self._params is None:
+            return
+
+        exists_stmt, insert_stmt, select_stmt = self._params_stmts()
+
+        if (await conn.execute(exists_stmt)).scalar() is None:
+            self._params_checked = True
+            return
+
+        if record:
+            _ = await conn.execute(insert_stmt)
+
+        self._params_checked = self._check_recorded_params(dict((await conn.execute(select_stmt)).tuples().all()))
+
+    def _insert_params(self, bands: Iterable[int]) -> dict[str, int | str]:
         # Perform parameter computations before starting a session to leave it open as short as
         # possible to avoid connection jamming.
+        if self._layout == "item":
+            return {"bands": _pg_array(_item_bands(list(bands)).tolist()), "new_uuid": str(uuid4())}
+
+        if self._prepared:
+            return {"hashes": _pg_array(int(h) for h in bands), "new_uuid": str(uuid4()), **self._tenant_params()}
+
         band_pairs = list(enumerate(bands))
-        params = {}
+        params: dict[str, int | str] = {}
 
         for i, h in band_pairs:
             params[f"i{i}"] = i
-            params[f"h{i}"] = h
+            params[f"h{i}"] = int(h)
 
         new_uuid = uuid4()
         params["new_uuid"] = str(new_uuid)
+        params.update(self._tenant_params())
+
+        return params
+
+    def _insert_many_params(self, band_matrix: Iterable[Iterable[int]]) -> tuple[list[int], dict[str, str]]:
+        doc_groups, group_pairs = _group_batch(band_matrix)
+        params = {
+            "grps": _pg_array(group for group, pairs in enumerate(group_pairs) for _ in pairs),
+            "idxs": _pg_array(i for pairs in group_pairs for i, _ in pairs),
+            "hashes": _pg_array(h for pairs in group_pairs for _, h in pairs),
+            "new_uuids": _pg_array(uuid4() for _ in group_pairs),
+            **self._tenant_params(),
+        }
+
+        if self._layout == "item":
+            idxs = np.fromiter((i for pairs in group_pairs for i, _ in pairs), dtype=np.int64)
+            hashes = np.fromiter((h for pairs in group_pairs for _, h in pairs), dtype=np.int64)
+            params["hashes"] = _pg_array(_item_bands(hashes, idxs).tolist())
+
+        return doc_groups, params
+
+    def _report_clusters(self, proposed: str, cluster_uuids: Iterable[UUID], items: int) -> None:
+        """
+        Reports the clusters created by a write, which are the ones that took the new UUID proposed for them.
+        """
+        if self._instrumentation is None:
+            return
+
+        proposed_uuids = set(proposed.strip("{}").split(","))
+        new = sum(str(cluster_uuid) in proposed_uuids for cluster_uuid in set(cluster_uuids))
+        self._instrumentation.on_clusters(new, items - new)
+
+    def _report_merged(
+        self, group_pairs: list[list[tuple[int, int]]], found: list[tuple[int, UUID]], items: int
+    ) -> None:
+        if self._instrumentation is not None:
+            new = len(group_pairs) - len({group for group, _ in found})
+            self._instrumentation.on_clusters(new, items - new)
+
+    def _settle_races(
+        self, params: dict[str, str], rows: Iterable[tuple[int, UUID, UUID | None]]
+    ) -> tuple[dict[int, UUID], dict[str, str] | None]:
+        """
+        Resolves the groups of a consistent write to their clusters, along with the parameters of `_repoint_stmt`
+        for the groups which lost a band to a concurrent writer, or None if none did.
+        """
+        group_uuids: dict[int, UUID] = {}
+        raced: list[tuple[int, UUID, UUID]] = []
+
+        for group, cluster_uuid, winner in rows:
+            group_uuids[group] = cluster_uuid if winner is None else winner
+
+            if winner is not None:
+                raced.append((group, cluster_uuid, winner))
+
+        if not raced:
+            return group_uuids, None
+
+        return group_uuids, {
+            **params,
+            "raced_grps": _pg_array(group for group, _, _ in raced),
+            "raced_from": _pg_array(loser for _, loser, _ in raced),
+            "raced_to": _pg_array(winner for _, _, winner in raced),
+        }
+
+    def _tenant_params(self) -> dict[str, str]:
+        if self._partition_by != "tenant":
+            return {}
+
+        if self._tenant is None:
+            raise ValueError("A backend partitioned by tenant must be used through `tenant` or a `tenant=` argument")
+
+        return {"tenant": self._tenant}
+
+    def _tenant_filter(self, table: Table) -> list[ColumnElement[bool]]:
+        return [table.c.tenant == tenant for tenant in self._tenant_params().values()]
+
+    def _lookup_params(self, bands: Iterable[int]) -> dict[str, str]:
+        band_pairs = list(enumerate(bands))
+
+        if self._layout == "item":
+            return {"hashes": _pg_array(_item_bands([h for _, h in band_pairs]).tolist())}
+
+        return {
+            "idxs": _pg_array(i for i, _ in band_pairs),
+            "hashes": _pg_array(int(h) for _, h in band_pairs),
+            **self._tenant_params(),
+        }
+
+    def _lookup_many_params(self, rows: np.ndarray) -> dict[str, str]:
+        n_docs, num_bands = rows.shape
+
+        return {
+            "docs": _pg_array(np.repeat(np.arange(n_docs), num_bands).tolist()),
+            "idxs": _pg_array(np.tile(np.arange(num_bands), n_docs).tolist()),
+            "hashes": _pg_array(rows.reshape(-1).tolist()),
+            **self._tenant_params(),
+        }
+
+    def _insert_into_many_params(self, rows: np.ndarray, cluster_uuids: list[UUID]) -> dict[str, str]:
+        n_docs, num_bands = rows.shape
+
+        return {
+            "idxs": _pg_array(np.tile(np.arange(num_bands), n_docs).tolist()),
+            "hashes": _pg_array(rows.reshape(-1).tolist()),
+            "uuids": _pg_array(uuid for uuid in cluster_uuids for _ in range(num_bands)),
+            **self._tenant_params(),
+        }
+
+    @staticmethod
+    def _lookup_many_result(n_docs: int, rows: Iterable[tuple[int, UUID, int]]) -> list[dict[UUID, int]]:
+        candidates: list[dict[UUID, int]] = [{} for _ in range(n_docs)]
+
+        for doc, cluster_uuid, bands in rows:
+            candidates[doc][cluster_uuid] = bands
+
+        return candidates
+
+    def _fingerprint_query_stmt(self, fingerprint: bytes) -> Select[tuple[UUID]]:
+        assert self._fingerprint_table is not None
+        table = self._fingerprint_table
+
+        return select(table.c.cluster_uuid).where(table.c.fingerprint == fingerprint, *self._tenant_filter(table))
+
+    def _fingerprint_insert_stmt(self, fingerprint: bytes, cluster_uuid: UUID) -> Insert:
+        assert self._fingerprint_table is not None
+
+        return (
+            pg_insert(self._fingerprint_table)
+            .values(fingerprint=fingerprint, cluster_uuid=cluster_uuid, **self._tenant_params())
+            .on_conflict_do_nothing()
+        )
+
+    def _signature_query_stmt(self, cluster_uuids: Iterable[UUID]) -> Select[tuple[UUID, bytes]]:
+        assert self._signature_table is not None
+        table = self._signature_table
+
+        return select(table.c.cluster_uuid, table.c.signature).where(
+            table.c.cluster_uuid.in_(list(cluster_uuids)), *self._tenant_filter(table)
+        )
+
+    def _signature_insert_stmt(self, signatures: Iterable[tuple[UUID, bytes]]) -> Insert:
+        assert self._signature_table is not None
+        tenant = self._tenant_params()
+
+        return (
+            pg_insert(self._signature_table)
+            .values([
+                {"cluster_uuid": cluster_uuid, "signature": signature, **tenant}
+                for cluster_uuid, signature in signatures
+            ])
+            .on_conflict_do_nothing()
+        )
+
+    def _merge_probe_params(
+        self, band_matrix: Iterable[Iterable[int]]
+    ) -> tuple[list[int], list[list[tuple[int, int]]], dict[str, str]]:
+        doc_groups, group_pairs = _group_batch(band_matrix)
+        params = {
+            "grps": _pg_array(group for group, pairs in enumerate(group_pairs) for _ in pairs),
+            "idxs": _pg_array(i for pairs in group_pairs for i, _ in pairs),
+            "hashes": _pg_array(h for pairs in group_pairs for _, h in pairs),
+            **self._tenant_params(),
+        }
+
+        return doc_groups, group_pairs, params
+
+    def _merge_plan(
+        self, group_pairs: list[list[tuple[int, int]]], found: list[tuple[int, UUID]]
+    ) -> tuple[list[UUID], dict[str, str]]:
+        """
+        Merges the clusters found for each group, along with the clusters of any group sharing one of them. Each
+        merged set takes its smallest UUID, so that concurrent writers merging the same clusters agree.
+        """
+        clusters = _UnionFind()
+        group_found: dict[int, UUID] = {}
+
+        for group, cluster_uuid in found:
+            group_found[group] = clusters.union(group_found.setdefault(group, cluster_uuid), cluster_uuid)
+
+        group_uuids = [
+            clusters.find(group_found[group]) if group in group_found else uuid4()
+            for group in range(len(group_pairs))
+        ]
+        aliases = {cluster_uuid for _, cluster_uuid in found if clusters.find(cluster_uuid) != cluster_uuid}
+
+        params = {
+            "aliases": _pg_array(aliases),
+            "canonicals": _pg_array(clusters.find(alias) for alias in aliases),
+            "idxs": _pg_array(i for pairs in group_pairs for i, _ in pairs),
+            "hashes": _pg_array(h for pairs in group_pairs for _, h in pairs),
+            "uuids": _pg_array(group_uuids[group] for group, pairs in enumerate(group_pairs) for _ in pairs),
+            **self._tenant_params(),
+        }
+
+        return group_uuids, params
+
+    def _query_stmt(self, index: int, band: int) -> Select[tuple[UUID]]:
+        if self._layout == "item":
+            # Without a LIMIT, which would tempt the planner into a sequential scan over the GIN index.
+            encoded = _item_bands([band], [index]).tolist()
+            return select(self._table.c.cluster_uuid).where(self._table.c.bands.overlap(encoded))
+
+        if self._merge_table is not None:
+            return (
+                select(func.coalesce(self._merge_table.c.canonical_uuid, self._table.c.cluster_uuid))
+                .select_from(
+                    self._table.outerjoin(
+                        self._merge_table, self._merge_table.c.cluster_uuid == self._table.c.cluster_uuid
+                    )
+                )
+                .where(
+                    self._table.c.band_idx == index,
+                    self._table.c.band_hash == band,
+                    *self._tenant_filter(self._table),
+                )
+                .limit(1)
+            )
+
+        return (
+            select(self._table.c.cluster_uuid)
+            .where(self._table.c.band_idx == index, self._table.c.band_hash == band, *self._tenant_filter(self._table))
+            .limit(1)
+        )
+
+    def _resolve_stmt(self, cluster_uuid: UUID) -> Select[tuple[UUID]]:
+        assert self._merge_table is not None
+        canonical = (
+            select(self._merge_table.c.canonical_uuid)
+            .where(self._merge_table.c.cluster_uuid == cluster_uuid)
+            .scalar_subquery()
+        )
+
+        return select(func.coalesce(canonical, cluster_uuid))
+
+    def tenant(self, tenant: str) -> Self:
+        """
+        Returns a view of the backend scoped to one tenant, which shares its engine and statements. Requires
+        `partition_by="tenant"`. Views are cached, so this is cheap to call per request.
+        """
+        if self._partition_by != "tenant":
+            raise ValueError('tenant requires a backend built with partition_by="tenant"')
+
+        if (view := self._tenants.get(tenant)) is None:
+            view = copy.copy(self)
+            view._tenant = tenant
+            view = self._tenants.setdefault(tenant, view)
+
+        return view
+
+    def _partition_name(self, tenant: str, table: Table | None = None) -> str:
+        return f"{(self._table if table is None else table).name}_tenant_{xxhash.xxh64_hexdigest(tenant.encode())}"
+
+    @property
+    def _tenant_tables(self) -> list[Table]:
+        """
+        The index table, then the side tables holding rows of a tenant, which all have a partition per tenant.
+        """
+        return [table for table in (self._table, self._fingerprint_table, self._signature_table) if table is not None]
+
+    def _partition_bounds(self, tenant: str) -> str:
+        literal = String().literal_processor(postgresql.dialect())
+        assert literal is not None
+
+        return f"FOR VALUES IN ({literal(tenant)})"
+
+    def _partition_state_stmt(self, tenant: str) -> TextClause:
+        """
+        Reads whether the partition of a tenant is present and attached, for every table of `_tenant_tables`.
+        """
+        if self._partition_by != "tenant":
+            raise ValueError('Tenant partitions require a backend built with partition_by="tenant"')
 
-        with self._engine.begin() as conn:
+        return text(textwrap.dedent("""
+            SELECT to_regclass(p.name) IS NOT NULL AS present,
+                EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(p.name)) AS attached
+            FROM unnest(CAST(CAST(:names AS text) AS text[])) WITH ORDINALITY AS p(name, ord)
+            ORDER BY p.ord
+        """)).bindparams(names=_pg_array(self._partition_name(tenant, table) for table in self._tenant_tables))
+
+    def _attach_stmts(self, tenant: str, states: Iterable[tuple[bool, bool]]) -> list[Executable]:
+        stmts: list[Executable] = []
+
+        for table, (present, attached) in zip(self._tenant_tables, states):
+            partition, bounds = self._partition_name(tenant, table), self._partition_bounds(tenant)
+
+            if present and not attached:
+                stmts.append(text(f"ALTER TABLE {table.name} ATTACH PARTITION {partition} {bounds}"))
+            elif not present:
+                stmts.append(text(f"CREATE TABLE {partition} PARTITION OF {table.name} {bounds}"))
+
+        return stmts
+
+    def _detach_stmts(self, tenant: str, states: Iterable[tuple[bool, bool]], drop: bool) -> list[Executable]:
+        stmts: list[Executable] = []
+
+        for table, (_, attached) in zip(self._tenant_tables, states):
+            partition = self._partition_name(tenant, table)
+
+            if attached:
+                stmts.append(text(f"ALTER TABLE {table.name} DETACH PARTITION {partition}"))
+
+            if drop:
+                stmts.append(text(f"DROP TABLE IF EXISTS {partition}"))
+
+        return stmts
+
+
+class SQLAlchemyBackend(_SQLAlchemyIndex, Backend):
+    def __init__(
+        self,
+        *,
+        engine: Engine,
+        base_or_metadata: type[DeclarativeBase] | MetaData,
+        table_name: str,
+        fingerprints: bool = False,
+        signatures: bool = False,
+        merge: bool = False,
+        partition_by: Literal["tenant", "band_idx"] | None = None,
+        band_partitions: int = 8,
+        layout: Literal["band", "item"] = "band",
+        prepared: bool = False,
+        consistent: bool = False,
+    ) -> None:
+        """
+        The SQLAlchemy backend for the deduplication indexing layer.
+
+        Note that this expects a PostgreSQL engine to be provided. You should put this where you
+        define your schemas in order to register the table backing this index into your Alembic
+        migrations.
+
+        Args:
+            base (type[DeclarativeBase] | MetaData): Any SQLAlchemy base, registry, or MetaData
+                object. Must expose a `.metadata` attribute or be a MetaData instance.
+            table_name (str): Name of the deduplication index table.
+            fingerprints (bool): Whether to persist exact content fingerprints in a `<table_name>_fingerprint` side
+                table, so that exact duplicates skip band work across processes and restarts. See
+                `DedupIndex.query` for details.
+            signatures (bool): Whether to store the compact signature of a representative of each cluster in a
+                `<table_name>_signature` side table, which `DedupIndex.query` verifies candidate clusters against
+                when given a `verify_threshold`. See `DedupIndex` for details.
+            merge (bool): Whether to merge the clusters an item's bands bridge, instead of keeping the first one
+                found. Merges are recorded in a `<table_name>_merge` equivalence table and resolved to the canonical
+                cluster, the smallest UUID, whenever clusters are read. Writers which merge clusters take turns on
+                an advisory lock, so that reads always resolve to the canonical cluster. `compact` rewrites stored
+                clusters to canonical ones in batches.
+            partition_by (str | None): How to partition the index table. `"tenant"` adds a `tenant` column and
+                partitions by `LIST (tenant)`, with one partition per tenant created by `attach_tenant` and dropped
+                by `detach_tenant`. Every statement then carries the tenant, so that it only touches the tenant's
+                partition, and the backend is used through `tenant` or the `tenant=` arguments of `DedupIndex`.
+                `"band_idx"` partitions by `HASH (band_idx)` into `band_partitions` partitions created along with
+                the table, which keeps each partition and its unique index smaller.
+            band_partitions (int): The number of partitions of `partition_by="band_idx"`.
+            layout (str): How to store bands. `"band"` stores one row per `(band_idx, band_hash)` under a unique
+                index. `"item"` stores one row per cluster member with all of its bands in a `bigint[]` under a GIN
+                index, which is queried with `&&`. The item layout keeps far fewer rows, but lacks a unique index,
+                so concurrent writers of overlapping new items may create separate clusters. It does not support
+                `merge`, `partition_by` or `bulk_load`.
+            prepared (bool): Whether to run writes as single autocommit statements, with the bands of an item
+                bound as one array, prepared once per connection. psycopg2 connections get an explicit PREPARE,
+                while psycopg 3 and asyncpg prepare statements by themselves. Each connection also turns off
+                `synchronous_commit` and generic plans once for its whole session rather than per transaction,
+                which then applies to anything else run on the engine, so use an engine dedicated to the index.
+                It does not support `merge` or `layout="item"`.
+            consistent (bool): Whether concurrent writers of overlapping new items always agree on one cluster.
+                By default, two writers which both find no existing cluster keep the one they proposed, and the
+                bands of the later one are dropped, which splits near-duplicates across clusters. Consistent writes
+                wait for the writer holding a band and join its cluster instead, at the cost of locking the rows of
+                bands which already existed. It does not support `merge`, `prepared` or `layout="item"`.
+        """
+        super().__init__(
+            base_or_metadata=base_or_metadata,
+            table_name=table_name,
+            fingerprints=fingerprints,
+            signatures=signatures,
+            merge=merge,
+            partition_by=partition_by,
+            band_partitions=band_partitions,
+            layout=layout,
+            prepared=prepared,
+            consistent=consistent,
+        )
+        self._engine = engine
+        self._explicit_prepare = prepared and engine.dialect.driver == "psycopg2"
+
+    def _begin(self) -> AbstractContextManager[Connection]:
+        return self._engine.begin() if self._instrumentation is None else self._checkout(self._engine.begin)
+
+    @contextmanager
+    def _session(self) -> Iterator[Connection]:
+        """
+        Opens an autocommit connection for prepared writes, setting up its session on first use. Session state
+        lasts as long as the pooled connection, and is tracked in the connection's `info`.
+        """
+        with self._connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            info = conn.connection.info
+
+            if self._session_key not in info:
+                for stmt in self._session_stmts:
+                    _ = conn.execute(stmt)
+
+                info[self._session_key] = True
+
+            yield conn
+
+    def _connect(self) -> AbstractContextManager[Connection]:
+        return self._engine.connect() if self._instrumentation is None else self._checkout(self._engine.connect)
+
+    @contextmanager
+    def _checkout(self, open_connection: Callable[[], AbstractContextManager[Connection]]) -> Iterator[Connection]:
+        # Connections are checked out of the pool when the context is entered, before any statement is sent.
+        assert self._instrumentation is not None
+        start = time.perf_counter()
+
+        with open_connection() as conn:
+            self._instrumentation.on_pool_wait(time.perf_counter() - start)
+            yield conn
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        if self._insert_stmt is None:
+            raise RuntimeError("SQLAlchemyBackend must be used through an DedupIndex.")
+
+        if self._merge_table is not None:
+            return self._insert_many_merged([list(bands)])[0]
+
+        if self._consistent:
+            return self.insert_many([list(bands)])[0]
+
+        params = self._insert_params(bands)
+
+        if self._prepared:
+            assert self._prepared_insert_stmt is not None
+
+            with self._session() as conn:
+                self._ensure_params(conn)
+                cluster_uuid = conn.execute(self._prepared_insert_stmt, params).scalar()
+
+            assert isinstance(cluster_uuid, UUID)
+            self._report_clusters(str(params["new_uuid"]), [cluster_uuid], 1)
+
+            return cluster_uuid
+
+        with self._begin() as conn:
             """
             We don't use this code, but useful for seeing what round-trips that our CTE optimizes.
 
@@ -150,21 +1318,726 @@ class SQLAlchemyBackend(Backend):
             > _ = conn.execute(self._insert_sql, values)
             > conn.commit()
             """
+            self._ensure_params(conn)
             result = conn.execute(self._insert_stmt, params)
             cluster_uuid = result.scalar()
 
         assert isinstance(cluster_uuid, UUID)
+        self._report_clusters(str(params["new_uuid"]), [cluster_uuid], 1)
 
         return cluster_uuid
 
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        return self._insert_many_created(band_matrix)[0]
+
+    def _insert_many_created(self, band_matrix: Iterable[Iterable[int]]) -> tuple[list[UUID], list[bool] | None]:
+        if self._insert_many_stmt is None:
+            raise RuntimeError("SQLAlchemyBackend must be used through an DedupIndex.")
+
+        if self._merge_table is not None:
+            return self._insert_many_merged(band_matrix), None
+
+        doc_groups, params = self._insert_many_params(band_matrix)
+        if not doc_groups:
+            return [], []
+
+        with self._session() if self._prepared else self._begin() as conn:
+            self._ensure_params(conn)
+            result = conn.execute(self._insert_many_cte if self._prepared else self._insert_many_stmt, params)
+
+            if self._consistent:
+                group_uuids, repoint_params = self._settle_races(params, result.tuples().all())
+
+                if repoint_params is not None:
+                    _ = conn.execute(self._repoint_stmt, repoint_params)
+            else:
+                group_uuids = dict(result.tuples().all())
+
+        self._report_clusters(params["new_uuids"], group_uuids.values(), len(doc_groups))
+        doc_uuids = [group_uuids[group] for group in doc_groups]
+
+        # Groups which took the UUID proposed for them found none of their bands indexed, so every band is under it,
+        # barring concurrent writers in the default write mode.
+        proposed = set(params["new_uuids"].strip("{}").split(","))
+        return doc_uuids, [str(cluster_uuid) in proposed for cluster_uuid in doc_uuids]
+
+    def _insert_many_merged(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        doc_groups, group_pairs, params = self._merge_probe_params(band_matrix)
+        if not doc_groups:
+            return []
+
+        with self._begin() as conn:
+            self._ensure_params(conn)
+            found = conn.execute(self._merge_probe_stmt, params).tuples().all()
+            group_uuids, merge_params = self._merge_plan(group_pairs, list(found))
+
+            if merge_params["aliases"] != "{}":
+                _ = conn.execute(self._merge_lock_stmt)
+                found = conn.execute(self._merge_probe_cte, params).tuples().all()
+                group_uuids, merge_params = self._merge_plan(group_pairs, list(found))
+                _ = conn.execute(self._merge_repoint_stmt, merge_params)
+
+            _ = conn.execute(self._merge_insert_stmt, merge_params)
+
+        self._report_merged(group_pairs, list(found), len(doc_groups))
+
+        return [group_uuids[group] for group in doc_groups]
+
     def query(self, index: int, band: int) -> UUID | None:
-        stmt = (
-            select(self._table.c.cluster_uuid)
-            .where(self._table.c.band_idx == index, self._table.c.band_hash == band)
-            .limit(1)
+        with self._begin() as conn:
+            self._ensure_params(conn)
+            result = conn.execute(self._query_stmt(index, band)).scalars().first()
+
+        return result
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        params = self._lookup_params(bands)
+
+        with self._connect() as conn:
+            self._ensure_params(conn, record=False)
+            result = dict(conn.execute(self._lookup_stmt, params).tuples().all())
+
+        return result
+
+    def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        rows = np.asarray(band_matrix, dtype=np.int64)
+
+        if self._layout == "item" or rows.size == 0:
+            return super().lookup_many(rows)
+
+        with self._connect() as conn:
+            self._ensure_params(conn, record=False)
+            result = conn.execute(self._lookup_many_stmt, self._lookup_many_params(rows)).tuples().all()
+
+        return self._lookup_many_result(len(rows), result)
+
+    def resolve(self, cluster_uuid: UUID) -> UUID:
+        if self._merge_table is None:
+            return cluster_uuid
+
+        with self._connect() as conn:
+            result = conn.execute(self._resolve_stmt(cluster_uuid)).scalar_one()
+
+        return result
+
+    def attach_tenant(self, tenant: str) -> None:
+        """
+        Creates the partitions of a tenant in the index table and its fingerprint and signature tables, or attaches
+        them again if they were detached without being dropped. Either is a catalog-only operation. Requires
+        `partition_by="tenant"`.
+        """
+        with self._begin() as conn:
+            states = conn.execute(self._partition_state_stmt(tenant)).tuples().all()
+
+            for stmt in self._attach_stmts(tenant, states):
+                _ = conn.execute(stmt)
+
+    def detach_tenant(self, tenant: str, drop: bool = True) -> None:
+        """
+        Detaches the partitions of a tenant, which removes all of its bands, fingerprints and signatures at once
+        without touching other tenants' rows, and drops them unless `drop` is False. No rows are deleted either way.
+        Requires `partition_by="tenant"`.
+        """
+        with self._begin() as conn:
+            states = conn.execute(self._partition_state_stmt(tenant)).tuples().all()
+
+            for stmt in self._detach_stmts(tenant, states, drop):
+                _ = conn.execute(stmt)
+
+    def compact(self, batch_size: int = 10_000) -> int:
+        """
+        Rewrites the cluster of every band of a merged cluster to its canonical cluster, so that the index no longer
+        depends on the equivalence table to be read correctly. Every batch commits on its own, so compaction can run
+        in a background thread or a scheduled job alongside writers. Merges stay recorded, so `resolve` keeps mapping
+        merged clusters to canonical ones.
+
+        Args:
+            batch_size (int): The maximum number of bands rewritten per transaction.
+
+        Returns:
+            int: The number of bands rewritten.
+        """
+        if self._merge_table is None:
+            return 0
+
+        name, merge_name = self._table.name, self._merge_table.name
+
+        # Merges are serialized, so aliases should point straight at their canonical cluster, but flattening any chain
+        # first keeps the rewrite correct regardless. Canonical clusters are always smaller than their aliases, so
+        # chains cannot cycle.
+        flatten = text(textwrap.dedent(f"""
+            UPDATE {merge_name} m
+            SET canonical_uuid = r.canonical_uuid
+            FROM {merge_name} r
+            WHERE m.canonical_uuid = r.cluster_uuid
+        """))
+        rewrite = text(textwrap.dedent(f"""
+            WITH batch AS (
+                SELECT t.tableoid AS table_id, t.ctid AS row_id, m.canonical_uuid
+                FROM {name} t
+                JOIN {merge_name} m ON m.cluster_uuid = t.cluster_uuid
+                LIMIT :batch_size
+            )
+            UPDATE {name} t
+            SET cluster_uuid = b.canonical_uuid
+            FROM batch b
+            WHERE t.tableoid = b.table_id AND t.ctid = b.row_id
+        """))
+
+        with self._begin() as conn:
+            while conn.execute(flatten).rowcount > 0:
+                pass
+
+        rewritten = 0
+
+        while True:
+            with self._begin() as conn:
+                _ = conn.execute(text("SET LOCAL synchronous_commit = OFF"))
+                count = conn.execute(rewrite, {"batch_size": batch_size}).rowcount
+
+            rewritten += count
+
+            if count < batch_size:
+                return rewritten
+
+    def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        if self._fingerprint_table is None:
+            return None
+
+        with self._connect() as conn:
+            result = conn.execute(self._fingerprint_query_stmt(fingerprint)).scalars().first()
+
+        return result
+
+    def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        if self._fingerprint_table is None:
+            return
+
+        with self._begin() as conn:
+            _ = conn.execute(text("SET LOCAL synchronous_commit = OFF"))
+            _ = conn.execute(self._fingerprint_insert_stmt(fingerprint, cluster_uuid))
+
+    def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        if self._signature_table is None:
+            return {}
+
+        with self._connect() as conn:
+            result = dict(conn.execute(self._signature_query_stmt(cluster_uuids)).tuples().all())
+
+        return result
+
+    def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        if self._signature_table is None or not (signatures := list(signatures)):
+            return
+
+        with self._begin() as conn:
+            _ = conn.execute(text("SET LOCAL synchronous_commit = OFF"))
+            _ = conn.execute(self._signature_insert_stmt(signatures))
+
+    def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        params = {**self._lookup_params(bands), "cluster_uuid": str(cluster_uuid)}
+
+        with self._begin() as conn:
+            self._ensure_params(conn)
+            _ = conn.execute(self._insert_into_stmt, params)
+
+    def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        rows = np.asarray(band_matrix, dtype=np.int64)
+
+        if self._layout == "item" or rows.size == 0:
+            return super().insert_into_many(rows, cluster_uuids)
+
+        params = self._insert_into_many_params(rows, list(cluster_uuids))
+
+        with self._begin() as conn:
+            self._ensure_params(conn)
+            _ = conn.execute(self._insert_into_many_stmt, params)
+
+    def bulk_load(
+        self,
+        batches: Iterable[np.ndarray],
+        *,
+        rebuild_index: bool = False,
+        on_batch: Callable[[BulkLoadStats], None] | None = None,
+    ) -> BulkLoadStats:
+        """
+        Backfills the index from batches of bands, such as the output of `DedupIndex.bands_many` over an existing
+        corpus, which is orders of magnitude faster than querying item by item.
+
+        Every batch is streamed through a binary `COPY` into an unlogged staging table and committed on its own, so
+        an interrupted backfill resumes by skipping the batches it already staged when it is given the same batches
+        again. Once every batch is staged, clusters are assigned set-wise with the same semantics as `insert_many`
+        over the whole corpus and merged into the index in a single transaction. The per-item clusters can then be
+        read with `bulk_clusters`. Writers should not run concurrently with a bulk load.
+
+        As the staging tables are unlogged, a server crash empties them together and the backfill restarts from the
+        first batch.
+
+        Args:
+            batches (Iterable[np.ndarray]): Band matrices of shape `(n_items, num_bands)`, in a stable order.
+            rebuild_index (bool): Whether to drop the unique index before merging and rebuild it afterwards, which
+                is faster when the backfill is large relative to the existing index.
+            on_batch (Callable[[BulkLoadStats], None] | None): Called with the running statistics after each batch,
+                for example to report rows per second.
+
+        Returns:
+            BulkLoadStats: The statistics of this run.
+        """
+        if self._insert_stmt is None:
+            raise RuntimeError("SQLAlchemyBackend must be used through an DedupIndex.")
+
+        if self._partition_by == "tenant" or self._layout == "item":
+            raise ValueError('bulk_load does not support partition_by="tenant" or layout="item"')
+
+        name = self._table.name
+        stats = BulkLoadStats()
+        start = time.perf_counter()
+
+        with self._begin() as conn:
+            self._ensure_params(conn)
+            _ = conn.execute(text(textwrap.dedent(f"""
+                CREATE UNLOGGED TABLE IF NOT EXISTS {name}_bulk_stage (
+                    doc bigint NOT NULL,
+                    band_idx smallint NOT NULL,
+                    band_hash bigint NOT NULL
+                );
+                CREATE UNLOGGED TABLE IF NOT EXISTS {name}_bulk_batch (
+                    batch_no integer PRIMARY KEY,
+                    rows bigint NOT NULL
+                );
+                CREATE UNLOGGED TABLE IF NOT EXISTS {name}_bulk_cluster (
+                    doc bigint PRIMARY KEY,
+                    cluster_uuid uuid NOT NULL
+                );
+            """)))
+            staged = set(conn.execute(text(f"SELECT batch_no FROM {name}_bulk_batch")).scalars())
+
+            if not staged:
+                _ = conn.execute(text(f"TRUNCATE {name}_bulk_cluster"))
+
+        copy_sql = f"COPY {name}_bulk_stage (doc, band_idx, band_hash) FROM STDIN WITH (FORMAT binary)"
+
+        for batch_no, band_matrix in enumerate(batches):
+            if batch_no in staged:
+                stats.skipped_batches += 1
+                continue
+
+            band_matrix = np.asarray(band_matrix, dtype=np.int64)
+            payload = _copy_payload(batch_no, band_matrix)
+
+            with self._begin() as conn:
+                _copy_from(conn, copy_sql, payload)
+                _ = conn.execute(
+                    text(f"INSERT INTO {name}_bulk_batch (batch_no, rows) VALUES (:batch_no, :rows)"),
+                    {"batch_no": batch_no, "rows": band_matrix.size},
+                )
+
+            stats.batches += 1
+            stats.rows += band_matrix.size
+            stats.seconds = time.perf_counter() - start
+
+            if on_batch is not None:
+                on_batch(stats)
+
+        self._bulk_merge(rebuild_index)
+        stats.seconds = time.perf_counter() - start
+
+        return stats
+
+    def _bulk_merge(self, rebuild_index: bool) -> None:
+        """
+        Assigns clusters to the staged items set-wise and merges their bands into the index.
+        """
+        name = self._table.name
+
+        with self._begin() as conn:
+            _ = conn.execute(text("SET LOCAL synchronous_commit = OFF"))
+
+            if rebuild_index:
+                _ = conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {self._unique_name}"))
+
+            # Label propagation over shared bands, which converges to one label per connected group of items.
+            _ = conn.execute(text(textwrap.dedent(f"""
+                CREATE TEMP TABLE bulk_label ON COMMIT DROP AS
+                SELECT DISTINCT doc, doc AS label FROM {name}_bulk_stage;
+
+                ALTER TABLE bulk_label ADD PRIMARY KEY (doc);
+                ANALYZE bulk_label;
+            """)))
+
+            propagate = text(textwrap.dedent(f"""
+                WITH band_labels AS (
+                    SELECT s.band_idx, s.band_hash, min(l.label) AS label
+                    FROM {name}_bulk_stage s
+                    JOIN bulk_label l ON l.doc = s.doc
+                    GROUP BY s.band_idx, s.band_hash
+                    HAVING count(*) > 1
+                ),
+                doc_labels AS (
+                    SELECT s.doc, min(b.label) AS label
+                    FROM {name}_bulk_stage s
+                    JOIN band_labels b ON b.band_idx = s.band_idx AND b.band_hash = s.band_hash
+                    GROUP BY s.doc
+                )
+                UPDATE bulk_label l
+                SET label = d.label
+                FROM doc_labels d
+                WHERE l.doc = d.doc AND d.label < l.label
+            """))
+
+            while conn.execute(propagate).rowcount > 0:
+                pass
+
+            # Each group takes the cluster of its earliest already-indexed band, or a new one.
+            _ = conn.execute(text(textwrap.dedent(f"""
+                CREATE TEMP TABLE bulk_chosen ON COMMIT DROP AS
+                SELECT DISTINCT ON (l.label) l.label, t.cluster_uuid
+                FROM {name}_bulk_stage s
+                JOIN bulk_label l ON l.doc = s.doc
+                JOIN {name} t ON t.band_idx = s.band_idx AND t.band_hash = s.band_hash
+                ORDER BY l.label, s.doc, s.band_idx;
+
+                INSERT INTO bulk_chosen (label, cluster_uuid)
+                SELECT l.label, gen_random_uuid()
+                FROM (SELECT DISTINCT label FROM bulk_label) l
+                WHERE NOT EXISTS (SELECT 1 FROM bulk_chosen c WHERE c.label = l.label);
+
+                INSERT INTO {name} (band_idx, band_hash, cluster_uuid)
+                SELECT DISTINCT ON (s.band_idx, s.band_hash) s.band_idx, s.band_hash, c.cluster_uuid
+                FROM {name}_bulk_stage s
+                JOIN bulk_label l ON l.doc = s.doc
+                JOIN bulk_chosen c ON c.label = l.label
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {name} t WHERE t.band_idx = s.band_idx AND t.band_hash = s.band_hash
+                )
+                ON CONFLICT DO NOTHING;
+
+                INSERT INTO {name}_bulk_cluster (doc, cluster_uuid)
+                SELECT l.doc, c.cluster_uuid
+                FROM bulk_label l
+                JOIN bulk_chosen c ON c.label = l.label;
+
+                TRUNCATE {name}_bulk_stage, {name}_bulk_batch;
+            """)))
+
+            if rebuild_index:
+                _ = conn.execute(text(
+                    f"ALTER TABLE {name} ADD CONSTRAINT {self._unique_name} UNIQUE (band_idx, band_hash)"
+                ))
+
+    def bulk_clusters(self, yield_per: int = 10_000) -> Iterator[tuple[int, int, UUID]]:
+        """
+        Streams the clusters assigned by the last `bulk_load`.
+
+        Args:
+            yield_per (int): The number of rows fetched per round trip.
+
+        Returns:
+            Iterator[tuple[int, int, UUID]]: `(batch_no, row, cluster_uuid)` for every item, in batch order.
+        """
+        stmt = text(f"SELECT doc, cluster_uuid FROM {self._table.name}_bulk_cluster ORDER BY doc")
+
+        with self._connect() as conn:
+            for doc, cluster_uuid in conn.execution_options(yield_per=yield_per).execute(stmt):
+                yield doc >> 32, doc & 0xFFFFFFFF, cluster_uuid
+
+    def bulk_reset(self) -> None:
+        """
+        Drops the staging tables of `bulk_load`, discarding any interrupted run and the last assigned clusters.
+        """
+        name = self._table.name
+
+        with self._begin() as conn:
+            _ = conn.execute(text(
+                f"DROP TABLE IF EXISTS {name}_bulk_stage, {name}_bulk_batch, {name}_bulk_cluster"
+            ))
+
+
+class AsyncSQLAlchemyBackend(_SQLAlchemyIndex, AsyncBackend):
+    def __init__(
+        self,
+        *,
+        engine: AsyncEngine,
+        base_or_metadata: type[DeclarativeBase] | MetaData,
+        table_name: str,
+        fingerprints: bool = False,
+        signatures: bool = False,
+        merge: bool = False,
+        partition_by: Literal["tenant", "band_idx"] | None = None,
+        band_partitions: int = 8,
+        layout: Literal["band", "item"] = "band",
+        prepared: bool = False,
+        consistent: bool = False,
+    ) -> None:
+        """
+        The asynchronous SQLAlchemy backend for the deduplication indexing layer, to be used with the `a`-prefixed
+        methods of `DedupIndex`.
+
+        Note that this expects an async PostgreSQL engine, such as `postgresql+asyncpg` or `postgresql+psycopg`. It
+        shares its table definition and precompiled statements with `SQLAlchemyBackend`, so both can serve the same
+        index table.
+
+        Args:
+            engine (AsyncEngine): The async engine to run statements with.
+            base (type[DeclarativeBase] | MetaData): Any SQLAlchemy base, registry, or MetaData
+                object. Must expose a `.metadata` attribute or be a MetaData instance.
+            table_name (str): Name of the deduplication index table.
+            fingerprints (bool): Whether to persist exact content fingerprints in a `<table_name>_fingerprint` side
+                table. See `SQLAlchemyBackend` for details.
+            signatures (bool): Whether to store cluster signatures in a `<table_name>_signature` side table. See
+                `SQLAlchemyBackend` for details.
+            merge (bool): Whether to merge the clusters an item's bands bridge. See `SQLAlchemyBackend` for details.
+            partition_by (str | None): How to partition the index table. See `SQLAlchemyBackend` for details.
+            band_partitions (int): The number of partitions of `partition_by="band_idx"`.
+            layout (str): How to store bands. See `SQLAlchemyBackend` for details.
+            prepared (bool): Whether to run prepared, autocommit writes. See `SQLAlchemyBackend` for details.
+            consistent (bool): Whether concurrent writers always agree on one cluster. See `SQLAlchemyBackend` for
+                details.
+        """
+        super().__init__(
+            base_or_metadata=base_or_metadata,
+            table_name=table_name,
+            fingerprints=fingerprints,
+            signatures=signatures,
+            merge=merge,
+            partition_by=partition_by,
+            band_partitions=band_partitions,
+            layout=layout,
+            prepared=prepared,
+            consistent=consistent,
         )
+        self._engine = engine
+
+        # Async drivers use the extended query protocol, which cannot carry several statements at once, so the
+        # commit setting is sent ahead of the shared CTE.
+        self._synchronous_commit_stmt = text(SYNCHRONOUS_COMMIT_OFF)
+
+    def _begin(self) -> AbstractAsyncContextManager[AsyncConnection]:
+        return self._engine.begin() if self._instrumentation is None else self._checkout(self._engine.begin)
+
+    def _connect(self) -> AbstractAsyncContextManager[AsyncConnection]:
+        return self._engine.connect() if self._instrumentation is None else self._checkout(self._engine.connect)
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Asynchronous version of `SQLAlchemyBackend._session`.
+        """
+        async with self._connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            info = (await conn.get_raw_connection()).info
+
+            if self._session_key not in info:
+                for stmt in self._session_stmts:
+                    _ = await conn.execute(stmt)
+
+                info[self._session_key] = True
+
+            yield conn
+
+    @asynccontextmanager
+    async def _checkout(
+        self, open_connection: Callable[[], AbstractAsyncContextManager[AsyncConnection]]
+    ) -> AsyncIterator[AsyncConnection]:
+        assert self._instrumentation is not None
+        start = time.perf_counter()
+
+        async with open_connection() as conn:
+            self._instrumentation.on_pool_wait(time.perf_counter() - start)
+            yield conn
+
+    async def insert(self, bands: Iterable[int]) -> UUID:
+        if self._insert_cte is None:
+            raise RuntimeError("AsyncSQLAlchemyBackend must be used through an DedupIndex.")
+
+        if self._merge_table is not None:
+            return (await self._insert_many_merged([list(bands)]))[0]
+
+        if self._consistent:
+            return (await self.insert_many([list(bands)]))[0]
+
+        params = self._insert_params(bands)
 
-        with self._engine.begin() as conn:
-            result = conn.execute(stmt).scalars().first()
+        if self._prepared:
+            assert self._prepared_insert_stmt is not None
+
+            async with self._session() as conn:
+                await self._aensure_params(conn)
+                cluster_uuid = (await conn.execute(self._prepared_insert_stmt, params)).scalar()
+        else:
+            async with self._begin() as conn:
+                await self._aensure_params(conn)
+                _ = await conn.execute(self._synchronous_commit_stmt)
+                result = await conn.execute(self._insert_cte, params)
+                cluster_uuid = result.scalar()
+
+        assert isinstance(cluster_uuid, UUID)
+        self._report_clusters(str(params["new_uuid"]), [cluster_uuid], 1)
+
+        return cluster_uuid
+
+    async def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        if self._insert_many_cte is None:
+            raise RuntimeError("AsyncSQLAlchemyBackend must be used through an DedupIndex.")
+
+        if self._merge_table is not None:
+            return await self._insert_many_merged(band_matrix)
+
+        doc_groups, params = self._insert_many_params(band_matrix)
+        if not doc_groups:
+            return []
+
+        async with self._session() if self._prepared else self._begin() as conn:
+            await self._aensure_params(conn)
+
+            if not self._prepared:
+                _ = await conn.execute(self._synchronous_commit_stmt)
+
+            result = await conn.execute(self._insert_many_cte, params)
+
+            if self._consistent:
+                group_uuids, repoint_params = self._settle_races(params, result.tuples().all())
+
+                if repoint_params is not None:
+                    _ = await conn.execute(self._repoint_stmt, repoint_params)
+            else:
+                group_uuids = dict(result.tuples().all())
+
+        self._report_clusters(params["new_uuids"], group_uuids.values(), len(doc_groups))
+
+        return [group_uuids[group] for group in doc_groups]
+
+    async def _insert_many_merged(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        doc_groups, group_pairs, params = self._merge_probe_params(band_matrix)
+        if not doc_groups:
+            return []
+
+        async with self._begin() as conn:
+            await self._aensure_params(conn)
+            _ = await conn.execute(self._synchronous_commit_stmt)
+            found = (await conn.execute(self._merge_probe_cte, params)).tuples().all()
+            group_uuids, merge_params = self._merge_plan(group_pairs, list(found))
+
+            if merge_params["aliases"] != "{}":
+                _ = await conn.execute(self._merge_lock_stmt)
+                found = (await conn.execute(self._merge_probe_cte, params)).tuples().all()
+                group_uuids, merge_params = self._merge_plan(group_pairs, list(found))
+                _ = await conn.execute(self._merge_repoint_stmt, merge_params)
+
+            _ = await conn.execute(self._merge_insert_stmt, merge_params)
+
+        self._report_merged(group_pairs, list(found), len(doc_groups))
+
+        return [group_uuids[group] for group in doc_groups]
+
+    async def query(self, index: int, band: int) -> UUID | None:
+        async with self._begin() as conn:
+            await self._aensure_params(conn)
+            result = (await conn.execute(self._query_stmt(index, band))).scalars().first()
 
         return result
+
+    async def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        params = self._lookup_params(bands)
+
+        async with self._connect() as conn:
+            await self._aensure_params(conn, record=False)
+            result = dict((await conn.execute(self._lookup_stmt, params)).tuples().all())
+
+        return result
+
+    async def lookup_many(self, band_matrix: Iterable[Iterable[int]]) -> list[dict[UUID, int]]:
+        rows = np.asarray(band_matrix, dtype=np.int64)
+
+        if self._layout == "item" or rows.size == 0:
+            return await super().lookup_many(rows)
+
+        async with self._connect() as conn:
+            await self._aensure_params(conn, record=False)
+            result = (await conn.execute(self._lookup_many_stmt, self._lookup_many_params(rows))).tuples().all()
+
+        return self._lookup_many_result(len(rows), result)
+
+    async def resolve(self, cluster_uuid: UUID) -> UUID:
+        if self._merge_table is None:
+            return cluster_uuid
+
+        async with self._connect() as conn:
+            result = (await conn.execute(self._resolve_stmt(cluster_uuid))).scalar_one()
+
+        return result
+
+    async def attach_tenant(self, tenant: str) -> None:
+        """
+        Creates or reattaches the partition of a tenant. See `SQLAlchemyBackend.attach_tenant` for details.
+        """
+        async with self._begin() as conn:
+            states = (await conn.execute(self._partition_state_stmt(tenant))).tuples().all()
+
+            for stmt in self._attach_stmts(tenant, states):
+                _ = await conn.execute(stmt)
+
+    async def detach_tenant(self, tenant: str, drop: bool = True) -> None:
+        """
+        Detaches and drops the partition of a tenant. See `SQLAlchemyBackend.detach_tenant` for details.
+        """
+        async with self._begin() as conn:
+            states = (await conn.execute(self._partition_state_stmt(tenant))).tuples().all()
+
+            for stmt in self._detach_stmts(tenant, states, drop):
+                _ = await conn.execute(stmt)
+
+    async def query_fingerprint(self, fingerprint: bytes) -> UUID | None:
+        if self._fingerprint_table is None:
+            return None
+
+        async with self._connect() as conn:
+            result = (await conn.execute(self._fingerprint_query_stmt(fingerprint))).scalars().first()
+
+        return result
+
+    async def insert_fingerprint(self, fingerprint: bytes, cluster_uuid: UUID) -> None:
+        if self._fingerprint_table is None:
+            return
+
+        async with self._begin() as conn:
+            _ = await conn.execute(self._synchronous_commit_stmt)
+            _ = await conn.execute(self._fingerprint_insert_stmt(fingerprint, cluster_uuid))
+
+    async def query_signatures(self, cluster_uuids: Iterable[UUID]) -> dict[UUID, bytes]:
+        if self._signature_table is None:
+            return {}
+
+        async with self._connect() as conn:
+            result = dict((await conn.execute(self._signature_query_stmt(cluster_uuids))).tuples().all())
+
+        return result
+
+    async def insert_signatures(self, signatures: Iterable[tuple[UUID, bytes]]) -> None:
+        if self._signature_table is None or not (signatures := list(signatures)):
+            return
+
+        async with self._begin() as conn:
+            _ = await conn.execute(self._synchronous_commit_stmt)
+            _ = await conn.execute(self._signature_insert_stmt(signatures))
+
+    async def insert_into(self, bands: Iterable[int], cluster_uuid: UUID) -> None:
+        params = {**self._lookup_params(bands), "cluster_uuid": str(cluster_uuid)}
+
+        async with self._begin() as conn:
+            await self._aensure_params(conn)
+            _ = await conn.execute(self._synchronous_commit_stmt)
+            _ = await conn.execute(self._insert_into_cte, params)
+
+    async def insert_into_many(self, band_matrix: Iterable[Iterable[int]], cluster_uuids: Iterable[UUID]) -> None:
+        rows = np.asarray(band_matrix, dtype=np.int64)
+
+        if self._layout == "item" or rows.size == 0:
+            return await super().insert_into_many(rows, cluster_uuids)
+
+        params = self._insert_into_many_params(rows, list(cluster_uuids))
+
+        async with self._begin() as conn:
+            await self._aensure_params(conn)
+            _ = await conn.execute(self._synchronous_commit_stmt)
+            _ = await conn.execute(self._insert_into_many_cte, params)
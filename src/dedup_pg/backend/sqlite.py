@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import textwrap
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Literal
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from dedup_pg.backend.backend import Backend, _check_params, _group_batch
+
+
+class SQLiteBackend(Backend):
+    def __init__(
+        self,
+        path: str | os.PathLike[str] = ":memory:",
+        table_name: str = "lsh_index",
+        synchronous: Literal["OFF", "NORMAL", "FULL"] = "NORMAL",
+        cache_bytes: int = 64 << 20,
+    ) -> None:
+        """
+        A persistent single-node backend on the standard library's `sqlite3`, for edge deployments and CI where
+        Postgres is not available.
+
+        Bands live in a `WITHOUT ROWID` table keyed on `(band_idx, band_hash)`, so that the primary key is the table
+        itself and a probe is a single B-tree search. Databases on disk use write-ahead logging, which lets readers
+        in other processes proceed while a write commits. Every insert is a single upsert statement, equivalent to
+        the CTE of the SQLAlchemy backends. Writes outside of `batch` commit one by one, while writes inside it share
+        one transaction and one commit.
+
+        The backend is safe to share between threads, which take turns on its connection.
+
+        Args:
+            path (str | os.PathLike[str]): The database file, created if missing. Defaults to an in-memory database,
+                which is lost when the backend is closed.
+            table_name (str): Name of the deduplication index table.
+            synchronous (Literal["OFF", "NORMAL", "FULL"]): How often SQLite waits for the disk. With write-ahead
+                logging, `"NORMAL"` only syncs on checkpoints, so a power loss may forget the last commits but never
+                corrupts the database, while `"FULL"` syncs every commit.
+            cache_bytes (int): The size of the page cache of the connection. Band hashes are random, so inserts
+                touch pages all over the table, and a cache smaller than the hot part of the table halves throughput.
+        """
+        if synchronous not in ("OFF", "NORMAL", "FULL"):
+            raise ValueError('synchronous must be "OFF", "NORMAL" or "FULL"')
+
+        # Transactions are managed explicitly, so that `batch` decides when to commit.
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._table_name = table_name
+        self._params: dict[str, int | str] | None = None
+
+        _ = self._conn.execute("PRAGMA journal_mode = WAL")
+        _ = self._conn.execute(f"PRAGMA synchronous = {synchronous}")
+        _ = self._conn.execute(f"PRAGMA cache_size = {-(cache_bytes // 1024)}")
+
+        with self.batch():
+            _ = self._conn.execute(textwrap.dedent(f"""
+                CREATE TABLE IF NOT EXISTS {table_name} (
+                    band_idx INTEGER NOT NULL,
+                    band_hash INTEGER NOT NULL,
+                    cluster_uuid BLOB NOT NULL,
+                    PRIMARY KEY (band_idx, band_hash)
+                ) WITHOUT ROWID
+            """))
+            _ = self._conn.execute(textwrap.dedent(f"""
+                CREATE TABLE IF NOT EXISTS {table_name}_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                ) WITHOUT ROWID
+            """))
+
+        # Groups of items of a batch have any number of bands, which are bound as one JSON array of
+        # `[band_idx, band_hash]` pairs so that they share one statement. Single items use `_insert_item_sql`.
+        self._insert_sql = self._upsert_sql(textwrap.dedent("""\
+            SELECT json_extract(j.value, '$[0]') AS idx, json_extract(j.value, '$[1]') AS hash, j.key AS ord
+            FROM json_each(:pairs) j"""))
+        self._insert_item_sql: str | None = None
+        self._num_bands = 0
+        self._first_cluster_sql = f"SELECT cluster_uuid FROM {table_name} WHERE band_idx = ? AND band_hash = ?"
+        self._lookup_sql = textwrap.dedent(f"""
+            SELECT t.cluster_uuid, count(*) AS bands
+            FROM json_each(:pairs) j
+            JOIN {table_name} t
+                ON t.band_idx = json_extract(j.value, '$[0]') AND t.band_hash = json_extract(j.value, '$[1]')
+            GROUP BY t.cluster_uuid
+            ORDER BY bands DESC, t.cluster_uuid
+        """)
+
+    def _upsert_sql(self, vals: str) -> str:
+        """
+        The single-statement upsert of the bands selected by `vals` as `(idx, hash, ord)`. The earliest indexed band
+        gives the cluster of the item, and the others are inserted into it. Only inserted bands are returned, so an
+        item whose bands are all indexed already returns nothing and is resolved by `_first_cluster_sql`.
+        """
+        vals = textwrap.indent(vals, " " * 16).lstrip()
+        table_name = self._table_name
+
+        return textwrap.dedent(f"""
+            WITH vals(idx, hash, ord) AS (
+                {vals}
+            ),
+            chosen AS (
+                SELECT COALESCE((
+                    SELECT t.cluster_uuid
+                    FROM vals v
+                    JOIN {table_name} t ON t.band_idx = v.idx AND t.band_hash = v.hash
+                    ORDER BY v.ord
+                    LIMIT 1
+                ), :new_uuid) AS uuid
+            )
+            INSERT INTO {table_name} (band_idx, band_hash, cluster_uuid)
+            SELECT v.idx, v.hash, chosen.uuid
+            FROM vals v, chosen
+            WHERE true
+            ON CONFLICT DO NOTHING
+            RETURNING cluster_uuid
+        """)
+
+    def _init_internal(self, num_bands: int) -> None:
+        # Binding the bands of an item as parameters of a VALUES list is cheaper than parsing JSON.
+        values = ",\n".join(f"(:i{i}, :h{i}, {i})" for i in range(num_bands))
+        self._insert_item_sql = self._upsert_sql(f"VALUES\n{textwrap.indent(values, '    ')}")
+        self._num_bands = num_bands
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Runs every write made within the context in one transaction, committed once on exit, or rolled back if the
+        context raises. Batches nest, and only the outermost one commits. Other threads wait for the batch to end.
+        """
+        with self._lock:
+            if self._depth > 0:
+                self._depth += 1
+
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+
+                return
+
+            # Taking the write lock upfront keeps concurrent processes from deadlocking on a lock upgrade.
+            _ = self._conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+
+            try:
+                yield
+            except BaseException:
+                _ = self._conn.execute("ROLLBACK")
+                raise
+            else:
+                _ = self._conn.execute("COMMIT")
+            finally:
+                self._depth = 0
+
+    def close(self) -> None:
+        """
+        Closes the connection to the database.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def _insert_pairs(self, pairs: list[tuple[int, int]]) -> tuple[UUID, bool]:
+        """
+        Indexes the `(band_idx, band_hash)` pairs of an item, returning its cluster and whether it is new. Must be
+        called within a batch.
+        """
+        new_uuid = uuid4()
+
+        if self._insert_item_sql is not None and len(pairs) == self._num_bands:
+            sql = self._insert_item_sql
+            params = {"new_uuid": new_uuid.bytes}
+
+            for i, (index, band) in enumerate(pairs):
+                params[f"i{i}"] = index
+                params[f"h{i}"] = band
+        else:
+            sql = self._insert_sql
+            params = {"pairs": json.dumps(pairs), "new_uuid": new_uuid.bytes}
+
+        # Every inserted band carries the chosen cluster. Reading them all finishes the statement.
+        if rows := self._conn.execute(sql, params).fetchall():
+            cluster_uuid = UUID(bytes=rows[0][0])
+        elif pairs:
+            cluster_uuid = UUID(bytes=self._conn.execute(self._first_cluster_sql, pairs[0]).fetchone()[0])
+        else:
+            return new_uuid, True
+
+        return cluster_uuid, cluster_uuid == new_uuid
+
+    def insert(self, bands: Iterable[int]) -> UUID:
+        with self.batch():
+            cluster_uuid, new = self._insert_pairs([(index, int(band)) for index, band in enumerate(bands)])
+
+        if self._instrumentation is not None:
+            self._instrumentation.on_clusters(int(new), int(not new))
+
+        return cluster_uuid
+
+    def insert_many(self, band_matrix: Iterable[Iterable[int]]) -> list[UUID]:
+        return self._insert_many_created(band_matrix)[0]
+
+    def _insert_many_created(self, band_matrix: Iterable[Iterable[int]]) -> tuple[list[UUID], list[bool] | None]:
+        doc_groups, group_pairs = _group_batch(np.asarray(band_matrix, dtype=np.int64))
+
+        with self.batch():
+            inserted = [self._insert_pairs(pairs) for pairs in group_pairs]
+
+        if self._instrumentation is not None:
+            new = sum(new for _, new in inserted)
+            self._instrumentation.on_clusters(new, len(doc_groups) - new)
+
+        return [inserted[group][0] for group in doc_groups], [inserted[group][1] for group in doc_groups]
+
+    def query(self, index: int, band: int) -> UUID | None:
+        with self._lock:
+            row = self._conn.execute(self._first_cluster_sql, (index, int(band))).fetchone()
+
+        return None if row is None else UUID(bytes=row[0])
+
+    def lookup(self, bands: Iterable[int]) -> dict[UUID, int]:
+        params = {"pairs": json.dumps([(index, int(band)) for index, band in enumerate(bands)])}
+
+        with self._lock:
+            rows = self._conn.execute(self._lookup_sql, params).fetchall()
+
+        return {UUID(bytes=cluster_uuid): count for cluster_uuid, count in rows}
+
+    def _bind_params(self, params: dict[str, int | str]) -> None:
+        """
+        Records the index parameters in the database on first use, or checks them against the recorded ones.
+        """
+        expected = {key: str(value) for key, value in params.items()}
+
+        with self.batch():
+            _ = self._conn.executemany(
+                f"INSERT INTO {self._table_name}_meta (key, value) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                list(expected.items()),
+            )
+            recorded = dict(self._conn.execute(f"SELECT key, value FROM {self._table_name}_meta").fetchall())
+            _check_params({key: recorded[key] for key in expected}, expected)
+
+        self._params = params
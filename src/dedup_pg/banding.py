@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+INTEGRATION_POINTS = 1025 # grid points per side of the threshold
+ERROR_SLACK = 1.25 # default target error, relative to the lowest weighted error within the limits
+
+
+@dataclass(frozen=True)
+class Banding:
+    """
+    The expected behavior of a banding at a Jaccard similarity threshold. Error rates integrate the LSH S-curve,
+    the probability `1 - (1 - s ** rows) ** num_bands` that two items of similarity `s` share a band, over
+    similarities below and above the threshold.
+
+    Attributes:
+        num_perms (int): The number of permutation functions of item signatures.
+        rows (int): The number of signature rows per band.
+        threshold (float): The Jaccard similarity above which items should share a cluster.
+        false_positive (float): The integrated probability of sharing a band below the threshold.
+        false_negative (float): The integrated probability of sharing no band above the threshold.
+    """
+    num_perms: int
+    rows: int
+    threshold: float
+    false_positive: float
+    false_negative: float
+
+    @property
+    def num_bands(self) -> int:
+        return self.num_perms // self.rows
+
+    @property
+    def rows_per_item(self) -> int:
+        """
+        The number of index rows written per item by backends storing one row per band.
+        """
+        return self.num_bands
+
+    def error(self, fp_weight: float = 0.5, fn_weight: float = 0.5) -> float:
+        """
+        The weighted sum of the false positive and false negative rates.
+        """
+        return fp_weight * self.false_positive + fn_weight * self.false_negative
+
+
+def collision_probability(similarity: float | np.ndarray, num_bands: int, rows: int) -> float | np.ndarray:
+    """
+    The probability that two items of a given Jaccard similarity share at least one band.
+    """
+    return 1 - (1 - np.power(similarity, rows)) ** num_bands
+
+
+def _error_rates(threshold: float, num_bands: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Integrates the S-curves of many bandings at once, with the trapezoidal rule.
+    """
+    below = np.linspace(0.0, threshold, INTEGRATION_POINTS)
+    above = np.linspace(threshold, 1.0, INTEGRATION_POINTS)
+    num_bands, rows = num_bands[:, None], rows[:, None]
+
+    false_positive = np.trapezoid(1 - (1 - below ** rows) ** num_bands, below, axis=1)
+    false_negative = np.trapezoid((1 - above ** rows) ** num_bands, above, axis=1)
+
+    return false_positive, false_negative
+
+
+def _check_threshold(threshold: float) -> None:
+    if not 0 < threshold < 1:
+        raise ValueError("The Jaccard threshold must be between 0 and 1, exclusive")
+
+
+def estimate_banding(threshold: float, num_perms: int, rows: int) -> Banding:
+    """
+    Estimates the error rates of a banding at a Jaccard similarity threshold.
+    """
+    _check_threshold(threshold)
+
+    if rows <= 0 or num_perms < rows:
+        raise ValueError("rows must be a positive integer no larger than num_perms")
+
+    false_positive, false_negative = _error_rates(threshold, np.array([num_perms // rows]), np.array([rows]))
+
+    return Banding(num_perms, rows, threshold, float(false_positive[0]), float(false_negative[0]))
+
+
+def choose_banding(
+    threshold: float,
+    fp_weight: float = 0.5,
+    fn_weight: float = 0.5,
+    max_bands: int = 32,
+    max_perms: int = 256,
+    max_error: float | None = None,
+) -> Banding:
+    """
+    Picks the banding for a Jaccard similarity threshold among every `(num_bands, rows)` within the limits.
+
+    Args:
+        threshold (float): The Jaccard similarity above which items should share a cluster.
+        fp_weight (float): The weight of the false positive rate in the error.
+        fn_weight (float): The weight of the false negative rate in the error.
+        max_bands (int): The largest number of bands, which is the number of rows an item costs in the index.
+        max_perms (int): The largest number of permutation functions, which hashing time grows with.
+        max_error (float | None): The largest acceptable weighted error. The banding with the fewest bands within
+            it is picked, and the most accurate one among those. Defaults to `ERROR_SLACK` times the lowest
+            weighted error of any banding within the limits.
+
+    Returns:
+        Banding: The banding picked, with its expected error rates.
+    """
+    _check_threshold(threshold)
+
+    if fp_weight < 0 or fn_weight < 0 or fp_weight + fn_weight <= 0:
+        raise ValueError("fp_weight and fn_weight must be non-negative, and not both zero")
+
+    if max_bands <= 0 or max_perms <= 0:
+        raise ValueError("max_bands and max_perms must be positive integers")
+
+    pairs = [(b, r) for b in range(1, min(max_bands, max_perms) + 1) for r in range(1, max_perms // b + 1)]
+    num_bands = np.array([b for b, _ in pairs])
+    rows = np.array([r for _, r in pairs])
+
+    false_positive, false_negative = _error_rates(threshold, num_bands, rows)
+    errors = fp_weight * false_positive + fn_weight * false_negative
+
+    if max_error is None:
+        max_error = ERROR_SLACK * float(errors.min())
+
+    if not (candidates := np.flatnonzero(errors <= max_error)).size:
+        raise ValueError(
+            f"No banding within max_bands={max_bands} and max_perms={max_perms} has a weighted error of at most "
+            f"{max_error}, the lowest is {errors.min():.4g}"
+        )
+
+    # The fewest bands win, then the lowest error.
+    best = candidates[np.lexsort((errors[candidates], num_bands[candidates]))[0]]
+    b, r = pairs[best]
+
+    return Banding(b * r, r, threshold, float(false_positive[best]), float(false_negative[best]))
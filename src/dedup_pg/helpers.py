@@ -1,3 +1,17 @@
+import unicodedata
+from typing import Literal
+
+import numpy as np
+
+# Code points `str.split` treats as whitespace
+WHITESPACE = np.array(
+    [c for c in range(0x3001) if chr(c).isspace()],
+    dtype=np.uint32,
+)
+WORD_BASE = np.uint64(0x100000001b3) # odd, so invertible modulo 2**64
+WORD_BASE_INV = np.uint64(pow(int(WORD_BASE), -1, 1 << 64))
+
+
 def n_grams(text: str, n: int = 3) -> list[str]:
     """
     Return a list of n‑grams for the supplied string.
@@ -14,3 +28,98 @@ def n_grams(text: str, n: int = 3) -> list[str]:
 
     return [text[i : i + n] for i in range(len(text) - n + 1)]
 
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """
+    Vectorized splitmix64 finalizer, which scrambles uint64 values into well-distributed hashes.
+    """
+    x = x + np.uint64(0x9e3779b97f4a7c15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _fold_windows(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    Hashes every window of `n` consecutive uint64 values, with one vectorized pass per window position.
+    """
+    count = len(values) - n + 1
+    hashes = np.full(count, np.uint64(n), dtype=np.uint64)
+
+    for k in range(n):
+        hashes = _mix64(hashes ^ values[k:k + count])
+
+    return hashes
+
+
+def _word_hashes(code_points: np.ndarray) -> np.ndarray:
+    """
+    Hashes every whitespace-delimited word with a polynomial rolling hash over prefix sums, so that words of any
+    length are hashed without materializing them.
+    """
+    is_word = ~np.isin(code_points, WHITESPACE)
+    edges = np.diff(is_word.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # prefix[i] = sum(mix(c_j) * B^j for j < i), so a word is (prefix[end] - prefix[start]) * B^-start, modulo 2**64.
+    powers = np.empty(len(code_points) + 1, dtype=np.uint64)
+    powers[0] = 1
+    powers[1:] = WORD_BASE
+    powers = np.multiply.accumulate(powers)
+
+    inverse_powers = np.empty(len(code_points) + 1, dtype=np.uint64)
+    inverse_powers[0] = 1
+    inverse_powers[1:] = WORD_BASE_INV
+    inverse_powers = np.multiply.accumulate(inverse_powers)
+
+    prefix = np.zeros(len(code_points) + 1, dtype=np.uint64)
+    prefix[1:] = np.add.accumulate(_mix64(code_points.astype(np.uint64)) * powers[:-1])
+
+    words = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+    return _mix64(words ^ (ends - starts).astype(np.uint64))
+
+
+def hashed_shingles(
+    text: str | bytes,
+    n: int = 3,
+    unit: Literal["char", "word"] = "char",
+    normalize: Literal["NFC", "NFKC", "NFD", "NFKD"] | None = None,
+    casefold: bool = False,
+) -> np.ndarray:
+    """
+    Return the uint64 hashes of the n‑grams of the supplied text, computed with vectorized NumPy operations over its
+    code points without creating a Python string per n-gram. Use it with `DedupIndex.bands_from_hashes`.
+
+    These hashes differ from hashing the strings of `n_grams`, so an index should be queried consistently through
+    one or the other.
+
+    Args:
+        text (str | bytes): The text to find n-grams for. Bytes are decoded as UTF-8.
+        n (int): The parameter which determines the length of the n-grams
+        unit (Literal["char", "word"]): Whether n-grams are made of characters or whitespace-delimited words.
+        normalize (Literal["NFC", "NFKC", "NFD", "NFKD"] | None): The Unicode normalization form to apply first.
+        casefold (bool): Whether to casefold the text first, for case-insensitive matching.
+    """
+    if n <= 0:
+        raise ValueError("n must be a positive integer")
+
+    if unit not in ("char", "word"):
+        raise ValueError('unit must be either "char" or "word"')
+
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+
+    if normalize is not None:
+        text = unicodedata.normalize(normalize, text)
+
+    if casefold:
+        text = text.casefold()
+
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    units = code_points.astype(np.uint64) if unit == "char" else _word_hashes(code_points)
+
+    if len(units) < n:
+        return np.empty(0, dtype=np.uint64)
+
+    return _fold_windows(units, n)
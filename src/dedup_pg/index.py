@@ -1,36 +1,240 @@
+import asyncio
 import hashlib
-import struct
+import time
 import numpy as np
 import xxhash
-from collections.abc import Iterable
-from uuid import UUID
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from concurrent.futures import Executor
+from typing import Any, Literal, TypeVar
+from uuid import UUID, uuid4
 
-from .backend import Backend, LocalBackend
+from .backend import AsyncBackend, Backend, LocalBackend, LRUCache
+from .banding import Banding, choose_banding, estimate_banding
+from .helpers import _mix64, n_grams
+from .instrumentation import Instrumentation
+
+T = TypeVar("T")
 
 MAX64 = np.uint64((1 << 64) - 1) # max uint64 mask
 MIX_CONST = np.uint64(0x9e3779b97f4a7c15) # golden ratio
+REDUCE_BLOCK = 1 << 21 # max elements materialized per segment-wise reduction
+SIGNATURES = ("minhash", "oph", "simhash")
+SIGNATURE_BITS = (1, 2, 4, 8, 16, 32) # lowest bits kept of each signature value in the signature store
+
+
+def _pack_signatures(signatures: np.ndarray, bits: int) -> list[bytes]:
+    """
+    Compacts signatures to their lowest `bits` bits per value, as b-bit MinHash does, each behind a byte holding
+    `bits`. Widths of a byte or more are stored as little-endian integers, and narrower ones as packed bits.
+    """
+    values = signatures & np.uint64((1 << bits) - 1)
+
+    if bits >= 8:
+        payload = values.astype(f"<u{bits // 8}")
+    else:
+        planes = (values[:, :, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)
+        payload = np.packbits(planes.astype(np.uint8).reshape(len(values), -1), axis=1, bitorder="little")
+
+    header = bytes([bits])
+    return [header + row.tobytes() for row in payload]
+
+
+def _unpack_signature(packed: bytes, num_perms: int) -> tuple[np.ndarray, int]:
+    """
+    Restores a signature compacted by `_pack_signatures`, returning its values and their number of bits.
+    """
+    bits = packed[0]
+
+    if bits >= 8:
+        return np.frombuffer(packed, dtype=f"<u{bits // 8}", offset=1).astype(np.uint64), bits
+
+    planes = np.unpackbits(np.frombuffer(packed, dtype=np.uint8, offset=1), count=num_perms * bits, bitorder="little")
+    values = planes.reshape(num_perms, bits).astype(np.uint64) << np.arange(bits, dtype=np.uint64)
+
+    return np.bitwise_or.reduce(values, axis=1), bits
 
 
 class DedupIndex:
     def __init__(
         self,
-        backend: Backend | None = None,
+        backend: Backend | AsyncBackend | None = None,
         num_perms: int = 128,
         rows: int = 4,
+        signature: Literal["minhash", "oph", "simhash"] = "minhash",
+        seed: int = 0,
+        fingerprint_cache: int | None = None,
+        instrumentation: Instrumentation | None = None,
+        signature_bits: int | None = None,
     ) -> None:
         """
         Indexing layer that allows for query-time deduplication through hashing.
 
+        A `DedupIndex` can be pickled to compute bands in worker processes. Its backend is not pickled, so the
+        unpickled copy can only hash.
+
         Args:
+            backend (Backend | AsyncBackend | None): The backend storing bands. An `AsyncBackend` must be used through
+                the `a`-prefixed methods. Defaults to a new `LocalBackend`.
             num_perms (int): The number of permutation functions to use to generate item signatures.
             rows (int): The number of rows to use when making signature bands.
+            signature (Literal["minhash", "oph", "simhash"]): The signature scheme. `"minhash"` mixes every token
+                against every permutation, while `"oph"` uses one-permutation hashing with optimal densification,
+                which costs O(tokens + num_perms) instead of O(tokens * num_perms). `"simhash"` bands embeddings
+                instead of tokens, through `DedupIndex.bands_from_embedding`, with `num_perms` random hyperplanes
+                and `rows` sign bits per band, at most 64. Backends record the scheme and refuse to serve an index
+                built with another one.
+            seed (int): The seed which token hashes are mixed with, so that independent indexes hash differently.
+                An unsigned 64-bit integer. The default of 0 leaves token hashes unchanged.
+            fingerprint_cache (int | None): The number of exact content fingerprints to remember in memory, which
+                lets `DedupIndex.query` answer exact duplicates without shingling or hashing them. Disabled if None.
+            instrumentation (Instrumentation | None): Receives stage timings, cluster assignments, connection pool
+                waits and cache lookups of the index and its backend. See `Instrumentation` for details. Nothing is
+                measured if None.
+            signature_bits (int | None): The number of lowest bits of each signature value to store, one of
+                `SIGNATURE_BITS`, for backends which store signatures. `DedupIndex.query` and `query_many` then
+                record the signature of the first item of each cluster, which `DedupIndex.query` verifies candidate
+                clusters against when given a `verify_threshold`. 32 bits estimate Jaccard similarity as well as
+                full signatures, while fewer bits take less space at the cost of more variance. Nothing is stored if
+                None.
         """
+        if signature not in SIGNATURES:
+            raise ValueError(f"signature must be one of {SIGNATURES}")
+
+        if signature == "simhash" and rows > 64:
+            raise ValueError('signature="simhash" packs a band into 64 bits, so rows must be at most 64')
+
+        if signature_bits is not None and signature_bits not in SIGNATURE_BITS:
+            raise ValueError(f"signature_bits must be one of {SIGNATURE_BITS}")
+
+        if signature_bits is not None and signature == "simhash":
+            raise ValueError('signature_bits requires a MinHash or OPH signature, not "simhash"')
+
+        if not 0 <= seed < 1 << 64:
+            raise ValueError("seed must be an unsigned 64-bit integer")
+
         self.num_hashes = num_perms
         self.rows = rows
         self.num_bands = num_perms // rows
+        self.signature = signature
+        self.seed = seed
+        self._fingerprints: LRUCache[bytes, UUID] | None = None
+        self._hyperplanes: dict[int, np.ndarray] = {}
+        self.signature_bits = signature_bits
+
+        if fingerprint_cache is not None:
+            self._fingerprints = LRUCache(fingerprint_cache)
 
         self._backend = LocalBackend() if backend is None else backend
         self._backend._init_internal(self.num_bands) # pyright: ignore[reportPrivateUsage]
+        self._backend._bind_params(self.params) # pyright: ignore[reportPrivateUsage]
+        self.instrumentation = instrumentation
+        self._backend._bind_instrumentation(instrumentation) # pyright: ignore[reportPrivateUsage]
+
+    @classmethod
+    def for_threshold(
+        cls,
+        jaccard: float,
+        backend: Backend | AsyncBackend | None = None,
+        *,
+        fp_weight: float = 0.5,
+        fn_weight: float = 0.5,
+        max_bands: int = 32,
+        max_perms: int = 256,
+        max_error: float | None = None,
+        **kwargs: Any,
+    ) -> "DedupIndex":
+        """
+        Creates an index whose `num_perms` and `rows` suit a Jaccard similarity threshold, rather than hand-picked
+        ones. See `dedup_pg.banding.choose_banding` for how the banding is picked, and `DedupIndex.estimate` for its
+        expected error rates and row cost.
+
+        Args:
+            jaccard (float): The Jaccard similarity above which items should share a cluster.
+            backend (Backend | AsyncBackend | None): The backend storing bands. Defaults to a new `LocalBackend`.
+            fp_weight (float): The weight of the false positive rate in the error.
+            fn_weight (float): The weight of the false negative rate in the error.
+            max_bands (int): The largest number of bands, which is the number of rows an item costs in the index.
+            max_perms (int): The largest number of permutation functions, which hashing time grows with.
+            max_error (float | None): The largest acceptable weighted error, for which the banding with the fewest
+                bands is picked. Defaults to `dedup_pg.banding.ERROR_SLACK` times the lowest weighted error within
+                the limits.
+            **kwargs: Other arguments of `DedupIndex`, such as `signature` or `seed`.
+        """
+        banding = choose_banding(jaccard, fp_weight, fn_weight, max_bands, max_perms, max_error)
+        return cls(backend, num_perms=banding.num_perms, rows=banding.rows, **kwargs)
+
+    def estimate(self, jaccard: float) -> Banding:
+        """
+        Estimates the false positive and false negative rates of the index at a Jaccard similarity threshold, along
+        with the rows it writes per item.
+        """
+        return estimate_banding(jaccard, self.num_hashes, self.rows)
+
+    @property
+    def params(self) -> dict[str, int | str]:
+        """
+        The parameters which determine the bands of an item, and which backends record to refuse mismatched indexes.
+        """
+        return {"num_perms": self.num_hashes, "rows": self.rows, "signature": self.signature, "seed": self.seed}
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_backend"] = None
+        state["_fingerprints"] = None
+        state["instrumentation"] = None
+        return state
+
+    def _backend_for(self, tenant: str | None) -> Backend | AsyncBackend:
+        return self._backend if tenant is None else self._backend.tenant(tenant)
+
+    def _sync_backend(self, tenant: str | None = None) -> Backend:
+        if not isinstance(self._backend, Backend):
+            raise TypeError("DedupIndex has an asynchronous backend, use the `a`-prefixed methods instead.")
+
+        return self._backend if tenant is None else self._backend.tenant(tenant)
+
+    def _timed(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Calls the backend, reporting the round trip if instrumented.
+        """
+        if (instrumentation := self.instrumentation) is None:
+            return func(*args)
+
+        start = time.perf_counter()
+
+        try:
+            return func(*args)
+        finally:
+            instrumentation.on_stage("backend", time.perf_counter() - start)
+
+    async def _atimed(self, awaitable: Awaitable[T]) -> T:
+        if (instrumentation := self.instrumentation) is None:
+            return await awaitable
+
+        start = time.perf_counter()
+
+        try:
+            return await awaitable
+        finally:
+            instrumentation.on_stage("backend", time.perf_counter() - start)
+
+    async def _acall(self, backend: Backend | AsyncBackend, method: str, *args: Any) -> Any:
+        """
+        Calls a backend method, in a worker thread for synchronous backends, reporting the round trip if instrumented.
+        """
+        if isinstance(backend, AsyncBackend):
+            return await self._atimed(getattr(backend, method)(*args))
+
+        return await self._atimed(asyncio.to_thread(getattr(backend, method), *args))
+
+    async def _offload(self, executor: Executor | None, func: Callable[..., T], *args: Any) -> T:
+        """
+        Runs CPU-bound hashing in the executor if one is given, and inline otherwise.
+        """
+        if executor is None:
+            return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
 
     def _token_hash(self, token: str, seeds: np.ndarray) -> np.ndarray:
         """
@@ -52,6 +256,114 @@ class DedupIndex:
 
         return hashes
 
+    def _token_hashes(self, docs: Iterable[Iterable[str]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Hashes the tokens of many documents into one flat array.
+
+        Args:
+            docs (Iterable[Iterable[str]]): One iterable of tokens per document.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The flat uint64 token hashes and the `n_docs + 1` offsets delimiting
+                each document's segment.
+        """
+        hashes: list[int] = []
+        offsets = [0]
+
+        for tokens in docs:
+            hashes.extend(map(xxhash.xxh3_64_intdigest, tokens))
+            offsets.append(len(hashes))
+
+        return np.array(hashes, dtype=np.uint64), np.array(offsets, dtype=np.intp)
+
+    def _minhash_signatures(self, hashes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Segment-wise MinHash calculation over the flat token hashes of many documents.
+
+        Args:
+            hashes (np.ndarray): The flat uint64 token hashes of every document.
+            offsets (np.ndarray): The `n_docs + 1` offsets delimiting each document in `hashes`.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_perms)` uint64 matrix of MinHash signatures.
+        """
+        seeds = np.arange(self.num_hashes, dtype=np.uint64)
+        perm = seeds * MIX_CONST
+        signatures = np.full((len(offsets) - 1, self.num_hashes), MAX64, dtype=np.uint64)
+
+        # Empty documents keep the MAX64 signature, and `reduceat` cannot express empty segments.
+        nonempty = offsets[:-1] < offsets[1:]
+        if not nonempty.any():
+            return signatures
+
+        # Reduce a few permutations at a time over the contiguous token axis to bound memory and stay cache-friendly.
+        starts = offsets[:-1][nonempty]
+        block = min(self.num_hashes, max(1, REDUCE_BLOCK // len(hashes)))
+        mixed = np.empty((block, len(hashes)), dtype=np.uint64)
+
+        for i in range(0, self.num_hashes, block):
+            rows = perm[i:i + block, None]
+            np.bitwise_xor(rows, hashes[None, :], out=mixed[:len(rows)])
+            signatures[nonempty, i:i + block] = np.minimum.reduceat(mixed[:len(rows)], starts, axis=1).T
+
+        return signatures
+
+    def _oph_signatures(self, hashes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        One-permutation hashing with optimal densification over the flat token hashes of many documents. Each token
+        is hashed once into one of `num_perms` bins, keeping the minimum per bin, and every empty bin borrows the
+        value of the first non-empty bin in its own fixed pseudo-random probe sequence.
+
+        Args:
+            hashes (np.ndarray): The flat uint64 token hashes of every document.
+            offsets (np.ndarray): The `n_docs + 1` offsets delimiting each document in `hashes`.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_perms)` uint64 matrix of densified signatures.
+        """
+        n_docs = len(offsets) - 1
+        num_bins = np.uint64(self.num_hashes)
+        signatures = np.full((n_docs, self.num_hashes), MAX64, dtype=np.uint64)
+
+        if len(hashes) == 0:
+            return signatures
+
+        docs = np.repeat(np.arange(n_docs), np.diff(offsets))
+        bins = (hashes % num_bins).astype(np.intp)
+        np.minimum.at(signatures, (docs, bins), hashes)
+
+        # Empty documents keep the MAX64 signature, like MinHash.
+        filled = np.zeros((n_docs, self.num_hashes), dtype=bool)
+        filled[docs, bins] = True
+        empty_docs, empty_bins = np.nonzero(~filled & filled.any(axis=1)[:, None])
+
+        attempt = np.uint64(0)
+        while len(empty_docs):
+            attempt += np.uint64(1)
+            probe_key = empty_bins.astype(np.uint64) * MIX_CONST + attempt
+            probes = (_mix64(probe_key) % num_bins).astype(np.intp)
+
+            found = filled[empty_docs, probes]
+            signatures[empty_docs[found], empty_bins[found]] = signatures[empty_docs[found], probes[found]]
+            empty_docs, empty_bins = empty_docs[~found], empty_bins[~found]
+
+        return signatures
+
+    def _signatures(self, hashes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Computes the signatures of many documents with the configured signature scheme.
+        """
+        if self.signature == "simhash":
+            raise ValueError('An index with signature="simhash" bands embeddings, use `bands_from_embedding` instead')
+
+        if self.seed:
+            hashes = _mix64(hashes ^ np.uint64(self.seed & ((1 << 64) - 1)))
+
+        if self.signature == "oph":
+            return self._oph_signatures(hashes, offsets)
+
+        return self._minhash_signatures(hashes, offsets)
+
     def _minhash_signature(self, tokens: Iterable[str]) -> np.ndarray:
         """
         Optimized MinHash calculation using numpy vectorization.
@@ -62,22 +374,64 @@ class DedupIndex:
         Returns:
             list[int]: A MinHash signature consisting of `num_rows` hashes.
         """
-        tokens = list(tokens)
-        seeds = np.arange(self.num_hashes, dtype=np.uint64)
-        perm = seeds * MIX_CONST
-        min_hashes = np.full(self.num_hashes, MAX64, dtype=np.uint64)
+        return self._minhash_signatures(*self._token_hashes([tokens]))[0]
 
-        for token in tokens:
-            h0 = np.uint64(xxhash.xxh3_64(token).intdigest())
-            token_hashes = h0 ^ perm
-            min_hashes = np.minimum(min_hashes, token_hashes)
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        Hashes each band of many signatures, matching `struct.pack` + `xxhash.xxh64` per band.
 
-        return min_hashes
+        Args:
+            signatures (np.ndarray): A `(n_docs, num_perms)` uint64 matrix of signatures.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_bands)` int64 matrix of band hashes.
+        """
+        n_docs, width = signatures.shape
+        starts = range(0, width, self.rows)
+        band_hashes = np.empty((n_docs, len(starts)), dtype=np.uint64)
+
+        if n_docs == 0:
+            return band_hashes.view(np.int64)
+
+        for b, start in enumerate(starts):
+            # Native-order uint64 bytes are exactly what `struct.pack("Q")` produces.
+            band = np.ascontiguousarray(signatures[:, start:start + self.rows], dtype=np.uint64)
+            size = band.shape[1] * band.itemsize
+            buffer = memoryview(band).cast("B")
+            band_hashes[:, b] = [
+                xxhash.xxh64_intdigest(buffer[i:i + size]) for i in range(0, n_docs * size, size)
+            ]
+
+        return band_hashes.view(np.int64)
+
+    def _bands_of(
+        self,
+        signatures: Callable[[], np.ndarray],
+        band_hashes: Callable[[np.ndarray], np.ndarray] | None = None,
+    ) -> np.ndarray:
+        """
+        Computes the band matrix of the signatures computed by `signatures`, with `_band_hashes` unless given other
+        `band_hashes`, reporting the time spent on signatures and bands if instrumented.
+        """
+        band_hashes = self._band_hashes if band_hashes is None else band_hashes
+
+        if (instrumentation := self.instrumentation) is None:
+            return band_hashes(signatures())
+
+        start = time.perf_counter()
+        signature_matrix = signatures()
+        signed = time.perf_counter()
+        band_matrix = band_hashes(signature_matrix)
+
+        instrumentation.on_stage("signature", signed - start)
+        instrumentation.on_stage("bands", time.perf_counter() - signed)
+
+        return band_matrix
 
     def bands(self, tokens: Iterable[str]) -> list[int]:
         """
-        Returns LSH bands. Currently, this only supports MinHash, which is the most popular algorithm for deduplicating
-        large-scale data.
+        Returns LSH bands of the MinHash signature, or of the one-permutation hashing signature if the index was
+        created with `signature="oph"`.
 
         Args:
             tokens (Iterable[str]): An iterable of any byte-encodeable objects which represent the content to
@@ -86,40 +440,525 @@ class DedupIndex:
         Returns:
             list[str]: LSH bands derived from the MinHash signature of the tokens.
         """
-        signature = self._minhash_signature(tokens)
-        band_hashes: list[int] = []
+        return self._bands_of(lambda: self._signatures(*self._token_hashes([tokens])))[0].tolist()
+
+    def bands_many(self, docs: Sequence[Iterable[str]]) -> np.ndarray:
+        """
+        Returns the LSH bands of many documents at once. This is bit-identical to calling `DedupIndex.bands` on each
+        document, but hashes the whole batch into one flat array and reduces it with vectorized NumPy operations.
+
+        Args:
+            docs (Sequence[Iterable[str]]): One iterable of tokens per document.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_bands)` int64 matrix where each row holds the bands of one document.
+        """
+        return self._bands_of(lambda: self._signatures(*self._token_hashes(docs)))
 
-        for i in range(0, len(signature), self.rows):
-            band = signature[i:i + self.rows]
-            payload = struct.pack(f"{len(band)}Q", *band)
-            band_hash = np.uint64(xxhash.xxh64(payload).intdigest()).view(np.int64)
-            band_hashes.append(int(band_hash))
+    def bands_from_hashes(self, hashes: np.ndarray) -> list[int]:
+        """
+        Returns LSH bands of a document given as pre-hashed tokens, such as the output of `helpers.hashed_shingles`.
+        The hashes take the place of the per-token xxh3 hashes, so no Python work is done per token.
+
+        Args:
+            hashes (np.ndarray): A uint64 array with one hash per token.
 
-        return band_hashes
+        Returns:
+            list[int]: LSH bands derived from the signature of the hashes.
+        """
+        return self.bands_many_from_hashes([hashes])[0].tolist()
 
-    def index(self, items: Iterable[int]) -> UUID:
+    def bands_many_from_hashes(self, docs: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Returns the LSH bands of many documents given as pre-hashed tokens, in one vectorized pass.
+
+        Args:
+            docs (Sequence[np.ndarray]): One uint64 array of token hashes per document.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_bands)` int64 matrix where each row holds the bands of one document.
+        """
+        def signatures() -> np.ndarray:
+            arrays = [np.asarray(doc, dtype=np.uint64).ravel() for doc in docs]
+            offsets = np.zeros(len(arrays) + 1, dtype=np.intp)
+            np.cumsum([len(doc) for doc in arrays], out=offsets[1:])
+            hashes = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)
+
+            return self._signatures(hashes, offsets)
+
+        return self._bands_of(signatures)
+
+    def _signed_bands(self, docs: Sequence[Iterable[str]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the signatures of many documents along with their band matrix, for the signature store.
+        """
+        signatures: list[np.ndarray] = []
+
+        def sign() -> np.ndarray:
+            signatures.append(self._signatures(*self._token_hashes(docs)))
+            return signatures[0]
+
+        band_matrix = self._bands_of(sign)
+
+        return signatures[0], band_matrix
+
+    def _estimate_similarity(self, signature: np.ndarray, stored: Sequence[bytes]) -> np.ndarray:
+        """
+        Estimates the Jaccard similarity of an item with the representatives of candidate clusters, from their
+        compact signatures, at once. Values compared at b bits also match by chance with a probability of 2 ** -b,
+        which is corrected for.
+        """
+        values, bits = zip(*(_unpack_signature(packed, self.num_hashes) for packed in stored))
+        widths = np.minimum(np.array(bits, dtype=np.uint64), self.signature_bits or 32)
+        masks = (np.uint64(1) << widths) - np.uint64(1)
+
+        matches = (((np.stack(values) ^ signature) & masks[:, None]) == 0).mean(axis=1)
+        chance = 2.0 ** -widths.astype(np.float64)
+
+        return np.clip((matches - chance) / (1 - chance), 0.0, 1.0)
+
+    def _verify(
+        self, signature: np.ndarray, candidates: dict[UUID, int], stored: dict[UUID, bytes], threshold: float
+    ) -> UUID | None:
+        """
+        Picks the cluster of an item among its candidates, given the signatures stored for them. Returns None if no
+        candidate was rejected, so that the item is inserted as usual. Otherwise, returns the candidate with the
+        highest estimated similarity at or above the threshold, or the candidate with the most matching bands among
+        those without a stored signature, or a new cluster if every candidate was rejected.
+        """
+        verified = [cluster_uuid for cluster_uuid in candidates if cluster_uuid in stored]
+
+        if not verified:
+            return None
+
+        similarities = self._estimate_similarity(signature, [stored[cluster_uuid] for cluster_uuid in verified])
+
+        if (similarities >= threshold).all():
+            return None
+
+        if similarities.max() >= threshold:
+            return verified[int(similarities.argmax())]
+
+        return next((cluster_uuid for cluster_uuid in candidates if cluster_uuid not in stored), uuid4())
+
+    def _signature_records(self, signatures: np.ndarray, cluster_uuids: Sequence[UUID]) -> list[tuple[UUID, bytes]]:
+        """
+        Pairs each cluster with the compact signature of its first item, for `Backend.insert_signatures`.
+        """
+        assert self.signature_bits is not None
+
+        if not cluster_uuids:
+            return []
+
+        first = {cluster_uuid: doc for doc, cluster_uuid in reversed(list(enumerate(cluster_uuids)))}
+        packed = _pack_signatures(signatures[list(first.values())], self.signature_bits)
+
+        return list(zip(first, packed))
+
+    def _check_verify_threshold(self, verify_threshold: float | None) -> None:
+        if verify_threshold is None:
+            return
+
+        if self.signature_bits is None:
+            raise ValueError("verify_threshold requires an index created with signature_bits")
+
+        if not 0 < verify_threshold <= 1:
+            raise ValueError("verify_threshold must be a Jaccard similarity between 0, exclusive, and 1")
+
+    def _simhash_hyperplanes(self, dim: int) -> np.ndarray:
+        """
+        The `(dim, num_perms)` Gaussian normals of the SimHash hyperplanes for embeddings of a dimension. They are
+        derived from the seed with splitmix64 and the Box-Muller transform rather than a NumPy generator, whose
+        streams may change across NumPy versions, so that stored bands stay valid.
+        """
+        if (hyperplanes := self._hyperplanes.get(dim)) is None:
+            size = dim * self.num_hashes
+            state = np.arange(2 * size, dtype=np.uint64) * MIX_CONST + np.uint64(self.seed & ((1 << 64) - 1))
+            # The top 53 bits of each hash as a uniform float in (0, 1]
+            uniform = ((_mix64(state) >> np.uint64(11)) + np.uint64(1)) * 2.0 ** -53
+            radius = np.sqrt(-2.0 * np.log(uniform[:size]))
+            hyperplanes = (radius * np.cos(2 * np.pi * uniform[size:])).astype(np.float32).reshape(dim, -1)
+            hyperplanes = self._hyperplanes.setdefault(dim, hyperplanes)
+
+        return hyperplanes
+
+    def _simhash_signatures(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Projects a `(n_docs, dim)` matrix of embeddings onto the hyperplanes, in one matrix multiply.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_perms)` bool matrix of which side of each hyperplane each embedding is on.
+        """
+        if self.signature != "simhash":
+            raise ValueError('Only an index with signature="simhash" can band embeddings')
+
+        if embeddings.ndim != 2 or not np.issubdtype(embeddings.dtype, np.floating):
+            raise ValueError("Embeddings must be a floating-point vector, or a 2D batch of them")
+
+        # float16 matrix products are not accelerated, so half-precision embeddings are widened first.
+        embeddings = embeddings.astype(np.float32, copy=False)
+
+        return embeddings @ self._simhash_hyperplanes(embeddings.shape[1]) > 0
+
+    def _simhash_band_hashes(self, bits: np.ndarray) -> np.ndarray:
+        """
+        Packs the sign bits of each band into an integer, scrambled so that band hashes are uniformly distributed.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_bands)` int64 matrix of band hashes.
+        """
+        n_docs = len(bits)
+        bands = bits[:, :self.num_bands * self.rows].reshape(n_docs, self.num_bands, self.rows)
+        packed = np.bitwise_or.reduce(
+            bands.astype(np.uint64) << np.arange(self.rows, dtype=np.uint64), axis=2, initial=np.uint64(0)
+        )
+
+        return _mix64(packed).view(np.int64)
+
+    def bands_from_embedding(self, embedding: np.ndarray) -> list[int]:
+        """
+        Returns the SimHash bands of an embedding, for an index created with `signature="simhash"`. Items share a
+        band with a probability that grows with their cosine similarity, as each sign bit agrees with a probability
+        of `1 - angle / pi`.
+
+        Args:
+            embedding (np.ndarray): A float32 or float16 vector.
+
+        Returns:
+            list[int]: LSH bands derived from the signs of the embedding's projections.
+        """
+        return self.bands_many_from_embeddings(np.asarray(embedding)[None, :])[0].tolist()
+
+    def bands_many_from_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Returns the SimHash bands of many embeddings at once. This is identical to calling
+        `DedupIndex.bands_from_embedding` on each embedding.
+
+        Args:
+            embeddings (np.ndarray): A `(n_docs, dim)` float32 or float16 matrix with one embedding per row.
+
+        Returns:
+            np.ndarray: A `(n_docs, num_bands)` int64 matrix where each row holds the bands of one embedding.
+        """
+        return self._bands_of(lambda: self._simhash_signatures(np.asarray(embeddings)), self._simhash_band_hashes)
+
+    def index(self, items: Iterable[int], *, tenant: str | None = None) -> UUID:
         """
         Retrieves the cluster UUID4 of a given items list derived from MinHash bands. This may add a new entry to the
         backend if the bands do not exist.
 
         Args:
             items (Iterable[str]): A list of item tuples. See `DedupIndex.items` for details.
+            tenant (str | None): The tenant to scope the call to, for backends partitioned by tenant. Items of
+                different tenants never share a cluster.
 
         Returns:
             UUID: The cluster ID of the given MinHash bands.
         """
-        return self._backend.insert(items)
+        return self._timed(self._sync_backend(tenant).insert, items)
+
+    def index_many(self, band_matrix: Iterable[Iterable[int]], *, tenant: str | None = None) -> list[UUID]:
+        """
+        Retrieves the cluster UUID4 of each item in a batch of bands in a single backend call. Items of the batch
+        which share any band are assigned the same cluster.
+
+        Args:
+            band_matrix (Iterable[Iterable[int]]): One row of bands per item. See `DedupIndex.bands_many` for details.
+            tenant (str | None): The tenant to scope the call to, for backends partitioned by tenant. Items of
+                different tenants never share a cluster.
+
+        Returns:
+            list[UUID]: The cluster ID of each item, in batch order.
+        """
+        return self._timed(self._sync_backend(tenant).insert_many, band_matrix)
 
-    def query(self, tokens: Iterable[str]) -> UUID:
+    def _content_tokens(self, content: str | bytes) -> list[str]:
+        """
+        Shingles content into the character 3-grams used when no tokens are given alongside it.
+        """
+        text = content.decode("utf-8") if isinstance(content, bytes) else content
+
+        if (instrumentation := self.instrumentation) is None:
+            return n_grams(text)
+
+        start = time.perf_counter()
+        tokens = n_grams(text)
+        instrumentation.on_stage("shingle", time.perf_counter() - start)
+
+        return tokens
+
+    def _cached_fingerprint(self, content: str | bytes, tenant: str | None = None) -> tuple[bytes, UUID | None]:
+        """
+        Fingerprints content with xxh3_128, returning the fingerprint and its cluster if it is cached in memory.
+        Fingerprints are seeded with the tenant, so that tenants never share them.
+        """
+        seed = 0 if tenant is None else xxhash.xxh3_64_intdigest(tenant.encode("utf-8"))
+        fingerprint = xxhash.xxh3_128_digest(content.encode("utf-8") if isinstance(content, str) else content, seed)
+        cached = None if self._fingerprints is None else self._fingerprints.get(fingerprint)
+
+        if self._fingerprints is not None and self.instrumentation is not None:
+            self.instrumentation.on_cache("fingerprint", int(cached is not None), int(cached is None))
+
+        return fingerprint, cached
+
+    def _query_tokens(self, tokens: Iterable[str], tenant: str | None, verify_threshold: float | None) -> UUID:
+        """
+        Assigns tokens to a cluster, verifying candidate clusters and recording the signature of the tokens if the
+        index stores signatures.
+        """
+        if self.signature_bits is None:
+            return self.index(self.bands(tokens), tenant=tenant)
+
+        signatures, band_matrix = self._signed_bands([tokens])
+        bands = band_matrix[0].tolist()
+        backend = self._sync_backend(tenant)
+        cluster_uuid = None
+
+        if verify_threshold is not None and (candidates := self._timed(backend.lookup, bands)):
+            stored = self._timed(backend.query_signatures, list(candidates))
+
+            if (cluster_uuid := self._verify(signatures[0], candidates, stored, verify_threshold)) is not None:
+                self._timed(backend.insert_into, bands, cluster_uuid)
+
+        if cluster_uuid is None:
+            cluster_uuid = self._timed(backend.insert, bands)
+
+        self._timed(backend.insert_signatures, self._signature_records(signatures, [cluster_uuid]))
+
+        return cluster_uuid
+
+    def query(
+        self,
+        tokens: Iterable[str] | None = None,
+        *,
+        content: str | bytes | None = None,
+        tenant: str | None = None,
+        verify_threshold: float | None = None,
+    ) -> UUID:
         """
         Retrieves the cluster UUID4 of the given tokens. This may add a new entry to the backend if the bands do not
         exist.
 
+        If the raw content is given, its exact fingerprint is looked up first in the in-memory fingerprint cache and
+        in the backend, if it persists fingerprints, so that exact duplicates skip shingling, hashing and the band
+        lookup. Tokens are only consumed on a miss, and default to the character 3-grams of the content.
+
+        Args:
+            tokens (Iterable[str] | None): A list of tokens derived from some function such as the n_grams function.
+            content (str | bytes | None): The raw content the tokens were derived from, for the exact-duplicate fast
+                path.
+            tenant (str | None): The tenant to scope the call to, for backends partitioned by tenant. Items of
+                different tenants never share a cluster.
+            verify_threshold (float | None): The Jaccard similarity a candidate cluster's representative must reach,
+                as estimated from the signatures stored by an index created with `signature_bits`, for the tokens to
+                join it. Rejected candidates are false positives of the banding, and the tokens join the most similar
+                verified candidate, or start a new cluster with their bands which are not indexed yet. Candidates
+                without a stored signature cannot be verified and are accepted. Not verified if None.
+
+        Returns:
+            UUID: The cluster ID of the given tokens.
+        """
+        self._check_verify_threshold(verify_threshold)
+
+        if content is None:
+            if tokens is None:
+                raise ValueError("DedupIndex.query requires tokens or content")
+
+            return self._query_tokens(tokens, tenant, verify_threshold)
+
+        fingerprint, cluster_uuid = self._cached_fingerprint(content, tenant)
+
+        if cluster_uuid is None:
+            backend = self._sync_backend(tenant)
+
+            if (cluster_uuid := self._timed(backend.query_fingerprint, fingerprint)) is None:
+                tokens = self._content_tokens(content) if tokens is None else tokens
+                cluster_uuid = self._query_tokens(tokens, tenant, verify_threshold)
+                self._timed(backend.insert_fingerprint, fingerprint, cluster_uuid)
+
+            if self._fingerprints is not None:
+                self._fingerprints.put(fingerprint, cluster_uuid)
+
+        return cluster_uuid
+
+    def lookup(self, tokens: Iterable[str], *, tenant: str | None = None) -> dict[UUID, int]:
+        """
+        Finds the clusters the given tokens are a near-duplicate of, without adding anything to the backend. The more
+        bands a cluster shares with the tokens, the more likely it is a true duplicate.
+
         Args:
             tokens (Iterable[str]): A list of tokens derived from some function such as the n_grams function.
+            tenant (str | None): The tenant to scope the call to, for backends partitioned by tenant. Items of
+                different tenants never share a cluster.
+
+        Returns:
+            dict[UUID, int]: The number of matching bands of each candidate cluster, most matching bands first.
+        """
+        return self._timed(self._sync_backend(tenant).lookup, self.bands(tokens))
+
+    def query_many(self, docs: Sequence[Iterable[str]], *, tenant: str | None = None) -> list[UUID]:
+        """
+        Retrieves the cluster UUID4 of each document in a batch. This may add new entries to the backend if the bands
+        do not exist.
+
+        Args:
+            docs (Sequence[Iterable[str]]): One list of tokens per document.
+            tenant (str | None): The tenant to scope the call to, for backends partitioned by tenant. Items of
+                different tenants never share a cluster.
+
+        Returns:
+            list[UUID]: The cluster ID of each document, in batch order.
+        """
+        if self.signature_bits is None:
+            return self.index_many(self.bands_many(docs), tenant=tenant)
+
+        signatures, band_matrix = self._signed_bands(docs)
+        cluster_uuids = self.index_many(band_matrix, tenant=tenant)
+        self._timed(self._sync_backend(tenant).insert_signatures, self._signature_records(signatures, cluster_uuids))
+
+        return cluster_uuids
+
+    async def aindex(self, items: Iterable[int], *, tenant: str | None = None) -> UUID:
+        """
+        Asynchronous version of `DedupIndex.index`. Synchronous backends are run in a worker thread so that they do
+        not block the event loop.
+
+        Args:
+            items (Iterable[int]): The MinHash bands of an item. See `DedupIndex.bands` for details.
+            tenant (str | None): The tenant to scope the call to. See `DedupIndex.index` for details.
+
+        Returns:
+            UUID: The cluster ID of the given MinHash bands.
+        """
+        return await self._acall(self._backend_for(tenant), "insert", items)
+
+    async def aindex_many(self, band_matrix: Iterable[Iterable[int]], *, tenant: str | None = None) -> list[UUID]:
+        """
+        Asynchronous version of `DedupIndex.index_many`.
+
+        Args:
+            band_matrix (Iterable[Iterable[int]]): One row of bands per item. See `DedupIndex.bands_many` for details.
+            tenant (str | None): The tenant to scope the call to. See `DedupIndex.index` for details.
+
+        Returns:
+            list[UUID]: The cluster ID of each item, in batch order.
+        """
+        return await self._acall(self._backend_for(tenant), "insert_many", band_matrix)
+
+    async def _aquery_tokens(
+        self, tokens: Iterable[str], executor: Executor | None, tenant: str | None, verify_threshold: float | None
+    ) -> UUID:
+        """
+        Asynchronous version of `DedupIndex._query_tokens`.
+        """
+        if self.signature_bits is None:
+            return await self.aindex(await self._offload(executor, self.bands, tokens), tenant=tenant)
+
+        signatures, band_matrix = await self._offload(executor, self._signed_bands, [tokens])
+        bands = band_matrix[0].tolist()
+        backend = self._backend_for(tenant)
+        cluster_uuid = None
+
+        if verify_threshold is not None and (candidates := await self._acall(backend, "lookup", bands)):
+            stored = await self._acall(backend, "query_signatures", list(candidates))
+
+            if (cluster_uuid := self._verify(signatures[0], candidates, stored, verify_threshold)) is not None:
+                await self._acall(backend, "insert_into", bands, cluster_uuid)
+
+        if cluster_uuid is None:
+            cluster_uuid = await self._acall(backend, "insert", bands)
+
+        await self._acall(backend, "insert_signatures", self._signature_records(signatures, [cluster_uuid]))
+
+        return cluster_uuid
+
+    async def aquery(
+        self,
+        tokens: Iterable[str] | None = None,
+        *,
+        content: str | bytes | None = None,
+        executor: Executor | None = None,
+        tenant: str | None = None,
+        verify_threshold: float | None = None,
+    ) -> UUID:
+        """
+        Asynchronous version of `DedupIndex.query`.
+
+        Args:
+            tokens (Iterable[str] | None): A list of tokens derived from some function such as the n_grams function.
+            content (str | bytes | None): The raw content the tokens were derived from, for the exact-duplicate fast
+                path.
+            executor (Executor | None): An executor to compute bands in, so that hashing long documents does not
+                stall the event loop. Bands are computed inline if not given.
+            tenant (str | None): The tenant to scope the call to. See `DedupIndex.query` for details.
+            verify_threshold (float | None): The Jaccard similarity candidate clusters are verified against. See
+                `DedupIndex.query` for details.
 
         Returns:
             UUID: The cluster ID of the given tokens.
         """
-        bands = self.bands(tokens)
-        return self.index(bands)
+        self._check_verify_threshold(verify_threshold)
+
+        if content is None:
+            if tokens is None:
+                raise ValueError("DedupIndex.aquery requires tokens or content")
+
+            return await self._aquery_tokens(tokens, executor, tenant, verify_threshold)
+
+        fingerprint, cluster_uuid = self._cached_fingerprint(content, tenant)
+
+        if cluster_uuid is None:
+            backend = self._backend_for(tenant)
+            cluster_uuid = await self._acall(backend, "query_fingerprint", fingerprint)
+
+            if cluster_uuid is None:
+                tokens = self._content_tokens(content) if tokens is None else tokens
+                cluster_uuid = await self._aquery_tokens(tokens, executor, tenant, verify_threshold)
+                await self._acall(backend, "insert_fingerprint", fingerprint, cluster_uuid)
+
+            if self._fingerprints is not None:
+                self._fingerprints.put(fingerprint, cluster_uuid)
+
+        return cluster_uuid
+
+    async def alookup(
+        self, tokens: Iterable[str], *, executor: Executor | None = None, tenant: str | None = None
+    ) -> dict[UUID, int]:
+        """
+        Asynchronous version of `DedupIndex.lookup`.
+
+        Args:
+            tokens (Iterable[str]): A list of tokens derived from some function such as the n_grams function.
+            executor (Executor | None): An executor to compute bands in. Bands are computed inline if not given.
+            tenant (str | None): The tenant to scope the call to. See `DedupIndex.lookup` for details.
+
+        Returns:
+            dict[UUID, int]: The number of matching bands of each candidate cluster, most matching bands first.
+        """
+        bands = await self._offload(executor, self.bands, tokens)
+        return await self._acall(self._backend_for(tenant), "lookup", bands)
+
+    async def aquery_many(
+        self, docs: Sequence[Iterable[str]], *, executor: Executor | None = None, tenant: str | None = None
+    ) -> list[UUID]:
+        """
+        Asynchronous version of `DedupIndex.query_many`.
+
+        Args:
+            docs (Sequence[Iterable[str]]): One list of tokens per document.
+            executor (Executor | None): An executor to compute bands in. Bands are computed inline if not given.
+            tenant (str | None): The tenant to scope the call to. See `DedupIndex.query_many` for details.
+
+        Returns:
+            list[UUID]: The cluster ID of each document, in batch order.
+        """
+        if self.signature_bits is None:
+            band_matrix = await self._offload(executor, self.bands_many, docs)
+            return await self.aindex_many(band_matrix, tenant=tenant)
+
+        signatures, band_matrix = await self._offload(executor, self._signed_bands, docs)
+        cluster_uuids = await self.aindex_many(band_matrix, tenant=tenant)
+        records = self._signature_records(signatures, cluster_uuids)
+        await self._acall(self._backend_for(tenant), "insert_signatures", records)
+
+        return cluster_uuids
@@ -0,0 +1,156 @@
+from typing import Any
+
+STAGES = ("shingle", "signature", "bands", "backend")
+
+
+class Instrumentation:
+    """
+    Receives measurements of the hot paths of a `DedupIndex` and its backend. Every callback is a no-op, so
+    subclasses only override what they record. Callbacks run inline on the measured path and must be cheap and
+    thread-safe.
+
+    Instrumentation is opt-in: without it, the hot paths skip timing altogether.
+    """
+
+    def on_stage(self, stage: str, seconds: float) -> None:
+        """
+        Called with the wall time of one stage of a call. Stages are `"shingle"` for the character n-grams of raw
+        content, `"signature"` for token hashing and signatures, `"bands"` for band hashing and `"backend"` for the
+        backend round trip.
+        """
+
+    def on_clusters(self, new: int, existing: int) -> None:
+        """
+        Called after each write with the number of clusters it created, and the number of items it assigned to a
+        cluster which already existed, including items joining a cluster created earlier in the same batch.
+        """
+
+    def on_pool_wait(self, seconds: float) -> None:
+        """
+        Called by SQLAlchemy backends with the time spent checking a connection out of the engine's pool.
+        """
+
+    def on_cache(self, cache: str, hits: int, misses: int) -> None:
+        """
+        Called with the hits and misses of an in-memory cache, `"fingerprint"` for the exact content fingerprints
+        of `DedupIndex` and `"bands"` for `CachedBackend`.
+        """
+
+
+class PrometheusInstrumentation(Instrumentation):
+    def __init__(self, namespace: str = "dedup_pg", registry: Any = None) -> None:
+        """
+        Records measurements as Prometheus metrics:
+
+        - `<namespace>_stage_seconds`, a histogram labelled by `stage`.
+        - `<namespace>_clusters_total`, a counter labelled by `kind`, `new` or `existing`.
+        - `<namespace>_pool_wait_seconds`, a histogram.
+        - `<namespace>_cache_lookups_total`, a counter labelled by `cache` and `result`, `hit` or `miss`.
+
+        Requires the `prometheus-client` package.
+
+        Args:
+            namespace (str): The prefix of every metric name.
+            registry (CollectorRegistry | None): The registry to register metrics with. Defaults to the global one.
+        """
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError("PrometheusInstrumentation requires the prometheus-client package") from e
+
+        options = {} if registry is None else {"registry": registry}
+
+        self._stages = prometheus_client.Histogram(
+            f"{namespace}_stage_seconds", "Wall time of each deduplication stage.", ["stage"], **options
+        )
+        self._clusters = prometheus_client.Counter(
+            f"{namespace}_clusters", "Items assigned to new or existing clusters.", ["kind"], **options
+        )
+        self._pool_wait = prometheus_client.Histogram(
+            f"{namespace}_pool_wait_seconds", "Time spent checking connections out of the pool.", **options
+        )
+        self._cache = prometheus_client.Counter(
+            f"{namespace}_cache_lookups", "In-memory cache lookups.", ["cache", "result"], **options
+        )
+
+        # Resolving label children once keeps each callback to a single increment or observation.
+        self._stage_children = {stage: self._stages.labels(stage) for stage in STAGES}
+        self._new = self._clusters.labels("new")
+        self._existing = self._clusters.labels("existing")
+
+    def on_stage(self, stage: str, seconds: float) -> None:
+        self._stage_children[stage].observe(seconds)
+
+    def on_clusters(self, new: int, existing: int) -> None:
+        if new:
+            self._new.inc(new)
+
+        if existing:
+            self._existing.inc(existing)
+
+    def on_pool_wait(self, seconds: float) -> None:
+        self._pool_wait.observe(seconds)
+
+    def on_cache(self, cache: str, hits: int, misses: int) -> None:
+        if hits:
+            self._cache.labels(cache, "hit").inc(hits)
+
+        if misses:
+            self._cache.labels(cache, "miss").inc(misses)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    def __init__(self, meter: Any = None) -> None:
+        """
+        Records measurements as OpenTelemetry metrics:
+
+        - `dedup_pg.stage.duration`, a histogram in seconds with a `stage` attribute.
+        - `dedup_pg.clusters`, a counter with a `kind` attribute, `new` or `existing`.
+        - `dedup_pg.pool.wait`, a histogram in seconds.
+        - `dedup_pg.cache.lookups`, a counter with `cache` and `result` attributes, `hit` or `miss`.
+
+        Requires the `opentelemetry-api` package.
+
+        Args:
+            meter (Meter | None): The meter to create instruments with. Defaults to the `dedup_pg` meter of the
+                global meter provider.
+        """
+        try:
+            from opentelemetry import metrics
+        except ImportError as e:
+            raise ImportError("OpenTelemetryInstrumentation requires the opentelemetry-api package") from e
+
+        meter = metrics.get_meter("dedup_pg") if meter is None else meter
+
+        self._stages = meter.create_histogram(
+            "dedup_pg.stage.duration", unit="s", description="Wall time of each deduplication stage."
+        )
+        self._clusters = meter.create_counter(
+            "dedup_pg.clusters", description="Items assigned to new or existing clusters."
+        )
+        self._pool_wait = meter.create_histogram(
+            "dedup_pg.pool.wait", unit="s", description="Time spent checking connections out of the pool."
+        )
+        self._cache = meter.create_counter("dedup_pg.cache.lookups", description="In-memory cache lookups.")
+
+        self._stage_attributes = {stage: {"stage": stage} for stage in STAGES}
+
+    def on_stage(self, stage: str, seconds: float) -> None:
+        self._stages.record(seconds, self._stage_attributes[stage])
+
+    def on_clusters(self, new: int, existing: int) -> None:
+        if new:
+            self._clusters.add(new, {"kind": "new"})
+
+        if existing:
+            self._clusters.add(existing, {"kind": "existing"})
+
+    def on_pool_wait(self, seconds: float) -> None:
+        self._pool_wait.record(seconds)
+
+    def on_cache(self, cache: str, hits: int, misses: int) -> None:
+        if hits:
+            self._cache.add(hits, {"cache": cache, "result": "hit"})
+
+        if misses:
+            self._cache.add(misses, {"cache": cache, "result": "miss"})
@@ -0,0 +1,99 @@
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import TypeVar
+from uuid import UUID
+
+import numpy as np
+
+from .helpers import n_grams
+from .index import DedupIndex
+
+K = TypeVar("K")
+
+
+def _hash_batch(index: DedupIndex, texts: list[str], n: int) -> np.ndarray:
+    """
+    Shingles and hashes a batch of texts. This runs in worker processes, which receive the index without its backend.
+    """
+    return index.bands_many([n_grams(text, n=n) for text in texts])
+
+
+def dedup_stream(
+    items: Iterable[tuple[K, str]],
+    index: DedupIndex,
+    *,
+    n: int = 3,
+    batch_size: int = 256,
+    max_workers: int | None = None,
+    hash_depth: int | None = None,
+    write_depth: int = 2,
+    executor: Executor | None = None,
+) -> Iterator[tuple[K, UUID]]:
+    """
+    Deduplicates a stream of texts with a pipeline which overlaps hashing and backend writes.
+
+    Texts are grouped into batches which are shingled and hashed in a process pool. Hashed batches are then written
+    to the backend in order by a single writer thread with `DedupIndex.index_many`, while the next batches are still
+    being hashed. Memory stays bounded by the number of batches allowed in flight at each stage.
+
+    Args:
+        items (Iterable[tuple[K, str]]): The `(key, text)` pairs to deduplicate, which may be a lazy iterator.
+        index (DedupIndex): The index to deduplicate against. It must have a synchronous backend.
+        n (int): The length of the character n-grams to shingle texts with.
+        batch_size (int): The number of texts per batch.
+        max_workers (int | None): The number of hashing processes. Defaults to the number of CPUs.
+        hash_depth (int | None): The maximum number of batches being hashed at once. Defaults to twice the number of
+            hashing processes.
+        write_depth (int): The maximum number of hashed batches waiting on or being written to the backend.
+        executor (Executor | None): An executor to hash batches in instead of a new process pool.
+
+    Returns:
+        Iterator[tuple[K, UUID]]: The `(key, cluster_uuid)` pair of every item, in input order.
+    """
+    if batch_size <= 0 or write_depth <= 0:
+        raise ValueError("batch_size and write_depth must be positive integers")
+
+    workers = max_workers or os.cpu_count() or 1
+    hash_depth = 2 * workers if hash_depth is None else hash_depth
+
+    if hash_depth <= 0:
+        raise ValueError("hash_depth must be a positive integer")
+
+    hash_pool = ProcessPoolExecutor(workers) if executor is None else executor
+    write_pool = ThreadPoolExecutor(max_workers=1)
+
+    hashing: deque[tuple[list[K], Future[np.ndarray]]] = deque()
+    writing: deque[tuple[list[K], Future[list[UUID]]]] = deque()
+
+    def drain_writes(limit: int) -> Iterator[tuple[K, UUID]]:
+        while len(writing) > limit:
+            keys, future = writing.popleft()
+            yield from zip(keys, future.result())
+
+    def drain_hashes(limit: int) -> Iterator[tuple[K, UUID]]:
+        while len(hashing) > limit:
+            keys, future = hashing.popleft()
+            writing.append((keys, write_pool.submit(index.index_many, future.result())))
+            yield from drain_writes(write_depth)
+
+    iterator = iter(items)
+
+    try:
+        while batch := list(islice(iterator, batch_size)):
+            keys = [key for key, _ in batch]
+            texts = [text for _, text in batch]
+
+            hashing.append((keys, hash_pool.submit(_hash_batch, index, texts, n)))
+            yield from drain_hashes(hash_depth - 1)
+
+        yield from drain_hashes(0)
+        yield from drain_writes(0)
+    finally:
+        # Stop quickly if the consumer stops early or a stage fails.
+        write_pool.shutdown(cancel_futures=True)
+
+        if executor is None:
+            hash_pool.shutdown(cancel_futures=True)
@@ -0,0 +1,53 @@
+from collections.abc import Callable, Iterator
+
+import numpy as np
+import pytest
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import Backend, CompactBackend, LocalBackend, SharedMemoryBackend, SQLiteBackend
+from tests.utils.backends import partition
+
+BACKENDS: dict[str, Callable[[], Backend]] = {
+    "compact": lambda: CompactBackend(capacity=4),
+    "sqlite": SQLiteBackend,
+    "shared": lambda: SharedMemoryBackend(capacity=16384, stripes=3),
+}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request) -> Iterator[Backend]:
+    backend = BACKENDS[request.param]()
+    yield backend
+
+    if hasattr(backend, "unlink"):
+        backend.unlink()
+    elif hasattr(backend, "close"):
+        backend.close()
+
+
+def test_backend_matches_local_backend(backend: Backend) -> None:
+    rng = np.random.default_rng(0)
+    local = LocalBackend()
+    _ = DedupIndex(backend, num_perms=32, rows=4)
+    clusters, local_clusters = [], []
+
+    for _ in range(20):
+        # Few distinct values per band, so that items collide within and across batches
+        band_matrix = rng.integers(-200, 200, size=(300, 8))
+        clusters += backend.insert_many(band_matrix)
+        local_clusters += local.insert_many(band_matrix)
+
+        for bands in band_matrix[:5].tolist():
+            clusters.append(backend.insert(bands))
+            local_clusters.append(local.insert(bands))
+
+    assert partition(clusters) == partition(local_clusters)
+
+    for band_idx in (0, 3):
+        assert partition(clusters + [backend.query(band_idx, band) for band in range(-200, 200)]) == partition(
+            local_clusters + [local.query(band_idx, band) for band in range(-200, 200)]
+        )
+
+    bands = band_matrix[0].tolist()
+    assert partition(backend.lookup(bands).values()) == partition(local.lookup(bands).values())
+    assert backend.query(0, 1 << 40) is None
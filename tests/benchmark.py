@@ -0,0 +1,241 @@
+"""
+Offline microbenchmarks of the hashing and local backend hot paths.
+
+Run the suite with `python -m tests.benchmark`, which prints the results and writes them as JSON with `--output`.
+Given a `--baseline` from an earlier run, it fails when any benchmark is slower, or uses more memory per item, than
+the baseline by more than `--threshold`. Write a baseline with `--output` on a known-good revision, on the same
+machine the comparison will run on.
+"""
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import LocalBackend
+from dedup_pg.helpers import hashed_shingles, n_grams
+
+DOC_LENGTHS = (100, 1_000, 10_000)
+SETTINGS = ((64, 2), (128, 4), (256, 8))
+BACKEND_ITEMS = 5_000
+
+
+def _time(func: Callable[[], object], min_seconds: float, repeats: int) -> float:
+    """
+    Returns the best time per call over `repeats` runs of at least `min_seconds` each, which is the measurement
+    least disturbed by other processes.
+    """
+    calls = 1
+
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= min_seconds:
+            break
+
+        calls *= 2
+
+    best = elapsed / calls
+
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        best = min(best, (time.perf_counter() - start) / calls)
+
+    return best
+
+
+def _bytes_per_item(build: Callable[[], object], items: int) -> float:
+    tracemalloc.start()
+
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    del kept
+    return (after - before) / items
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(string.ascii_letters + " ") for _ in range(length))
+
+
+def run_benchmarks(*, min_seconds: float = 0.2, repeats: int = 5, seed: int = 0) -> dict[str, Any]:
+    """
+    Runs every benchmark.
+
+    Returns:
+        dict[str, Any]: The environment the suite ran in, and the results keyed by benchmark name. Every result has
+            the `seconds` per call, and memory benchmarks the `bytes_per_item` as well.
+    """
+    rng = random.Random(seed)
+    results: dict[str, dict[str, float]] = {}
+
+    def record(name: str, func: Callable[[], object]) -> None:
+        results[name] = {"seconds": _time(func, min_seconds, repeats)}
+
+    for length in DOC_LENGTHS:
+        text = _random_text(rng, length)
+        tokens = n_grams(text)
+        hashes = hashed_shingles(text)
+        record(f"n_grams[len={length}]", lambda text=text: n_grams(text))
+        record(f"hashed_shingles[len={length}]", lambda text=text: hashed_shingles(text))
+
+        for num_perms, rows in SETTINGS:
+            index = DedupIndex(num_perms=num_perms, rows=rows)
+            suffix = f"len={length},num_perms={num_perms},rows={rows}"
+            record(f"minhash_signature[{suffix}]", lambda index=index, tokens=tokens: index._minhash_signature(tokens))
+            record(f"bands[{suffix}]", lambda index=index, tokens=tokens: index.bands(tokens))
+            record(f"bands_from_hashes[{suffix}]", lambda index=index, hashes=hashes: index.bands_from_hashes(hashes))
+
+            oph = DedupIndex(num_perms=num_perms, rows=rows, signature="oph")
+            record(f"oph_bands[{suffix}]", lambda index=oph, tokens=tokens: index.bands(tokens))
+
+    # Short random items, so that nearly every insert creates a cluster
+    docs = [n_grams(_random_text(rng, 15)) for _ in range(BACKEND_ITEMS)]
+
+    for num_perms, rows in SETTINGS:
+        band_matrix = DedupIndex(num_perms=num_perms, rows=rows).bands_many(docs)
+        band_rows = band_matrix.tolist()
+        suffix = f"num_perms={num_perms},rows={rows}"
+
+        def fill(num_perms=num_perms, rows=rows, band_rows=band_rows) -> DedupIndex:
+            index = DedupIndex(LocalBackend(), num_perms=num_perms, rows=rows)
+            for bands in band_rows:
+                index.index(bands)
+            return index
+
+        backend = fill()._backend
+        results[f"LocalBackend.insert[{suffix}]"] = {
+            "seconds": _time(fill, min_seconds, repeats) / len(band_rows),
+            "bytes_per_item": _bytes_per_item(fill, len(band_rows)),
+        }
+        results[f"LocalBackend.query[{suffix}]"] = {
+            "seconds": _time(
+                lambda backend=backend, band_rows=band_rows: [backend.query(0, bands[0]) for bands in band_rows],
+                min_seconds,
+                repeats,
+            ) / len(band_rows),
+        }
+
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.1) -> list[str]:
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (dict[str, Any]): The output of `run_benchmarks`.
+        baseline (dict[str, Any]): The output of an earlier `run_benchmarks`.
+        threshold (float): The relative slowdown or memory growth tolerated, such as 0.1 for 10%.
+
+    Returns:
+        list[str]: A description of every regression. Benchmarks missing from either side are ignored.
+    """
+    regressions = []
+
+    for name, result in results["results"].items():
+        if (reference := baseline["results"].get(name)) is None:
+            continue
+
+        for metric in ("seconds", "bytes_per_item"):
+            if metric not in result or not reference.get(metric):
+                continue
+
+            ratio = result[metric] / reference[metric]
+
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{name} {metric}: {result[metric]:.6g} vs {reference[metric]:.6g} baseline (+{ratio - 1:.0%})"
+                )
+
+    return regressions
+
+
+def _format(results: dict[str, Any]) -> str:
+    width = max(len(name) for name in results["results"])
+    lines = []
+
+    for name, result in results["results"].items():
+        line = f"{name:<{width}}  {result['seconds'] * 1e6:>12.2f} us"
+
+        if "bytes_per_item" in result:
+            line += f"  {result['bytes_per_item']:>10.0f} B/item"
+
+        lines.append(line)
+
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    _ = parser.add_argument("--output", help="write the results as JSON to this path")
+    _ = parser.add_argument("--baseline", help="compare against the JSON results of an earlier run")
+    _ = parser.add_argument("--threshold", type=float, default=0.1, help="tolerated regression, 0.1 for 10%%")
+    _ = parser.add_argument("--min-seconds", type=float, default=0.2, help="minimum duration of each timing run")
+    _ = parser.add_argument("--repeats", type=int, default=5, help="timing runs per benchmark, the best is kept")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(min_seconds=args.min_seconds, repeats=args.repeats)
+    print(_format(results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+def test_benchmark_suite(tmp_path):
+    output = tmp_path / "results.json"
+    assert main(["--output", str(output), "--min-seconds", "0.001", "--repeats", "1"]) == 0
+
+    results = json.loads(output.read_text())
+    assert "bands[len=1000,num_perms=128,rows=4]" in results["results"]
+    assert "oph_bands[len=1000,num_perms=128,rows=4]" in results["results"]
+    assert "bands_from_hashes[len=1000,num_perms=128,rows=4]" in results["results"]
+    assert results["results"]["LocalBackend.insert[num_perms=128,rows=4]"]["bytes_per_item"] > 0
+
+    # A baseline twice as fast flags every timing, and an identical one flags nothing
+    assert compare(results, results) == []
+
+    faster = {"results": {name: {"seconds": result["seconds"] / 2} for name, result in results["results"].items()}}
+    assert len(compare(results, faster, threshold=0.5)) == len(results["results"])
+    assert compare(results, faster, threshold=1.5) == []
+
+
+if __name__ == "__main__":
+    sys.exit(main())
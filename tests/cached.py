@@ -0,0 +1,136 @@
+import random
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+import numpy as np
+import pytest
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import Backend, CachedBackend, LocalBackend, LRUCache, SQLiteBackend
+from dedup_pg.helpers import n_grams
+from tests.readme import readme_func
+from tests.utils.backends import partition
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def _insert_many_created(self, band_matrix) -> tuple[list[UUID], list[bool] | None]:
+        # Every insert of the local backend goes through here.
+        self.calls += 1
+        return super()._insert_many_created(band_matrix)
+
+
+def test_cached_backend():
+    inner = CountingBackend()
+    backend = CachedBackend(inner, max_entries=1000)
+    result = list(readme_func(backend).values())
+
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    index = DedupIndex(backend)
+    calls = inner.calls
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+
+    assert inner.calls == calls
+    assert backend.stats.hits >= 2
+
+    uuids = index.query_many([
+        n_grams("The quick brown fox jumps over the lazy dog"),
+        n_grams("Something that was never seen before"),
+        n_grams("Something that was never seen before!"),
+    ])
+
+    assert uuids[0] == cluster
+    assert uuids[1] == uuids[2] != cluster
+    assert inner.calls == calls + 1
+    assert index.lookup(n_grams("The quick brown fox jumps over the lazy dog")) == {cluster: index.num_bands}
+
+
+@pytest.mark.parametrize("inner_type", [LocalBackend, SQLiteBackend])
+@pytest.mark.parametrize("max_entries", [64, 100_000])
+def test_cached_backend_matches_inner_backend(inner_type: type[Backend], max_entries: int):
+    rng = np.random.default_rng(0)
+    inner, plain = inner_type(), inner_type()
+    backend = CachedBackend(inner, max_entries=max_entries)
+    _ = DedupIndex(backend, num_perms=32, rows=4), DedupIndex(plain, num_perms=32, rows=4)
+    pool = rng.integers(0, 1 << 62, size=(200, 8))
+    clusters, plain_clusters = [], []
+
+    for _ in range(10):
+        # Exact repeats of earlier items, and near duplicates keeping their first bands
+        band_matrix = pool[rng.integers(0, len(pool), size=50)]
+        band_matrix[::3, 4:] = rng.integers(0, 1 << 62, size=(len(band_matrix[::3]), 4))
+        clusters += backend.insert_many(band_matrix)
+        plain_clusters += plain.insert_many(band_matrix)
+
+        for bands in band_matrix[:10].tolist():
+            clusters.append(backend.insert(bands))
+            plain_clusters.append(plain.insert(bands))
+
+    assert partition(clusters) == partition(plain_clusters)
+    assert backend.stats.hits > 0
+
+
+@pytest.mark.parametrize("inner_type", [LocalBackend, SQLiteBackend])
+@pytest.mark.parametrize("max_entries", [64, 100_000])
+def test_cached_backend_agrees_with_inner_backend(inner_type: type[Backend], max_entries: int):
+    rng = np.random.default_rng(0)
+    inner = inner_type()
+    backend = CachedBackend(inner, max_entries=max_entries)
+    _ = DedupIndex(backend, num_perms=32, rows=4)
+
+    for _ in range(10):
+        # Few distinct values per band, so that items share some bands with clusters they do not join
+        _ = backend.insert_many(rng.integers(-50, 50, size=(50, 8)))
+
+        # Items join a cluster holding one of their bands
+        for bands in rng.integers(-50, 50, size=(10, 8)).tolist():
+            assert backend.insert(bands) in inner.lookup(bands)
+
+    # Cached bands map to the inner backend's cluster
+    for band_idx in range(8):
+        assert [backend.query(band_idx, band) for band in range(-50, 50)] == [
+            inner.query(band_idx, band) for band in range(-50, 50)
+        ]
+
+
+def test_lru_cache_eviction_and_ttl():
+    cache: LRUCache[int, str] = LRUCache(max_entries=2, ttl=0.05)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.get(1) == "a"
+
+    cache.put(3, "c")
+    assert cache.get(2) is None
+    assert cache.find([2, 3, 1]) == "c"
+    assert cache.stats.evictions == 1
+
+    time.sleep(0.06)
+    assert cache.get(1) is None
+    assert cache.stats.expirations == 1
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+
+
+def test_cached_backend_threads():
+    backend = CachedBackend(LocalBackend(), max_entries=64)
+    index = DedupIndex(backend)
+    rng = random.Random(0)
+    texts = ["".join(rng.choice(string.ascii_letters) for _ in range(15)) for _ in range(20)]
+
+    def work() -> list[UUID]:
+        return [index.query(n_grams(text)) for text in texts * 5]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(work) for _ in range(8)]
+    # result() re-raises anything a worker raised
+    results = [future.result() for future in futures]
+
+    assert len(backend.cache) <= 64
+    assert backend.stats.evictions > 0
+    assert all(len(uuids) == 100 for uuids in results)
@@ -0,0 +1,84 @@
+import random
+import string
+import time
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import CompactBackend, LocalBackend
+from dedup_pg.helpers import n_grams
+from tests.readme import readme_func
+
+
+def test_compact_backend():
+    result = list(readme_func(CompactBackend()).values())
+
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    backend = CompactBackend()
+    index = DedupIndex(backend)
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+
+    assert index.lookup(n_grams(" he quic  bnown f x jump  over the  azy dog")).keys() == {cluster}
+    assert backend.query(0, 12345) is None
+
+
+def test_compact_backend_memory():
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(20_000)]
+    index = DedupIndex()
+    band_matrix = index.bands_many(docs)
+
+    for name, backend in (("LocalBackend", LocalBackend()), ("CompactBackend", CompactBackend())):
+        index = DedupIndex(backend)
+        start = time.perf_counter()
+        for i in range(0, len(band_matrix), 1000):
+            _ = index.index_many(band_matrix[i:i + 1000])
+        seconds = time.perf_counter() - start
+
+        if isinstance(backend, CompactBackend):
+            print(f"\n{name}: {len(band_matrix) / seconds:.0f} items/s, {backend.bytes_per_item:.0f} bytes/item")
+            assert backend.bytes_per_item < 2000
+        else:
+            print(f"\n{name}: {len(band_matrix) / seconds:.0f} items/s")
+
+
+def test_compact_backend_snapshot(tmp_path):
+    import pytest
+
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(5000)]
+    backend = CompactBackend()
+    index = DedupIndex(backend, seed=7)
+    clusters = index.query_many(docs)
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    backend.save(tmp_path / "index.snapshot")
+
+    for mmap in (True, False):
+        loaded = CompactBackend.load(tmp_path / "index.snapshot", mmap=mmap)
+        index = DedupIndex(loaded, seed=7)
+
+        assert index.query_many(docs) == clusters
+        assert index.query(n_grams(" he quic  bnown f x jump  over the  azy dog")) == cluster
+        assert index.query(n_grams("An entirely different sentence!")) != cluster
+        assert len(loaded) == len(backend) + len(docs) + 2
+
+    # New items never write through to the snapshot
+    loaded = DedupIndex(CompactBackend.load(tmp_path / "index.snapshot"), seed=7)
+    assert loaded.lookup(n_grams("An entirely different sentence!")) == {}
+
+    for params in ({"seed": 8}, {"signature": "oph", "seed": 7}, {"rows": 8, "seed": 7}):
+        with pytest.raises(ValueError):
+            _ = DedupIndex(CompactBackend.load(tmp_path / "index.snapshot"), **params)
+
+    # Seeds take the whole unsigned 64-bit range
+    backend = CompactBackend()
+    cluster = DedupIndex(backend, seed=(1 << 64) - 1).query(n_grams("The quick brown fox jumps over the lazy dog"))
+    backend.save(tmp_path / "seeded.snapshot")
+    loaded = DedupIndex(CompactBackend.load(tmp_path / "seeded.snapshot"), seed=(1 << 64) - 1)
+    assert loaded.query(n_grams("The quick brown fox jumps over the lazy dog")) == cluster
+
+    for seed in (-1, 1 << 64):
+        with pytest.raises(ValueError):
+            _ = DedupIndex(seed=seed)
+
+    # A backend without an index has no parameters to record
+    with pytest.raises(ValueError):
+        CompactBackend().save(tmp_path / "detached.snapshot")
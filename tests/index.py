@@ -0,0 +1,433 @@
+import struct
+
+import numpy as np
+import pytest
+import xxhash
+
+from dedup_pg import DedupIndex
+from dedup_pg.helpers import n_grams
+from dedup_pg.index import MAX64, MIX_CONST
+
+
+def _reference_bands(index: DedupIndex, tokens: list[str]) -> list[int]:
+    # The original per-token, per-band implementation which indexes in the wild were built with
+    perm = np.arange(index.num_hashes, dtype=np.uint64) * MIX_CONST
+    signature = np.full(index.num_hashes, MAX64, dtype=np.uint64)
+
+    for token in tokens:
+        signature = np.minimum(signature, np.uint64(xxhash.xxh3_64(token).intdigest()) ^ perm)
+
+    bands = []
+    for i in range(0, len(signature), index.rows):
+        band = signature[i:i + index.rows]
+        payload = struct.pack(f"{len(band)}Q", *band)
+        bands.append(int(np.uint64(xxhash.xxh64(payload).intdigest()).view(np.int64)))
+
+    return bands
+
+
+def test_bands_many_matches_bands():
+    docs = [
+        n_grams("The quick brown fox jumps over the lazy dog"),
+        [],
+        n_grams("An entirely different sentence!"),
+        n_grams("héllo wörld, ünïcode"),
+    ]
+
+    for num_perms, rows in ((128, 4), (64, 8), (30, 4)):
+        index = DedupIndex(num_perms=num_perms, rows=rows)
+        matrix = index.bands_many(docs)
+
+        assert matrix.dtype == np.int64
+        for row, tokens in zip(matrix, docs):
+            assert row.tolist() == index.bands(tokens) == _reference_bands(index, tokens)
+
+
+def test_query_many_groups_batch_duplicates():
+    index = DedupIndex()
+    existing = index.query(n_grams("An entirely different sentence!"))
+
+    docs = [
+        n_grams("The quick brown fox jumps over the lazy dog"),
+        n_grams("An entirely different sentence!"),
+        n_grams(" he quic  bnown f x jump  over the  azy dog"),
+        n_grams("Something unrelated to everything else"),
+    ]
+    uuids = index.query_many(docs)
+
+    assert uuids[0] == uuids[2]
+    assert uuids[1] == existing
+    assert len({uuids[0], uuids[1], uuids[3]}) == 3
+    assert index.query_many([]) == []
+    assert index.query(docs[2]) == uuids[0]
+
+
+def test_query_matches_query_many():
+    def partition(uuids) -> list[int]:
+        seen: dict = {}
+        return [seen.setdefault(uuid, len(seen)) for uuid in uuids]
+
+    # b joins a through its first band, and c only shares a band b brought to the index
+    single, batched = DedupIndex(), DedupIndex()
+    a, b, c = ([offset + i for i in range(single.num_bands)] for offset in (1000, 2000, 3000))
+    b[0], c[5] = a[0], b[5]
+
+    assert partition([single.index(bands) for bands in (a, b, c)]) == partition(batched.index_many([a, b, c]))
+    assert single.index(iter(c)) == single.index(a)
+
+    docs = [n_grams(text) for text in (
+        "The quick brown fox jumps over the lazy dog",
+        " he quic  bnown f x jump  over the  azy dog",
+        " he quic  bnown f x jump  over the  azy do ",
+        "An entirely different sentence!",
+    )]
+    single, batched = DedupIndex(), DedupIndex()
+    assert partition([single.query(doc) for doc in docs]) == partition(batched.query_many(docs))
+
+
+def test_async_query_with_sync_backend():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = DedupIndex()
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first = await index.aquery(n_grams("The quick brown fox jumps over the lazy dog"), executor=executor)
+            many = await index.aquery_many(
+                [n_grams(" he quic  bnown f x jump  over the  azy dog"), n_grams("An entirely different sentence!")],
+                executor=executor,
+            )
+        return first, many
+
+    first, many = asyncio.run(run())
+
+    assert many[0] == first
+    assert many[1] != first
+
+
+def test_oph_signature():
+    from tests.readme import readme_func
+    from dedup_pg.backend import LocalBackend
+
+    index = DedupIndex(signature="oph")
+    docs = [n_grams("The quick brown fox jumps over the lazy dog"), [], n_grams("ab"), n_grams("héllo wörld")]
+
+    for row, tokens in zip(index.bands_many(docs), docs):
+        assert row.tolist() == index.bands(tokens)
+
+    backend = LocalBackend()
+    result = list(readme_func(backend, signature="oph").values())
+
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    # A backend built with OPH refuses a MinHash index
+    with pytest.raises(ValueError):
+        _ = DedupIndex(backend)
+
+
+def test_oph_jaccard_estimate():
+    import random
+    import string
+
+    rng = random.Random(0)
+    pairs = []
+    for _ in range(200):
+        text = "".join(rng.choice(string.ascii_lowercase + " ") for _ in range(2000))
+        edited = list(text)
+        for i in rng.sample(range(len(edited)), rng.randrange(1, 400)):
+            edited[i] = rng.choice(string.ascii_lowercase)
+        pairs.append((n_grams(text), n_grams("".join(edited))))
+
+    docs = [doc for pair in pairs for doc in pair]
+
+    # OPH estimates the Jaccard similarity of near-duplicates about as well as MinHash does
+    for signature in ("minhash", "oph"):
+        index = DedupIndex(signature=signature)
+        signatures = index._signatures(*index._token_hashes(docs))
+
+        errors = []
+        for i, (a, b) in enumerate(pairs):
+            jaccard = len(set(a) & set(b)) / len(set(a) | set(b))
+            estimate = np.mean(signatures[2 * i] == signatures[2 * i + 1])
+            errors.append(abs(estimate - jaccard))
+
+        assert np.mean(errors) < 0.05
+
+
+def test_simhash_signature():
+    from dedup_pg.backend import LocalBackend
+
+    index = DedupIndex(LocalBackend(), num_perms=256, rows=16, signature="simhash")
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(100, 384)).astype(np.float32)
+    near = embeddings + 0.1 * rng.normal(size=embeddings.shape).astype(np.float32)
+
+    # Rows of a batch, and float16 embeddings, band the same as single float32 embeddings
+    bands = index.bands_many_from_embeddings(embeddings)
+    assert bands.shape == (100, 16) and bands.dtype == np.int64
+    assert bands[3].tolist() == index.bands_from_embedding(embeddings[3])
+
+    half = embeddings.astype(np.float16)
+    assert index.bands_from_embedding(half[3]) == index.bands_from_embedding(half[3].astype(np.float32))
+
+    # Each sign bit agrees with a probability of 1 - angle / pi
+    a, b = embeddings[0], near[0]
+    angle = np.arccos(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+    bits = index._simhash_signatures(np.stack([a, b]))
+    assert abs((bits[0] == bits[1]).mean() - (1 - angle / np.pi)) < 0.05
+
+    clusters = index.index_many(bands)
+    assert len(set(clusters)) == 100
+    assert index.index_many(index.bands_many_from_embeddings(near)) == clusters
+
+    # Tokens and embeddings are only banded by an index of the matching signature
+    for func, arg in ((index.bands, ["ab"]), (DedupIndex().bands_from_embedding, embeddings[0])):
+        with pytest.raises(ValueError):
+            _ = func(arg)
+
+
+def test_signature_verification():
+    from dedup_pg.backend import LocalBackend
+    from dedup_pg.index import SIGNATURE_BITS, _pack_signatures, _unpack_signature
+
+    signatures = np.random.default_rng(0).integers(0, 1 << 63, size=(3, 100), dtype=np.uint64)
+
+    for bits in SIGNATURE_BITS:
+        values, unpacked_bits = _unpack_signature(_pack_signatures(signatures, bits)[1], 100)
+        assert unpacked_bits == bits
+        assert (values == signatures[1] & np.uint64((1 << bits) - 1)).all()
+
+    base = n_grams("the quick brown fox jumps over the lazy dog and keeps running far away")
+    near = n_grams("the quick brown fox jumps over the lazzy dog and keeps running far away")
+    other = n_grams("a quick brown cat sleeps under the warm sun while the dog barks loudly")
+
+    for bits in (32, 4, 1):
+        # With one row per band, unrelated sentences share a band and would land in the same cluster.
+        backend = LocalBackend()
+        index = DedupIndex(backend, num_perms=128, rows=1, signature_bits=bits)
+        assert index.query(other) == index.query(base)
+
+        backend = LocalBackend()
+        index = DedupIndex(backend, num_perms=128, rows=1, signature_bits=bits)
+        cluster = index.query(base, verify_threshold=0.6)
+        other_cluster = index.query(other, verify_threshold=0.6)
+
+        assert other_cluster != cluster
+        assert index.query(near, verify_threshold=0.6) == cluster
+        assert index.query(other, verify_threshold=0.6) == other_cluster
+        assert set(backend.query_signatures([cluster, other_cluster])) == {cluster, other_cluster}
+
+    # Batches record the signature of the first item of each cluster
+    backend = LocalBackend()
+    index = DedupIndex(backend, signature_bits=8)
+    clusters = index.query_many([base, near, other])
+    assert len(backend.query_signatures(clusters)) == len(set(clusters)) == 2
+
+    with pytest.raises(ValueError):
+        DedupIndex().query(base, verify_threshold=0.6)
+
+
+def test_lookup_is_read_only():
+    from dedup_pg.backend import LocalBackend
+
+    backend = LocalBackend()
+    index = DedupIndex(backend)
+    text = "The quick brown fox jumps over the lazy dog"
+
+    assert index.lookup(n_grams(text)) == {}
+    assert not backend._index
+
+    cluster = index.query(n_grams(text))
+    size = len(backend._index)
+    candidates = index.lookup(n_grams(" he quic  bnown f x jump  over the  azy dog"))
+
+    assert list(candidates) == [cluster]
+    assert 0 < candidates[cluster] < index.num_bands
+    assert index.lookup(n_grams(text)) == {cluster: index.num_bands}
+    assert len(backend._index) == size
+
+
+def test_exact_duplicate_fast_path():
+    import asyncio
+
+    index = DedupIndex(fingerprint_cache=100)
+    text = "The quick brown fox jumps over the lazy dog"
+    cluster = index.query(n_grams(text), content=text)
+
+    def fail(_):
+        raise AssertionError("An exact duplicate must not be hashed")
+
+    bands = index.bands
+    index.bands = fail
+    assert index.query(content=text) == cluster
+    assert index.query(content=text.encode("utf-8")) == cluster
+    assert asyncio.run(index.aquery(content=text)) == cluster
+    index.bands = bands
+
+    assert index.query(content=" he quic  bnown f x jump  over the  azy dog") == cluster
+    assert index.query(content="An entirely different sentence!") != cluster
+    assert index._fingerprints is not None and index._fingerprints.stats.hits == 3
+
+
+def test_local_backend_merge():
+    from dedup_pg.backend import LocalBackend
+
+    backend = LocalBackend(merge=True)
+    index = DedupIndex(backend)
+    a, b, c = ([offset + i for i in range(index.num_bands)] for offset in (1000, 2000, 3000))
+
+    cluster_a, cluster_b, cluster_c = index.index_many([a, b, c])
+    assert len({cluster_a, cluster_b, cluster_c}) == 3
+
+    # An item bridging a and b merges their clusters into the smallest UUID, and later bridges chain merges.
+    canonical = index.index(a[:4] + b[4:])
+    assert canonical == min(cluster_a, cluster_b)
+    assert index.index(a) == index.index(b) == canonical
+    assert index.index_many([b[:4] + c[4:], c])[1] == min(canonical, cluster_c)
+
+    canonical = min(canonical, cluster_c)
+    assert {backend.resolve(cluster) for cluster in (cluster_a, cluster_b, cluster_c)} == {canonical}
+    assert backend.lookup(a) == {canonical: index.num_bands}
+
+    assert backend.compact() > 0
+    assert set(backend._index.values()) == {canonical}
+    assert backend.compact() == 0
+
+
+def test_tenants():
+    from dedup_pg.backend import CachedBackend, CompactBackend, LocalBackend
+
+    for backend in (LocalBackend(), CachedBackend(LocalBackend())):
+        index = DedupIndex(backend, fingerprint_cache=16)
+        tokens = n_grams("The same document, uploaded by two tenants")
+
+        a = index.query(tokens, tenant="a")
+        b = index.query(tokens, tenant="b")
+        assert a != b
+        assert index.query(tokens, tenant="a") == a
+        boilerplate = "Shared boilerplate"
+        assert index.query(content=boilerplate, tenant="a") != index.query(content=boilerplate, tenant="b")
+        assert index.lookup(tokens, tenant="b") == {b: index.num_bands}
+        assert index.lookup(tokens) == {}
+
+    with pytest.raises(TypeError):
+        DedupIndex(CompactBackend()).query(tokens, tenant="a")
+
+
+def test_for_threshold():
+    from dedup_pg.banding import ERROR_SLACK, choose_banding, estimate_banding
+
+    # A single row in a single band collides with probability s, whose integrals are known
+    single = estimate_banding(0.6, 1, 1)
+    assert single.false_positive == pytest.approx(0.6 ** 2 / 2)
+    assert single.false_negative == pytest.approx(0.4 ** 2 / 2)
+
+    default = DedupIndex().estimate(0.8)
+    assert default.rows_per_item == 32
+
+    # The default banding is a candidate, so a target error of its own cuts rows without losing accuracy
+    cheaper = choose_banding(0.8, max_error=default.error())
+    assert cheaper.error() <= default.error()
+    assert cheaper.rows_per_item < default.rows_per_item
+
+    # Without a target, the fewest bands within a slack of the lowest error are picked
+    chosen = choose_banding(0.8)
+    assert chosen.error() <= ERROR_SLACK * default.error()
+    assert chosen.num_bands < choose_banding(0.8, max_error=0.9 * chosen.error()).num_bands
+
+    # Weighting false negatives lowers the false negative rate
+    assert choose_banding(0.8, fp_weight=0.1, fn_weight=0.9).false_negative < choose_banding(0.8).false_negative
+
+    with pytest.raises(ValueError):
+        choose_banding(0.8, max_bands=2, max_error=0.001)
+
+    index = DedupIndex.for_threshold(0.8, seed=1)
+    best = choose_banding(0.8)
+    assert (index.num_hashes, index.rows, index.seed) == (best.num_perms, best.rows, 1)
+    assert index.estimate(0.8) == best
+    assert index.num_bands <= 32 // 4
+
+    text = "The quick brown fox jumps over the lazy dog, then naps in the afternoon sun"
+    cluster = index.query(n_grams(text))
+    assert index.query(n_grams(text.replace("naps", "nap"))) == cluster
+    assert index.query(n_grams("An entirely different sentence!")) != cluster
+
+
+def test_instrumentation():
+    import pickle
+    from collections import Counter
+
+    from dedup_pg import Instrumentation
+    from dedup_pg.backend import CachedBackend, LocalBackend
+
+    class Recorder(Instrumentation):
+        def __init__(self):
+            self.stages = Counter()
+            self.clusters = [0, 0]
+            self.cache = Counter()
+
+        def on_stage(self, stage, seconds):
+            assert seconds >= 0
+            self.stages[stage] += 1
+
+        def on_clusters(self, new, existing):
+            self.clusters[0] += new
+            self.clusters[1] += existing
+
+        def on_cache(self, cache, hits, misses):
+            self.cache[cache, "hit"] += hits
+            self.cache[cache, "miss"] += misses
+
+    recorder = Recorder()
+    index = DedupIndex(LocalBackend(), fingerprint_cache=16, instrumentation=recorder)
+    text = "The quick brown fox jumps over the lazy dog"
+
+    cluster = index.query(content=text)
+    assert index.query(content=text) == cluster
+    assert index.query(n_grams(text)) == cluster
+    assert recorder.stages == {"shingle": 1, "signature": 2, "bands": 2, "backend": 4}
+    assert recorder.clusters == [1, 1]
+    assert recorder.cache == {("fingerprint", "hit"): 1, ("fingerprint", "miss"): 1}
+
+    _ = index.query_many([n_grams("An entirely different sentence!"), n_grams(text)])
+    assert recorder.clusters == [2, 2]
+
+    recorder = Recorder()
+    index = DedupIndex(CachedBackend(LocalBackend()), instrumentation=recorder)
+    assert index.query(n_grams(text)) == index.query(n_grams(text))
+    assert recorder.cache == {("bands", "hit"): 1, ("bands", "miss"): 1}
+    assert recorder.clusters == [1, 1]
+
+    # Instrumentation stays in the process it was created in
+    assert pickle.loads(pickle.dumps(index)).instrumentation is None
+
+
+def test_hashed_shingles():
+    from dedup_pg.helpers import hashed_shingles
+
+    text = "The quick brown fox jumps over the lazy dog"
+    shingles = hashed_shingles(text)
+
+    assert shingles.dtype == np.uint64
+    assert len(shingles) == len(n_grams(text))
+    assert len(set(shingles.tolist())) == len(set(n_grams(text)))
+    assert np.array_equal(hashed_shingles(text.encode("utf-8")), shingles)
+    assert np.array_equal(hashed_shingles(text.upper(), casefold=True), hashed_shingles(text.lower()))
+    assert np.array_equal(hashed_shingles("é", n=1, normalize="NFC"), hashed_shingles("é", n=1))
+    assert len(hashed_shingles("ab")) == 0
+
+    words = hashed_shingles("a b  a\tb c", n=2, unit="word")
+    assert len(words) == 4 and words[0] == words[2] and words[0] != words[1]
+
+    index = DedupIndex()
+    docs = [shingles, hashed_shingles(""), hashed_shingles("An entirely different sentence!")]
+    matrix = index.bands_many_from_hashes(docs)
+
+    for row, hashes in zip(matrix, docs):
+        assert row.tolist() == index.bands_from_hashes(hashes)
+
+    # Near-duplicates share bands just like with string tokens
+    near = index.bands_from_hashes(hashed_shingles(text.replace("lazy", "lazzy")))
+    assert set(near) & set(matrix[0].tolist())
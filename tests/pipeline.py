@@ -0,0 +1,20 @@
+from dedup_pg import DedupIndex
+from dedup_pg.pipeline import dedup_stream
+
+
+def test_dedup_stream():
+    corpus = [
+        ("key1", "The quick brown fox jumps over the lazy dog"),
+        ("key2", " he quic  bnown f x jump  over the  azy dog"),
+        ("key3", "An entirely different sentence!"),
+    ] * 5
+
+    index = DedupIndex()
+    result = list(dedup_stream(iter(corpus), index, batch_size=2, max_workers=2, write_depth=1))
+
+    assert [key for key, _ in result] == [key for key, _ in corpus]
+
+    clusters = dict(result)
+    assert clusters["key1"] == clusters["key2"]
+    assert clusters["key1"] != clusters["key3"]
+    assert {cluster for _, cluster in result} == {clusters["key1"], clusters["key3"]}
@@ -5,7 +5,7 @@ import statistics
 import string
 import random
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import MetaData, create_engine, text
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from dedup_pg.backend.sqlalchemy import SQLAlchemyBackend
@@ -69,33 +69,45 @@ def test_postgres_sequential_insert(postgres_server: dict[str, str]) -> None:
     engine = create_engine(database_url)
     SessionLocal = sessionmaker(engine)
 
-    index = DedupIndex(
-        SQLAlchemyBackend(
-            engine=engine,
-            base_or_metadata=Base,
-            table_name="seq_lsh_index",
+    # The default statement, then the array-bound one prepared once per connection
+    for prepared, table_name in ((False, "seq_lsh_index"), (True, "seq_prepared_lsh_index")):
+        index = DedupIndex(
+            SQLAlchemyBackend(
+                engine=engine,
+                base_or_metadata=Base,
+                table_name=table_name,
+                prepared=prepared,
+            )
         )
-    )
 
-    Base.metadata.create_all(engine)
+        Base.metadata.create_all(engine)
 
-    latencies = []
+        latencies = []
 
-    # Refreshes planner
-    with SessionLocal() as session:
-        _ = session.execute(text("ANALYZE seq_lsh_index"))
-        session.commit()
-
-    for i in range(5000):
-        rand_str = n_grams("".join([random.choice(string.ascii_letters) for _ in range(15)]))
-        t = timeit.timeit(
-            lambda s=rand_str: index.query(s),
-            number=1,
-        )
+        # Refreshes planner
+        with SessionLocal() as session:
+            _ = session.execute(text(f"ANALYZE {table_name}"))
+            session.commit()
+
+        for i in range(5000):
+            rand_str = n_grams("".join([random.choice(string.ascii_letters) for _ in range(15)]))
+            t = timeit.timeit(
+                lambda s=rand_str: index.query(s),
+                number=1,
+            )
+
+            latencies.append(t)
 
-        latencies.append(t)
+        _summarize(f"Per-call latency over 5000 random sequential inserts ({prepared=})", latencies)
 
-    _summarize("Per-call latency over 5000 random sequential inserts", latencies)
+    # Near-duplicates still join the first cluster through the prepared statement
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    assert index.query(n_grams(" he quic  bnown f x jump  over the  azy dog")) == cluster
+    assert index.query_many([n_grams("The quick brown fox jumps over the lazy dog")]) == [cluster]
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT count(*) FROM pg_prepared_statements WHERE name LIKE 'dedup_pg_%'"))
+        assert rows.scalar() == 1  # Prepared once, on the single pooled connection used sequentially
 
 
 def test_postgres_profile_insert(postgres_server: dict[str, str]) -> None:
@@ -170,3 +182,754 @@ def test_postgres_explain_insert(postgres_server: dict[str, str]) -> None:
     for line in plan_lines:
         print(line)
 
+
+
+def test_postgres_insert_many(postgres_server: dict[str, str]) -> None:
+    database_url = _fmt_database_url(postgres_server)
+    engine = create_engine(database_url)
+
+    index = DedupIndex(
+        SQLAlchemyBackend(
+            engine=engine,
+            base_or_metadata=Base,
+            table_name="many_lsh_index",
+        )
+    )
+
+    Base.metadata.create_all(engine)
+
+    existing = index.query(n_grams("An entirely different sentence!"))
+    uuids = index.query_many([
+        n_grams("The quick brown fox jumps over the lazy dog"),
+        n_grams("An entirely different sentence!"),
+        n_grams(" he quic  bnown f x jump  over the  azy dog"),
+    ])
+
+    assert uuids[0] == uuids[2]
+    assert uuids[1] == existing
+    assert uuids[0] != existing
+
+    docs = [
+        n_grams("".join([random.choice(string.ascii_letters) for _ in range(15)]))
+        for _ in range(5000)
+    ]
+    latencies = []
+
+    for i in range(0, len(docs), 500):
+        t = timeit.timeit(lambda batch=docs[i:i + 500]: index.query_many(batch), number=1)
+        latencies.append(t / 500)
+
+    _summarize("Amortized per-item latency over 5000 random inserts in batches of 500", latencies)
+
+
+def test_postgres_bulk_load(postgres_server: dict[str, str]) -> None:
+    database_url = _fmt_database_url(postgres_server)
+    engine = create_engine(database_url)
+    backend = SQLAlchemyBackend(
+        engine=engine,
+        base_or_metadata=Base,
+        table_name="bulk_lsh_index",
+    )
+    index = DedupIndex(backend)
+
+    Base.metadata.create_all(engine)
+    backend.bulk_reset()
+
+    existing = index.query(n_grams("An entirely different sentence!"))
+    corpus = [
+        [
+            n_grams("The quick brown fox jumps over the lazy dog"),
+            n_grams("An entirely different sentence!"),
+        ],
+        [
+            n_grams(" he quic  bnown f x jump  over the  azy dog"),
+        ],
+        [
+            n_grams("".join([random.choice(string.ascii_letters) for _ in range(15)]))
+            for _ in range(20000)
+        ],
+    ]
+
+    def interrupted_batches():
+        yield index.bands_many(corpus[0])
+        raise KeyboardInterrupt
+
+    try:
+        backend.bulk_load(interrupted_batches())
+    except KeyboardInterrupt:
+        pass
+
+    stats = backend.bulk_load(
+        (index.bands_many(docs) for docs in corpus),
+        rebuild_index=True,
+        on_batch=lambda s: print(f"\n{s.rows} rows staged at {s.rows_per_second:.0f} rows/s"),
+    )
+
+    assert stats.skipped_batches == 1
+    assert stats.batches == 2
+
+    clusters = {(batch_no, row): cluster for batch_no, row, cluster in backend.bulk_clusters()}
+
+    assert len(clusters) == 20003
+    assert clusters[0, 0] == clusters[1, 0]
+    assert clusters[0, 1] == existing
+    assert index.query(n_grams("The quick brown fox jumps over the lazy dog")) == clusters[0, 0]
+
+
+def test_postgres_async_query(postgres_server: dict[str, str]) -> None:
+    import asyncio
+
+    import pytest
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from dedup_pg.backend.sqlalchemy import AsyncSQLAlchemyBackend
+
+    _ = pytest.importorskip("asyncpg")
+    engine = create_engine(_fmt_database_url(postgres_server))
+    async_engine = create_async_engine(
+        _fmt_database_url(postgres_server).replace("postgresql+psycopg2", "postgresql+asyncpg")
+    )
+
+    metadata = MetaData()
+    sync_index = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="async_lsh_index")
+    )
+    async_index = DedupIndex(
+        AsyncSQLAlchemyBackend(engine=async_engine, base_or_metadata=MetaData(), table_name="async_lsh_index")
+    )
+    prepared_index = DedupIndex(
+        AsyncSQLAlchemyBackend(
+            engine=async_engine, base_or_metadata=MetaData(), table_name="async_lsh_index", prepared=True
+        )
+    )
+
+    metadata.create_all(engine)
+
+    async def run():
+        first = await async_index.aquery(n_grams("The quick brown fox jumps over the lazy dog"))
+        many = await async_index.aquery_many([
+            n_grams(" he quic  bnown f x jump  over the  azy dog"),
+            n_grams("An entirely different sentence!"),
+        ])
+        assert await prepared_index.aquery(n_grams("The quick brown fox jumps over the lazy dgo")) == first
+        assert await prepared_index.aquery_many([n_grams("An entirely different sentence?")]) == [many[1]]
+        await async_engine.dispose()
+        return first, many
+
+    first, many = asyncio.run(run())
+
+    assert many[0] == first
+    assert many[1] != first
+    assert sync_index.query(n_grams("An entirely different sentence!")) == many[1]
+
+
+def test_postgres_instrumentation(postgres_server: dict[str, str]) -> None:
+    from collections import defaultdict
+
+    from dedup_pg import Instrumentation
+
+    class Recorder(Instrumentation):
+        def __init__(self):
+            self.stages = defaultdict(list)
+            self.pool_waits = []
+            self.clusters = [0, 0]
+
+        def on_stage(self, stage, seconds):
+            self.stages[stage].append(seconds)
+
+        def on_pool_wait(self, seconds):
+            self.pool_waits.append(seconds)
+
+        def on_clusters(self, new, existing):
+            self.clusters[0] += new
+            self.clusters[1] += existing
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    recorder = Recorder()
+    backend = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="instrumented_lsh_index")
+    index = DedupIndex(backend, instrumentation=recorder)
+    plain = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="plain_lsh_index")
+    )
+
+    metadata.create_all(engine)
+
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    assert index.query(n_grams(" he quic  bnown f x jump  over the  azy dog")) == cluster
+    _ = index.query_many([n_grams("An entirely different sentence!"), n_grams("An entirely different sentence?")])
+
+    assert recorder.clusters == [2, 2]
+    assert len(recorder.pool_waits) == 3
+    assert len(recorder.stages["backend"]) == 3
+
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(2000)]
+    instrumented = [timeit.timeit(lambda: index.query(random.choice(docs)), number=1) for _ in range(2000)]
+    disabled = [timeit.timeit(lambda: plain.query(random.choice(docs)), number=1) for _ in range(2000)]
+
+    _summarize("Per-call latency without instrumentation", disabled)
+    _summarize("Per-call latency with instrumentation", instrumented)
+
+    for stage, seconds in recorder.stages.items():
+        _summarize(f"Stage {stage}", seconds)
+
+    _summarize("Pool wait", recorder.pool_waits)
+
+
+def test_postgres_refuses_mismatched_signature(postgres_server: dict[str, str]) -> None:
+    import pytest
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    index = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="oph_lsh_index"),
+        signature="oph",
+    )
+
+    metadata.create_all(engine)
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+
+    mismatched = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=MetaData(), table_name="oph_lsh_index"),
+    )
+
+    with pytest.raises(ValueError):
+        mismatched.query(n_grams("The quick brown fox jumps over the lazy dog"))
+
+    assert index.query(n_grams(" he quic  bnown f x jump  over the  azy dog")) == cluster
+
+
+def test_postgres_lookup(postgres_server: dict[str, str]) -> None:
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    index = DedupIndex(SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="lookup_lsh_index"))
+
+    metadata.create_all(engine)
+
+    assert index.lookup(n_grams("The quick brown fox jumps over the lazy dog")) == {}
+
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    candidates = index.lookup(n_grams(" he quic  bnown f x jump  over the  azy dog"))
+
+    assert list(candidates) == [cluster]
+    assert 0 < candidates[cluster] < index.num_bands
+    assert index.lookup(n_grams("The quick brown fox jumps over the lazy dog")) == {cluster: index.num_bands}
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT count(*) FROM lookup_lsh_index")).scalar()
+
+    assert rows == index.num_bands
+
+    latencies = [
+        timeit.timeit(lambda: index.lookup(n_grams("The quick brown fox jumps over the lazy dog")), number=1)
+        for _ in range(1000)
+    ]
+    _summarize("Read-only lookup latency", latencies)
+
+
+def test_postgres_cached_backend(postgres_server: dict[str, str]) -> None:
+    from dedup_pg.backend import CachedBackend
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    backend = CachedBackend(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="cached_lsh_index"),
+        max_entries=10_000,
+    )
+    index = DedupIndex(backend)
+
+    metadata.create_all(engine)
+
+    templates = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(50)]
+    latencies = [timeit.timeit(lambda: index.query(random.choice(templates)), number=1) for _ in range(5000)]
+
+    assert backend.stats.misses == 50
+    _summarize(f"Per-call latency over 5000 inserts of 50 hot templates ({backend.stats.hit_rate:.1%} hits)", latencies)
+
+
+def test_postgres_fingerprints(postgres_server: dict[str, str]) -> None:
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    index = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="fp_lsh_index", fingerprints=True),
+        fingerprint_cache=10_000,
+    )
+
+    metadata.create_all(engine)
+
+    text_ = "The quick brown fox jumps over the lazy dog"
+    cluster = index.query(content=text_)
+
+    # A new process has an empty in-memory cache, but finds the persisted fingerprint.
+    restarted = DedupIndex(
+        SQLAlchemyBackend(engine=engine, base_or_metadata=MetaData(), table_name="fp_lsh_index", fingerprints=True),
+    )
+    restarted.bands = None # exact duplicates must not be hashed
+
+    assert restarted.query(content=text_) == cluster
+
+    docs = ["".join(random.choice(string.ascii_letters) for _ in range(2000)) for _ in range(100)]
+    for doc in docs:
+        _ = index.query(content=doc)
+
+    band_path = [timeit.timeit(lambda doc=doc: index.query(n_grams(doc)), number=1) for doc in docs]
+    fast_path = [timeit.timeit(lambda doc=doc: index.query(content=doc), number=1) for doc in docs]
+
+    _summarize("Exact duplicates through the band path", band_path)
+    _summarize("Exact duplicates through the fingerprint cache", fast_path)
+
+
+def test_postgres_signature_verification(postgres_server: dict[str, str]) -> None:
+    import asyncio
+
+    import pytest
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from dedup_pg.backend.sqlalchemy import AsyncSQLAlchemyBackend
+
+    _ = pytest.importorskip("asyncpg")
+    engine = create_engine(_fmt_database_url(postgres_server))
+    async_engine = create_async_engine(
+        _fmt_database_url(postgres_server).replace("postgresql+psycopg2", "postgresql+asyncpg")
+    )
+
+    base = n_grams("the quick brown fox jumps over the lazy dog and keeps running far away")
+    near = n_grams("the quick brown fox jumps over the lazzy dog and keeps running far away")
+    other = n_grams("a quick brown cat sleeps under the warm sun while the dog barks loudly")
+
+    # With one row per band, unrelated sentences share a band, which verification rejects.
+    layout_clusters = {}
+
+    for layout in ("band", "item"):
+        metadata = MetaData()
+        backend = SQLAlchemyBackend(
+            engine=engine, base_or_metadata=metadata, table_name=f"sig_{layout}_lsh_index", signatures=True,
+            layout=layout,
+        )
+        index = DedupIndex(backend, num_perms=32, rows=1, signature_bits=16)
+        metadata.create_all(engine)
+
+        cluster = index.query(base, verify_threshold=0.6)
+        assert (other_cluster := index.query(other, verify_threshold=0.6)) != cluster
+        assert index.query(near, verify_threshold=0.6) == cluster
+        assert index.query(other, verify_threshold=0.6) == other_cluster
+        assert set(backend.query_signatures([cluster, other_cluster])) == {cluster, other_cluster}
+        layout_clusters[layout] = [cluster, other_cluster]
+
+    async_index = DedupIndex(
+        AsyncSQLAlchemyBackend(
+            engine=async_engine, base_or_metadata=MetaData(), table_name="sig_band_lsh_index", signatures=True
+        ),
+        num_perms=32,
+        rows=1,
+        signature_bits=16,
+    )
+
+    async def run():
+        clusters = [await async_index.aquery(doc, verify_threshold=0.6) for doc in (near, other)]
+        await async_engine.dispose()
+        return clusters
+
+    assert asyncio.run(run()) == layout_clusters["band"]
+
+
+def test_postgres_merge(postgres_server: dict[str, str]) -> None:
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from dedup_pg.backend.sqlalchemy import AsyncSQLAlchemyBackend
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    backend = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="merge_lsh_index", merge=True)
+    index = DedupIndex(backend)
+
+    metadata.create_all(engine)
+
+    a, b, c = ([offset + i for i in range(index.num_bands)] for offset in (1000, 2000, 3000))
+    cluster_a, cluster_b, cluster_c = index.index_many([a, b, c])
+    assert len({cluster_a, cluster_b, cluster_c}) == 3
+
+    canonical = index.index(a[:4] + b[4:])
+    assert canonical == min(cluster_a, cluster_b)
+    assert index.index(a) == index.index(b) == canonical
+    assert backend.lookup(a) == {canonical: index.num_bands}
+
+    async_engine = create_async_engine(
+        _fmt_database_url(postgres_server).replace("postgresql+psycopg2", "postgresql+asyncpg")
+    )
+    async_index = DedupIndex(
+        AsyncSQLAlchemyBackend(
+            engine=async_engine, base_or_metadata=MetaData(), table_name="merge_lsh_index", merge=True
+        )
+    )
+
+    async def bridge():
+        cluster = await async_index.aindex(b[:4] + c[4:])
+        await async_engine.dispose()
+        return cluster
+
+    canonical = asyncio.run(bridge())
+    assert canonical == min(cluster_a, cluster_b, cluster_c)
+    assert {backend.resolve(cluster) for cluster in (cluster_a, cluster_b, cluster_c)} == {canonical}
+    assert index.index(a) == index.index(c) == canonical
+
+    assert backend.compact(batch_size=7) > 0
+    with engine.connect() as conn:
+        clusters = conn.execute(text("SELECT DISTINCT cluster_uuid FROM merge_lsh_index")).scalars().all()
+
+    assert clusters == [canonical]
+    assert backend.compact() == 0
+    assert backend.resolve(cluster_c) == canonical
+
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(5000)]
+    latencies = []
+
+    for i in range(0, len(docs), 500):
+        t = timeit.timeit(lambda batch=docs[i:i + 500]: index.query_many(batch), number=1)
+        latencies.append(t / 500)
+
+    _summarize("Amortized per-item latency over 5000 merge-mode inserts in batches of 500", latencies)
+
+
+def test_postgres_concurrent_merge(postgres_server: dict[str, str]) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    engine = create_engine(_fmt_database_url(postgres_server), pool_size=8)
+    metadata = MetaData()
+    backend = SQLAlchemyBackend(
+        engine=engine, base_or_metadata=metadata, table_name="concurrent_merge_lsh_index", merge=True
+    )
+    index = DedupIndex(backend)
+
+    metadata.create_all(engine)
+
+    for round_no in range(5):
+        # A chain of clusters, bridged pairwise by concurrent writers in random order
+        items = [[(round_no * 100 + i) * 1000 + band for band in range(index.num_bands)] for i in range(16)]
+        clusters = index.index_many(items)
+        bridges = [items[i][:4] + items[i + 1][4:] for i in range(len(items) - 1)]
+        random.shuffle(bridges)
+
+        with ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(index.index, bridge) for bridge in bridges]
+            _ = [future.result() for future in futures]
+
+        # Every alias points straight at the canonical cluster, so reads resolve to it without compaction
+        assert {backend.resolve(cluster) for cluster in clusters} == {min(clusters)}
+        assert {backend.query(0, item[0]) for item in items} == {min(clusters)}
+
+    with engine.connect() as conn:
+        chains = conn.execute(text(
+            "SELECT count(*) FROM concurrent_merge_lsh_index_merge m "
+            "JOIN concurrent_merge_lsh_index_merge r ON r.cluster_uuid = m.canonical_uuid"
+        )).scalar_one()
+
+    assert chains == 0
+
+
+def test_postgres_partitioning(postgres_server: dict[str, str]) -> None:
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    backend = SQLAlchemyBackend(
+        engine=engine,
+        base_or_metadata=metadata,
+        table_name="tenant_lsh_index",
+        fingerprints=True,
+        signatures=True,
+        partition_by="tenant",
+    )
+    index = DedupIndex(backend)
+
+    metadata.create_all(engine)
+    backend.attach_tenant("acme")
+    backend.attach_tenant("O'Brien & Co")
+    backend.attach_tenant("acme")
+
+    tokens = n_grams("The same document, uploaded by two tenants")
+    acme = index.query(tokens, tenant="acme")
+    obrien = index.query(tokens, tenant="O'Brien & Co")
+    assert acme != obrien
+    assert index.query(content="Hello", tenant="acme") != index.query(content="Hello", tenant="O'Brien & Co")
+    assert index.query_many([tokens], tenant="acme") == [acme]
+    assert index.lookup(tokens, tenant="O'Brien & Co") == {obrien: index.num_bands}
+    assert backend.tenant("acme").query(0, index.bands(tokens)[0]) == acme
+
+    # Every statement carries the tenant, so the planner prunes it to the tenant's partition.
+    with engine.connect() as conn:
+        plan = "\n".join(conn.execute(
+            text("EXPLAIN " + backend._lookup_stmt.element.text),
+            backend.tenant("acme")._lookup_params(index.bands(tokens)),
+        ).scalars())
+
+    assert backend._partition_name("acme") in plan
+    assert backend._partition_name("O'Brien & Co") not in plan
+
+    backend.detach_tenant("acme", drop=False)
+    backend.attach_tenant("acme")
+    assert index.query(tokens, tenant="acme") == acme
+
+    # Dropping a tenant drops the partitions of its fingerprints and signatures too, rather than deleting rows
+    fingerprint, _ = index._cached_fingerprint("Hello", "acme")
+    other_fingerprint, _ = index._cached_fingerprint("Hello", "O'Brien & Co")
+    assert backend.tenant("acme").query_fingerprint(fingerprint) is not None
+    assert not any("DELETE" in str(stmt) for stmt in backend._detach_stmts("acme", [(True, True)] * 3, drop=True))
+
+    backend.detach_tenant("acme")
+    backend.attach_tenant("acme")
+    assert index.lookup(tokens, tenant="acme") == {}
+    assert backend.tenant("acme").query_fingerprint(fingerprint) is None
+    assert index.query(content="Hello", tenant="acme") != acme
+    assert backend.tenant("O'Brien & Co").query_fingerprint(other_fingerprint) is not None
+
+    try:
+        index.query(tokens)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A backend partitioned by tenant must refuse calls without a tenant")
+
+    hash_metadata = MetaData()
+    hash_backend = SQLAlchemyBackend(
+        engine=engine,
+        base_or_metadata=hash_metadata,
+        table_name="band_lsh_index",
+        partition_by="band_idx",
+        band_partitions=4,
+    )
+    hash_index = DedupIndex(hash_backend)
+    hash_metadata.create_all(engine)
+
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(500)]
+    clusters = hash_index.query_many(docs)
+    assert hash_index.query_many(docs) == clusters
+
+    with engine.connect() as conn:
+        partitions = conn.execute(text(
+            "SELECT count(*) FROM pg_inherits WHERE inhparent = 'band_lsh_index'::regclass"
+        )).scalar_one()
+
+    assert partitions == 4
+
+
+def test_postgres_item_layout(postgres_server: dict[str, str]) -> None:
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    backend = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="item_lsh_index", layout="item")
+    index = DedupIndex(backend)
+
+    metadata.create_all(engine)
+    assert list(readme_func(backend).values()) == [["key1", "key2"], ["key3"]]
+
+    a, b = n_grams("Hello, world! This is the same text."), n_grams("Something else entirely, for good measure.")
+    cluster_a, cluster_b, cluster_a2 = index.query_many([a, b, a])
+    assert cluster_a == cluster_a2 != cluster_b
+    assert index.query(a) == cluster_a
+    assert index.lookup(a) == {cluster_a: index.num_bands}
+    assert backend.query(0, index.bands(a)[0]) == cluster_a
+    assert backend.query(1, index.bands(a)[0]) is None
+
+    # Exact duplicates do not add members.
+    with engine.connect() as conn:
+        members = conn.execute(text("SELECT count(*) FROM item_lsh_index WHERE cluster_uuid = :c"), {"c": cluster_a})
+        assert members.scalar_one() == 1
+
+
+def test_postgres_layout_benchmark(postgres_server: dict[str, str]) -> None:
+    """
+    Compares the band and item layouts by table and index size, insert latency and lookup latency. Both tables are
+    filled server-side with `DEDUP_LAYOUT_ITEMS` random items, which defaults to 100,000 and takes a comma-separated
+    list such as `1000000,10000000` for larger runs.
+    """
+    import os
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    sizes = [int(size) for size in os.environ.get("DEDUP_LAYOUT_ITEMS", "100000").split(",")]
+
+    for items in sizes:
+        for layout in ("band", "item"):
+            metadata = MetaData()
+            name = f"{layout}_bench_lsh_index"
+            backend = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name=name, layout=layout)
+            index = DedupIndex(backend)
+            metadata.drop_all(engine)
+            metadata.create_all(engine)
+
+            with engine.begin() as conn:
+                _ = conn.execute(text("SET LOCAL synchronous_commit = OFF"))
+
+                if layout == "band":
+                    _ = conn.execute(text(f"""
+                        INSERT INTO {name} (band_idx, band_hash, cluster_uuid)
+                        SELECT b, (random() * 9.2e18)::bigint - (g - g), gen_random_uuid()
+                        FROM generate_series(1, :items) g, generate_series(0, :bands - 1) b
+                        ON CONFLICT DO NOTHING
+                    """), {"items": items, "bands": index.num_bands})
+                else:
+                    _ = conn.execute(text(f"""
+                        INSERT INTO {name} (cluster_uuid, bands)
+                        SELECT gen_random_uuid(), ARRAY(
+                            SELECT ((random() * 7.2e16)::bigint - (g - g)) | (b::bigint << 56)
+                            FROM generate_series(0, :bands - 1) b
+                        )
+                        FROM generate_series(1, :items) g
+                    """), {"items": items, "bands": index.num_bands})
+
+                _ = conn.execute(text(f"ANALYZE {name}"))
+                table_bytes, index_bytes = conn.execute(text(
+                    "SELECT pg_table_size(CAST(:name AS regclass)), pg_indexes_size(CAST(:name AS regclass))"
+                ), {"name": name}).one()
+
+            docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(500)]
+            inserts = [timeit.timeit(lambda doc=doc: index.query(doc), number=1) for doc in docs]
+            lookups = [timeit.timeit(lambda doc=doc: index.lookup(doc), number=1) for doc in docs]
+
+            print(f"\n{layout} layout, {items} items: table {table_bytes / 2**20:.1f} MiB, "
+                  f"indexes {index_bytes / 2**20:.1f} MiB")
+            _summarize(f"{layout} layout insert latency at {items} items", inserts)
+            _summarize(f"{layout} layout lookup latency at {items} items", lookups)
+
+            metadata.drop_all(engine)
+
+
+def test_postgres_contention_benchmark(postgres_server: dict[str, str]) -> None:
+    """
+    Measures the throughput of concurrent writers, and how often they split near-duplicates across clusters, with
+    and without `consistent`. Writers share a queue of near-duplicate families whose members arrive one after the
+    other, so that they race each other, and a family is split when its members were assigned more than one
+    cluster. Bands are computed ahead of time, so that only backend writes are timed. `DEDUP_CONTENTION_WRITERS`
+    defaults to `1,2,4,8,16,32,64`, and `DEDUP_CONTENTION_FAMILIES` to 500.
+    """
+    import os
+    from collections import defaultdict
+    from concurrent.futures import ThreadPoolExecutor
+
+    writer_counts = [int(n) for n in os.environ.get("DEDUP_CONTENTION_WRITERS", "1,2,4,8,16,32,64").split(",")]
+    families = int(os.environ.get("DEDUP_CONTENTION_FAMILIES", "500"))
+    engine = create_engine(_fmt_database_url(postgres_server), pool_size=max(writer_counts), max_overflow=0)
+
+    for consistent in (False, True):
+        for writers in writer_counts:
+            metadata = MetaData()
+            index = DedupIndex(SQLAlchemyBackend(
+                engine=engine, base_or_metadata=metadata, table_name="contention_lsh_index", consistent=consistent
+            ))
+            metadata.drop_all(engine)
+            metadata.create_all(engine)
+
+            bases = ["".join(random.choice(string.ascii_letters) for _ in range(200)) for _ in range(families)]
+            items = [
+                (family, index.bands(n_grams(base + suffix))) for family, base in enumerate(bases) for suffix in "wxyz"
+            ]
+
+            start = timeit.default_timer()
+
+            with ThreadPoolExecutor(writers) as pool:
+                clusters = list(pool.map(lambda item: index.index(item[1]), items))
+
+            elapsed = timeit.default_timer() - start
+            family_clusters = defaultdict(set)
+
+            for (family, _), cluster in zip(items, clusters):
+                family_clusters[family].add(cluster)
+
+            split = sum(len(assigned) > 1 for assigned in family_clusters.values()) / families
+            print(f"{consistent=}, {writers} writers: {len(items) / elapsed:.0f} inserts/s, {split:.2%} split families")
+
+            if consistent:
+                assert split == 0
+
+    metadata.drop_all(engine)
+
+
+def test_postgres_sqlite_benchmark(postgres_server: dict[str, str], tmp_path) -> None:
+    """
+    Compares `LocalBackend`, `SQLiteBackend` and `SQLAlchemyBackend` on the same items, inserted one by one, in a
+    single transaction where the backend supports it, and in one batch, then looked up.
+    """
+    from dedup_pg.backend import LocalBackend, SQLiteBackend
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(2000)]
+    band_matrix = DedupIndex().bands_many(docs)
+    band_rows = band_matrix.tolist()
+
+    def sqlalchemy_backend(name):
+        metadata = MetaData()
+        backend = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name=f"{name}_lsh_index")
+        _ = DedupIndex(backend)
+        metadata.drop_all(engine)
+        metadata.create_all(engine)
+        return backend
+
+    backends = {
+        "LocalBackend": lambda name: LocalBackend(),
+        "SQLiteBackend": lambda name: SQLiteBackend(tmp_path / f"{name}.sqlite"),
+        "SQLAlchemyBackend": sqlalchemy_backend,
+    }
+
+    print()
+    for name, make in backends.items():
+        backend = make(f"{name.lower()}_each")
+        _ = DedupIndex(backend)
+        inserts = [timeit.timeit(lambda bands=bands: backend.insert(bands), number=1) for bands in band_rows]
+        lookups = [timeit.timeit(lambda bands=bands: backend.lookup(bands), number=1) for bands in band_rows]
+
+        backend = make(f"{name.lower()}_many")
+        _ = DedupIndex(backend)
+        many = timeit.timeit(lambda: backend.insert_many(band_matrix), number=1)
+
+        _summarize(f"{name} insert latency", inserts)
+        _summarize(f"{name} lookup latency", lookups)
+        print(f"{name} insert_many: {len(band_rows) / many:.0f} items/s")
+
+        if isinstance(backend, SQLiteBackend):
+            backend = make("sqlite_batch")
+            _ = DedupIndex(backend)
+
+            with backend.batch():
+                batched = timeit.timeit(lambda: [backend.insert(bands) for bands in band_rows], number=1)
+
+            print(f"{name} insert in one batch: {len(band_rows) / batched:.0f} items/s")
+
+
+def test_postgres_sharded_backend(postgres_server: dict[str, str]) -> None:
+    """
+    Spreads the index over two `SQLAlchemyBackend` tables, standing in for two Postgres primaries, and compares
+    batched insert throughput with a single table.
+    """
+    from dedup_pg.backend import ShardedBackend
+
+    engine = create_engine(_fmt_database_url(postgres_server))
+    metadata = MetaData()
+    shards = [
+        SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name=f"shard_{shard}_lsh_index")
+        for shard in range(2)
+    ]
+    backend = ShardedBackend(shards)
+    index = DedupIndex(backend)
+    single = SQLAlchemyBackend(engine=engine, base_or_metadata=metadata, table_name="unsharded_lsh_index")
+    _ = DedupIndex(single)
+
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    result = list(readme_func(backend).values())
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    # Every shard holds half of the bands of an item, under the same cluster
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    bands = index.bands(n_grams("The quick brown fox jumps over the lazy dog"))
+    assert [shard.lookup(bands[position::2]) for position, shard in enumerate(shards)] == [{cluster: 16}] * 2
+
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(500)]
+    band_matrix = DedupIndex().bands_many(docs)
+    seconds = timeit.timeit(lambda: backend.insert_many(band_matrix), number=1)
+    single_seconds = timeit.timeit(lambda: single.insert_many(band_matrix), number=1)
+
+    assert [len(backend.lookup(bands)) for bands in band_matrix[:20].tolist()] == [1] * 20
+    assert shards[0].lookup_many(band_matrix[:20, ::2]) == [shards[0].lookup(bands) for bands in band_matrix[:20, ::2]]
+    print(f"\nShardedBackend over 2 tables: {len(docs) / seconds:.0f} items/s")
+    print(f"SQLAlchemyBackend: {len(docs) / single_seconds:.0f} items/s")
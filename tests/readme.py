@@ -5,7 +5,7 @@ from dedup_pg.backend import Backend
 from dedup_pg.helpers import n_grams
 
 
-def readme_func(backend: Backend | None = None) -> dict[str, list[str]]:
+def readme_func(backend: Backend | None = None, **kwargs) -> dict[str, list[str]]:
     # A corpus of named items we want to deduplicate
     corpus = [
         ("key1", "The quick brown fox jumps over the lazy dog"),
@@ -14,7 +14,7 @@ def readme_func(backend: Backend | None = None) -> dict[str, list[str]]:
     ]
 
     # Our deduplication index - this can be Postgres-backed with configuration
-    lsh = DedupIndex(backend)
+    lsh = DedupIndex(backend, **kwargs)
 
     # Using n=3 character n-grams is a strong choice for deduplicating textual chunks
     n_gram_corpus = [(key, n_grams(text, n=3)) for key, text in corpus]
@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+import pytest
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import LocalBackend, ShardedBackend
+from dedup_pg.helpers import n_grams
+from tests.readme import readme_func
+
+
+def test_sharded_backend():
+    result = list(readme_func(ShardedBackend([LocalBackend() for _ in range(3)])).values())
+
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    shards = [LocalBackend() for _ in range(3)]
+    backend = ShardedBackend(shards)
+    _ = DedupIndex(backend, num_perms=32, rows=4)
+
+    # Every shard holds its own bands, under the cluster of the whole item
+    first = backend.insert(list(range(8)))
+    assert {len(shard._index) for shard in shards} == {2, 3}
+    assert backend.lookup(list(range(8))) == {first: 8}
+    assert backend.query(5, 5) == shards[2].query(1, 5) == first
+
+    # An item matching a single band of one shard takes its cluster on every shard
+    bridging = [100, 101, 102, 103, 104, 105, 106, 7]
+    assert backend.insert(bridging) == first
+    assert backend.lookup(bridging) == {first: 8}
+
+    # An item takes the cluster sharing the most bands with it
+    second = backend.insert(list(range(200, 208)))
+    assert backend.insert([0, 201, 202, 203, 204, 205, 206, 999]) == second
+
+    # Items sharing bands within a batch share a cluster, whichever shards their bands are on
+    rng = np.random.default_rng(0)
+    band_matrix = rng.integers(1000, 1200, size=(100, 8))
+    clusters = backend.insert_many(band_matrix)
+
+    for column in band_matrix.T:
+        for band in np.unique(column):
+            assert len({clusters[doc] for doc in np.flatnonzero(column == band)}) == 1
+
+    for bands, cluster in zip(band_matrix.tolist(), clusters):
+        assert cluster in backend.lookup(bands)
+
+    # Shards record their position, so that they refuse to be used for other bands
+    with pytest.raises(ValueError):
+        _ = DedupIndex(ShardedBackend(shards[::-1]), num_perms=32, rows=4)
+
+    with pytest.raises(ValueError):
+        _ = DedupIndex(ShardedBackend([LocalBackend() for _ in range(9)]), num_perms=32, rows=4)
+
+
+def test_sharded_backend_signatures():
+    backend = ShardedBackend([LocalBackend() for _ in range(4)])
+    index = DedupIndex(backend, signature_bits=16)
+
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    assert index.query(n_grams("The quick brown fox jumps over the lazy dog!"), verify_threshold=0.5) == cluster
+    assert backend.query_signatures([cluster]).keys() == {cluster}
+    assert sum(len(shard._signatures) for shard in backend.shards) == 1
+
+
+def test_sharded_backend_tenants():
+    backend = ShardedBackend([LocalBackend() for _ in range(3)])
+    index = DedupIndex(backend, num_perms=32, rows=4)
+    threads = threading.active_count()
+
+    # Tenant views probe shards in the pool of their backend, rather than in one pool each
+    clusters = [index.index(list(range(8)), tenant=f"tenant {i}") for i in range(20)]
+    assert len(set(clusters)) == 20
+    assert all(backend.tenant(f"tenant {i}")._executor is backend._executor for i in range(20))
+    assert threading.active_count() <= threads + len(backend.shards)
+
+    backend.close()
+    assert backend._executor._shutdown
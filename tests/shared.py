@@ -0,0 +1,113 @@
+import multiprocessing
+import random
+import string
+import time
+
+import numpy as np
+import pytest
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import LocalBackend, SharedMemoryBackend
+from dedup_pg.helpers import n_grams
+from tests.readme import readme_func
+
+
+def _worker(name: str, docs: list[str], queue) -> None:
+    # Attaches to the segment by name, queries the items of the parent, and indexes its own
+    backend = SharedMemoryBackend(name)
+    index = DedupIndex(backend)
+    queue.put((index.query_many([n_grams(doc) for doc in docs]), index.query(n_grams(f"worker {name} item"))))
+    backend.close()
+
+
+def test_shared_memory_backend():
+    backend = SharedMemoryBackend()
+
+    try:
+        result = list(readme_func(backend).values())
+        assert "key1" in result[0] and "key2" in result[0]
+        assert "key3" in result[1]
+    finally:
+        backend.unlink()
+
+    shared = SharedMemoryBackend(capacity=4096, stripes=3)
+    _ = DedupIndex(shared, num_perms=32, rows=4)
+
+    try:
+        bands = list(range(8))
+        cluster = shared.insert(bands)
+
+        # Other backends attach to the segment by name, and refuse an index built with other parameters
+        attached = SharedMemoryBackend(shared.name)
+        _ = DedupIndex(attached, num_perms=32, rows=4)
+        assert attached.query(0, bands[0]) == cluster
+        assert len(attached) == len(shared) == 1
+
+        # Backends of one process share the lock file, which stays open until the last of them is closed
+        assert attached._lock_file is shared._lock_file
+        attached.close()
+        assert shared.insert([0, 100, 101, 102, 103, 104, 105, 106]) == cluster
+
+        mismatched = SharedMemoryBackend(shared.name)
+
+        try:
+            with pytest.raises(ValueError):
+                _ = DedupIndex(mismatched, num_perms=32, rows=8)
+        finally:
+            mismatched.close()
+
+        # The capacity is fixed
+        with pytest.raises(RuntimeError):
+            _ = shared.insert_many(np.random.default_rng(0).integers(0, 1 << 62, size=(4096, 8)))
+    finally:
+        shared.unlink()
+
+
+def test_shared_memory_backend_processes():
+    backend = SharedMemoryBackend()
+    index = DedupIndex(backend)
+    docs = ["".join(random.choice(string.ascii_letters) for _ in range(30)) for _ in range(20)]
+    clusters = index.query_many([n_grams(doc) for doc in docs])
+
+    try:
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_worker, args=(backend.name, docs, queue))
+        process.start()
+        worker_clusters, worker_cluster = queue.get(timeout=60)
+        process.join()
+
+        assert worker_clusters == clusters
+        assert index.query(n_grams(f"worker {backend.name} item")) == worker_cluster
+    finally:
+        backend.unlink()
+
+
+def test_shared_memory_backend_benchmark():
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(5000)]
+    band_matrix = DedupIndex().bands_many(docs)
+    band_rows = band_matrix.tolist()
+    shared = SharedMemoryBackend(capacity=16384)
+    shared_many = SharedMemoryBackend(capacity=16384)
+
+    runs = (
+        ("LocalBackend.insert", LocalBackend(), lambda backend: [backend.insert(bands) for bands in band_rows]),
+        ("SharedMemoryBackend.insert", shared, lambda backend: [backend.insert(bands) for bands in band_rows]),
+        ("SharedMemoryBackend.query", shared, lambda backend: [backend.query(0, bands[0]) for bands in band_rows]),
+        ("SharedMemoryBackend.insert_many", shared_many, lambda backend: backend.insert_many(band_matrix)),
+    )
+
+    print()
+    try:
+        for name, backend, run in runs:
+            _ = DedupIndex(backend)
+
+            start = time.perf_counter()
+            _ = run(backend)
+            seconds = time.perf_counter() - start
+
+            print(f"{name}: {len(band_rows) / seconds:.0f} items/s")
+    finally:
+        for _, backend, _ in runs:
+            if isinstance(backend, SharedMemoryBackend) and backend._shm is not None:
+                backend.unlink()
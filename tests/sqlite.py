@@ -0,0 +1,85 @@
+import random
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dedup_pg import DedupIndex
+from dedup_pg.backend import LocalBackend, SQLiteBackend
+from dedup_pg.helpers import n_grams
+from tests.readme import readme_func
+
+
+def test_sqlite_backend(tmp_path):
+    result = list(readme_func(SQLiteBackend()).values())
+
+    assert "key1" in result[0] and "key2" in result[0]
+    assert "key3" in result[1]
+
+    # The index survives a restart, and refuses an index built with other parameters
+    path = tmp_path / "index.sqlite"
+    index = DedupIndex(SQLiteBackend(path))
+    cluster = index.query(n_grams("The quick brown fox jumps over the lazy dog"))
+    index._backend.close()
+
+    backend = SQLiteBackend(path)
+    assert DedupIndex(backend).query(n_grams(" he quic  bnown f x jump  over the  azy dog")) == cluster
+
+    with pytest.raises(ValueError):
+        _ = DedupIndex(backend, rows=8)
+
+    # A failed batch leaves nothing behind
+    with pytest.raises(RuntimeError), backend.batch():
+        _ = backend.insert([1, 2, 3])
+        raise RuntimeError
+
+    assert backend.query(0, 1) is None
+
+
+def test_sqlite_backend_threads():
+    backend = SQLiteBackend()
+    index = DedupIndex(backend)
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(30))) for _ in range(50)]
+    clusters = index.query_many(docs)
+
+    def worker():
+        return [index.query(doc) for doc in docs]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(worker) for _ in range(4)]
+
+    for future in futures:
+        assert future.result() == clusters
+
+
+def test_sqlite_backend_benchmark(tmp_path):
+    docs = [n_grams("".join(random.choice(string.ascii_letters) for _ in range(15))) for _ in range(5000)]
+    band_matrix = DedupIndex().bands_many(docs)
+    band_rows = band_matrix.tolist()
+
+    def insert_each(backend):
+        for bands in band_rows:
+            _ = backend.insert(bands)
+
+    def insert_batched(backend):
+        with backend.batch():
+            insert_each(backend)
+
+    runs = (
+        ("LocalBackend.insert", LocalBackend, insert_each),
+        ("SQLiteBackend.insert, one commit each", SQLiteBackend, insert_each),
+        ("SQLiteBackend.insert in one batch", SQLiteBackend, insert_batched),
+        ("SQLiteBackend.insert_many", SQLiteBackend, lambda backend: backend.insert_many(band_matrix)),
+    )
+
+    print()
+    for i, (name, cls, run) in enumerate(runs):
+        backend = cls() if cls is LocalBackend else cls(tmp_path / f"bench_{i}.sqlite")
+        _ = DedupIndex(backend)
+
+        start = time.perf_counter()
+        run(backend)
+        seconds = time.perf_counter() - start
+
+        print(f"{name}: {len(band_rows) / seconds:.0f} items/s")
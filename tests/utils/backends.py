@@ -0,0 +1,10 @@
+from collections.abc import Iterable
+from uuid import UUID
+
+
+def partition(uuids: Iterable[UUID | None]) -> list[int]:
+    """
+    Relabels clusters by first appearance, so that backends can be compared regardless of their UUIDs
+    """
+    seen: dict = {}
+    return [seen.setdefault(uuid, len(seen)) for uuid in uuids]